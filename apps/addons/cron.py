@@ -1,6 +1,7 @@
 import array
 import itertools
 import logging
+import multiprocessing
 import operator
 import os
 import subprocess
@@ -22,8 +23,10 @@ import waffle
 import amo
 from amo.utils import chunked
 from addons import search
-from addons.models import Addon, FrozenAddon, AppSupport
+from addons.models import (Addon, AddonRecommendation, AppSupport,
+                           FrozenAddon)
 from files.models import File
+from lib.es.pipeline import reindex
 from lib.es.utils import raise_if_reindex_in_progress
 from stats.models import UpdateCount
 
@@ -108,33 +111,28 @@ def update_addon_average_daily_users():
     cursor.close()
 
     ts = [_update_addon_average_daily_users.subtask(args=[chunk])
-          for chunk in chunked(d, 250)]
+          for chunk in chunked(d, 1000)]
     group(ts).apply_async()
 
 
 @task
 def _update_addon_average_daily_users(data, **kw):
     task_log.info("[%s] Updating add-ons ADU totals." % (len(data)))
+    start = time.time()
 
-    for pk, count in data:
-        try:
-            addon = Addon.objects.get(pk=pk)
-        except Addon.DoesNotExist:
-            # The processing input comes from metrics which might be out of
-            # date in regards to currently existing add-ons
-            m = "Got an ADU update (%s) but the add-on doesn't exist (%s)"
-            task_log.debug(m % (count, pk))
-            continue
-
+    counts = dict(data)
+    addons = _get_addons(counts)
+    adus = {}
+    for addon in addons:
+        count = counts[addon.id]
         if (count - addon.total_downloads) > 10000:
             # Adjust ADU to equal total downloads so bundled add-ons don't
             # skew the results when sorting by users.
             task_log.info('Readjusted ADU count for addon %s' % addon.slug)
-            addon.update(average_daily_users=addon.total_downloads)
-        else:
-            #task_log.debug('Updating "%s" :: ADU %s -> %s' %
-            #               (addon.slug, addon.average_daily_users, count))
-            addon.update(average_daily_users=count)
+            count = addon.total_downloads
+        adus[addon.id] = count
+
+    _denormalize(addons, {'average_daily_users': adus}, start)
 
 
 @cronjobs.register
@@ -154,7 +152,7 @@ def update_addon_download_totals():
     cursor.close()
 
     ts = [_update_addon_download_totals.subtask(args=[chunk])
-          for chunk in chunked(d, 250)]
+          for chunk in chunked(d, 1000)]
     group(ts).apply_async()
 
 
@@ -162,17 +160,47 @@ def update_addon_download_totals():
 def _update_addon_download_totals(data, **kw):
     task_log.info("[%s] Updating add-ons download+average totals." %
                    (len(data)))
+    start = time.time()
 
+    addons = _get_addons(dict((pk, (avg, sum)) for pk, avg, sum in data))
+    ids = set(addon.id for addon in addons)
+    averages, totals = {}, {}
     for pk, avg, sum in data:
-        try:
-            Addon.objects.get(pk=pk).update(average_daily_downloads=avg,
-                                            total_downloads=sum)
-        except Addon.DoesNotExist:
-            # The processing input comes from metrics which might be out of
-            # date in regards to currently existing add-ons
-            m = ("Got new download totals (total=%s,avg=%s) but the add-on"
-                 "doesn't exist (%s)" % (sum, avg, pk))
-            task_log.debug(m)
+        if pk in ids:
+            averages[pk], totals[pk] = avg, sum
+
+    _denormalize(addons, {'average_daily_downloads': averages,
+                          'total_downloads': totals}, start)
+
+
+def _get_addons(data):
+    """Returns the add-ons of the ids in `data`, uncached."""
+    addons = list(Addon.objects.no_cache().filter(id__in=data)
+                  .no_transforms())
+    # The processing input comes from metrics which might be out of
+    # date in regards to currently existing add-ons
+    for pk in set(data) - set(addon.id for addon in addons):
+        task_log.debug("Got an update (%s) but the add-on doesn't exist (%s)"
+                       % (data[pk], pk))
+    return addons
+
+
+def _denormalize(addons, columns, start):
+    """
+    Writes `columns` (see `amo.models.bulk_update`) of `addons` with a
+    single UPDATE, then invalidates and reindexes them all at once.
+    """
+    from .tasks import index_addons
+    if not addons:
+        return
+    amo.models.bulk_update(Addon, columns)
+    Addon.objects.invalidate(*addons)
+    index_addons.delay([addon.id for addon in addons])
+
+    took = time.time() - start
+    task_log.info('[%s] Updated %s in %.2fs (%d rows/s).' % (
+        len(addons), ', '.join(sorted(columns)), took,
+        len(addons) / (took or 1)))
 
 
 def _change_last_updated(next):
@@ -336,24 +364,38 @@ def deliver_hotness():
         time.sleep(10)
 
 
+# The add-on similarities for the recs pool workers, set before forking.
+_similarities = None
+
+
+def _top_recs(ids):
+    sims = {}
+    for addon in ids:
+        # The add-on is its own best match, keep the 10 after it.
+        sims[addon] = [(k, v) for k, v in _similarities.top(addon, 11)
+                       if k != addon]
+    return sims
+
+
 @cronjobs.register
-def recs():
+def recs(processes=None):
+    global _similarities
     start = time.time()
-    cursor = connections[multidb.get_slave()].cursor()
-    cursor.execute("""
-        SELECT addon_id, collection_id
-        FROM synced_addons_collections ac
-        INNER JOIN addons ON
-            (ac.addon_id=addons.id AND inactive=0 AND status=4
-             AND addontype_id <> 9 AND current_version IS NOT NULL)
-        ORDER BY addon_id, collection_id
-    """)
-    qs = cursor.fetchall()
+    qs = _recs_rows()
     recs_log.info('%.2fs (query) : %s rows' % (time.time() - start, len(qs)))
     addons = _group_addons(qs)
     recs_log.info('%.2fs (groupby) : %s addons' %
                   ((time.time() - start), len(addons)))
 
+    # Every add-on is indexed, the smaller ones can grow past
+    # MIN_COLLECTIONS with the rows added later.
+    index = recommend.MinHashIndex(
+        checkpoint=max(r for a, c, r in qs) if qs else 0)
+    for addon, cs in _group_addons(qs, min_size=1).iteritems():
+        index.add(addon, cs)
+    index.save(settings.RECS_INDEX_PATH)
+    recs_log.info('%.2fs (minhash index)' % (time.time() - start))
+
     if not len(addons):
         return
 
@@ -365,10 +407,11 @@ def recs():
     except Exception:
         log.error('Could not call ps', exc_info=True)
 
-    sim = recommend.similarity  # Locals are faster.
-    sims, start, timers = {}, [time.time()], {'calc': [], 'sql': []}
+    _similarities = recommend.Similarities(addons)
+    recs_log.info('%.2fs (index)' % (time.time() - start))
+    start, timers = [time.time()], {'calc': [], 'sql': []}
 
-    def write_recs():
+    def write_recs(sims):
         calc = time.time()
         timers['calc'].append(calc - start[0])
         try:
@@ -376,21 +419,23 @@ def recs():
         except Exception:
             recs_log.error('Error dumping recommendations. SQL issue.',
                            exc_info=True)
-        sims.clear()
         timers['sql'].append(time.time() - calc)
         start[0] = time.time()
 
-    for idx, (addon, collections) in enumerate(addons.iteritems(), 1):
-        xs = [(other, sim(collections, cs))
-              for other, cs in addons.iteritems()]
-        # Sort by similarity and keep the top N.
-        others = sorted(xs, key=operator.itemgetter(1), reverse=True)
-        sims[addon] = [(k, v) for k, v in others[:11] if k != addon]
-
-        if idx % 50 == 0:
-            write_recs()
+    chunks = chunked(addons.keys(), 500)
+    processes = int(processes or multiprocessing.cpu_count())
+    if processes > 1:
+        # The workers are forked after _similarities is set so they share it.
+        pool = multiprocessing.Pool(processes)
+        try:
+            for sims in pool.imap_unordered(_top_recs, chunks):
+                write_recs(sims)
+        finally:
+            pool.terminate()
     else:
-        write_recs()
+        for chunk in chunks:
+            write_recs(_top_recs(chunk))
+    _similarities = None
 
     avg_len = sum(len(v) for v in addons.itervalues()) / float(len(addons))
     recs_log.info('%s addons: average length: %.2f' % (len(addons), avg_len))
@@ -398,6 +443,52 @@ def recs():
     recs_log.info('SQL time: %.2fs' % sum(timers['sql']))
 
 
+@cronjobs.register
+def update_recs_index():
+    """
+    Adds the add-ons put in synced collections since the recommendations
+    index was saved to it, so recommendations can be asked for about new
+    add-ons before the next `recs`. The index keeps the last
+    synced_addons_collections row id it has seen.
+    """
+    path = settings.RECS_INDEX_PATH
+    if not os.path.exists(path):
+        return
+    modified = os.path.getmtime(path)
+    index = recommend.MinHashIndex.load(path)
+    qs = _recs_rows(since=index.checkpoint)
+    if not qs:
+        return
+    addons = _group_addons(qs, min_size=1)
+    for addon, cs in addons.iteritems():
+        index.add(addon, cs)
+    index.checkpoint = max(r for a, c, r in qs)
+    # `recs` rebuilt the index in the meantime, with these collections.
+    if os.path.getmtime(path) != modified:
+        return
+    index.save(path)
+    recs_log.info('Added %s rows of %s addons to the recs index.' %
+                  (len(qs), len(addons)))
+
+
+def _recs_rows(since=0):
+    """
+    The (addon, collection, row id) of the synced_addons_collections rows
+    with ids after `since`.
+    """
+    cursor = connections[multidb.get_slave()].cursor()
+    cursor.execute("""
+        SELECT addon_id, collection_id, ac.id
+        FROM synced_addons_collections ac
+        INNER JOIN addons ON
+            (ac.addon_id=addons.id AND inactive=0 AND status=4
+             AND addontype_id <> 9 AND current_version IS NOT NULL)
+        WHERE ac.id > %s
+        ORDER BY addon_id, collection_id
+    """, [since])
+    return cursor.fetchall()
+
+
 def _dump_recs(sims):
     # Dump a dictionary of {addon: (other_addon, score)} into the
     # addon_recommendations table.
@@ -414,16 +505,16 @@ def _dump_recs(sims):
     cursor.execute('COMMIT')
 
 
-def _group_addons(qs):
-    # qs is a list of (addon_id, collection_id) order by addon_id.
+def _group_addons(qs, min_size=AddonRecommendation.MIN_COLLECTIONS):
+    # qs is a list of (addon_id, collection_id, ...) order by addon_id.
     # Return a dict of {addon_id: [collection_id]}.
     addons = {}
     for addon, collections in itertools.groupby(qs, operator.itemgetter(0)):
-        # Skip addons in < 3 collections since we'll be overfitting
+        # Skip addons in < min_size collections since we'll be overfitting
         # recommendations to exactly what's in those collections.
         cs = [c[1] for c in collections]
-        if len(cs) > 3:
-            # array.array() lets us calculate similarities much faster.
+        if len(cs) >= min_size:
+            # array.array() keeps the collection lists compact.
             addons[addon] = array.array('l', cs)
     # Don't generate recs for frozen add-ons.
     for addon in FrozenAddon.objects.values_list('addon', flat=True):
@@ -445,22 +536,20 @@ def give_personas_versions():
 
 @cronjobs.register
 def reindex_addons(index=None, aliased=True, addon_type=None):
-    reindex_addons_task(index, aliased, addon_type)()
+    """Streams every add-on into the index, see lib.es.pipeline."""
+    search.setup_mapping(index, aliased)
+    reindex(_indexable_addons(addon_type), search.extract_ids,
+            index or Addon._get_index(), Addon._meta.db_table)
 
 
-def reindex_addons_task(index=None, aliased=True, addon_type=None):
-    from . import tasks
-    # Make sure our mapping is up to date.
-    search.setup_mapping(index, aliased)
+def _indexable_addons(addon_type=None):
     ids = (Addon.objects.values_list('id', flat=True)
            .filter(_current_version__isnull=False,
                    status__in=amo.VALID_STATUSES,
                    disabled_by_user=False))
     if addon_type:
         ids = ids.filter(type=addon_type)
-    p = group([tasks.index_addons.si(chunk, index=index)
-                  for chunk in chunked(sorted(list(ids)), 150)])
-    return p
+    return ids
 
 
 @cronjobs.register
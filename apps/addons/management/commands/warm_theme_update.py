@@ -0,0 +1,47 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+import amo
+from addons.models import Persona
+
+
+class Command(BaseCommand):
+    help = ('Pre-renders the theme update JSON of the most popular themes so '
+            'the update pings are served from the cache.')
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', action='store', type='int', dest='limit',
+                    default=10000, help='Number of themes to warm.'),
+        make_option('--locales', action='store', dest='locales',
+                    default='en-US',
+                    help='Comma separated locales to warm.'),
+    )
+
+    def handle(self, *args, **options):
+        from services.theme_update import ThemeUpdate
+
+        locales = options['locales'].split(',')
+        personas = (Persona.objects.no_cache()
+                    .filter(addon__status=amo.STATUS_PUBLIC,
+                            addon__disabled_by_user=False)
+                    .order_by('-addon__average_daily_users')
+                    .values_list('addon_id', 'persona_id')
+                    [:options['limit']])
+
+        count = 0
+        for addon_id, persona_id in personas:
+            lookups = [(addon_id, None)]
+            # Themes installed from getpersonas.com ping with their old id.
+            if persona_id:
+                lookups.append((persona_id, 'src=gp'))
+            for locale in locales:
+                for id_, qs in lookups:
+                    update = ThemeUpdate(locale, id_, qs)
+                    try:
+                        update.get_json()
+                    finally:
+                        update.cursor.close()
+                        update.conn.close()
+                    count += 1
+
+        print 'Warmed %s theme updates.' % count
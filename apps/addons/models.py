@@ -25,7 +25,7 @@ import waffle
 from jinja2.filters import do_dictsort
 from tower import ugettext_lazy as _
 
-from addons.utils import get_creatured_ids, get_featured_ids
+from addons.utils import get_creatured_ids, get_featured_ids, get_recs_index
 
 import amo
 import amo.models
@@ -39,6 +39,7 @@ from amo.utils import (attach_trans_dict, cache_ns_key, chunked, find_language,
                        to_language, urlparams)
 from amo.urlresolvers import get_outgoing_url, reverse
 from files.models import File
+from lib.es import outbox
 from market.models import AddonPremium, Price
 from reviews.models import Review
 import sharing.utils as sharing
@@ -47,10 +48,11 @@ from tags.models import Tag
 from translations.fields import (LinkifiedField, PurifiedField, save_signal,
                                  TranslatedField, Translation)
 from translations.query import order_by_translation
+import translations.transformer
 from users.models import UserForeignKey, UserProfile
 from users.utils import find_users
 from versions.compare import version_int
-from versions.models import Version
+from versions.models import ApplicationsVersions, Version
 
 from . import query, signals
 
@@ -796,6 +798,14 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
         log.info('Incrementing d2c-versions namespace for add-on [%s]: %s' % (
                  self.id, key))
 
+    def invalidate_update_cache(self):
+        """Invalidates the update service's in-process update candidates.
+
+        The update service compares this namespace with the one it loaded
+        the candidates under and reloads them from the database if it moved.
+        """
+        cache_ns_key('update:%s' % self.id, increment=True)
+
     @property
     def current_version(self):
         "Returns the current_version field or updates it if needed."
@@ -913,8 +923,26 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
         version_ids = filter(None, (a._current_version_id for a in addons))
         backup_ids = filter(None, (a._backup_version_id for a in addons))
         all_ids = set(version_ids) | set(backup_ids)
-        versions = list(Version.objects.filter(id__in=all_ids).order_by()
-                        .transform(Version.transformer))
+        # The translations of everything loaded in this block are fetched
+        # with a single query at the end of it.
+        with translations.transformer.batch():
+            versions = list(Version.objects.filter(id__in=all_ids).order_by()
+                            .transform(Version.transformer))
+            authors = list(
+                UserProfile.objects.no_cache()
+                .filter(addons__in=addons, addonuser__listed=True)
+                .extra(select={'addon_id': 'addons_users.addon_id',
+                               'position': 'addons_users.position'}))
+            # Personas need categories for the JSON dump.
+            Category.transformer(personas)
+            previews = list(Preview.objects.filter(addon__in=addons,
+                                                   position__gte=0).order_by())
+            cats = dict(AddonCategory.objects.values_list('addon', 'category')
+                        .filter(addon__in=addon_dict,
+                                category__application=amo.FIREFOX.id))
+            categories = list(
+                Category.objects.filter(id__in=set(cats.values())))
+
         for version in versions:
             try:
                 addon = addon_dict[version.addon_id]
@@ -928,11 +956,7 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
             version.addon = addon
 
         # Attach listed authors.
-        q = (UserProfile.objects.no_cache()
-             .filter(addons__in=addons, addonuser__listed=True)
-             .extra(select={'addon_id': 'addons_users.addon_id',
-                            'position': 'addons_users.position'}))
-        q = sorted(q, key=lambda u: (u.addon_id, u.position))
+        q = sorted(authors, key=lambda u: (u.addon_id, u.position))
         for addon_id, users in itertools.groupby(q, key=lambda u: u.addon_id):
             addon_dict[addon_id].listed_authors = list(users)
 
@@ -941,25 +965,17 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
             addon.persona = persona
             addon.weekly_downloads = persona.popularity
 
-        # Personas need categories for the JSON dump.
-        Category.transformer(personas)
-
         # Attach sharing stats.
         sharing.attach_share_counts(AddonShareCountTotal, 'addon', addon_dict)
 
         # Attach previews.
-        qs = Preview.objects.filter(addon__in=addons,
-                                    position__gte=0).order_by()
-        qs = sorted(qs, key=lambda x: (x.addon_id, x.position, x.created))
+        qs = sorted(previews,
+                    key=lambda x: (x.addon_id, x.position, x.created))
         for addon, previews in itertools.groupby(qs, lambda x: x.addon_id):
             addon_dict[addon].all_previews = list(previews)
 
         # Attach _first_category for Firefox.
-        cats = dict(AddonCategory.objects.values_list('addon', 'category')
-                    .filter(addon__in=addon_dict,
-                            category__application=amo.FIREFOX.id))
-        qs = Category.objects.filter(id__in=set(cats.values()))
-        categories = dict((c.id, c) for c in qs)
+        categories = dict((c.id, c) for c in categories)
         for addon in addons:
             category = categories[cats[addon.id]] if addon.id in cats else None
             addon._first_category[amo.FIREFOX.id] = category
@@ -1586,9 +1602,16 @@ def version_changed(sender, **kw):
 @receiver(dbsignals.post_save, sender=Addon,
           dispatch_uid='addons.search.index')
 def update_search_index(sender, instance, **kw):
-    from . import tasks
     if not kw.get('raw'):
-        tasks.index_addons.delay([instance.id])
+        outbox.enqueue(Addon._meta.db_table, instance.id)
+
+
+def _extract_addons(ids):
+    from . import search
+    return search.extract_ids(ids)
+
+
+outbox.register(Addon._meta.db_table, _extract_addons, Addon._get_index)
 
 
 @Addon.on_change
@@ -1703,6 +1726,13 @@ class Persona(caching.CachingMixin, models.Model):
     def is_new(self):
         return self.persona_id == 0
 
+    def invalidate_theme_update(self):
+        """Drops the JSON services/theme_update.py rendered for this theme."""
+        cache_ns_key('theme-update:addon_id:%s' % self.addon_id,
+                     increment=True)
+        cache_ns_key('theme-update:persona_id:%s' % self.persona_id,
+                     increment=True)
+
     def flush_urls(self):
         urls = ['*/addon/%d/' % self.addon_id,
                 '*/api/*/addon/%d' % self.addon_id,
@@ -1871,18 +1901,35 @@ class AddonRecommendation(models.Model):
     other_addon = models.ForeignKey(Addon, related_name="recommended_for")
     score = models.FloatField()
 
+    # Add-ons in fewer collections are left out since we'd be overfitting
+    # recommendations to exactly what's in those collections.
+    MIN_COLLECTIONS = 4
+
     class Meta:
         db_table = 'addon_recommendations'
         ordering = ('-score',)
 
     @classmethod
     def scores(cls, addon_ids):
-        """Get a mapping of {addon: {other_addon: score}} for each add-on."""
+        """
+        Get a mapping of {addon: {other_addon: score}} for each add-on. The
+        add-ons without recommendations yet, like those that showed up since
+        the last `recs`, are looked up in the recommendations index.
+        """
         d = {}
         q = (AddonRecommendation.objects.filter(addon__in=addon_ids)
              .values('addon', 'other_addon', 'score'))
         for addon, rows in sorted_groupby(q, key=lambda x: x['addon']):
             d[addon] = dict((r['other_addon'], r['score']) for r in rows)
+
+        missing = [addon for addon in addon_ids if addon not in d]
+        index = get_recs_index() if missing else None
+        for addon in missing:
+            current = index.get(addon) if index is not None else None
+            if current is not None and current[1] >= cls.MIN_COLLECTIONS:
+                # The add-on is its own best match, keep the 10 after it.
+                top = index.top(addon, 11, min_size=cls.MIN_COLLECTIONS)
+                d[addon] = dict((k, v) for k, v in top if k != addon)
         return d
 
 
@@ -2362,6 +2409,48 @@ models.signals.post_delete.connect(update_incompatible_versions,
                                    dispatch_uid='cor_update_incompatible')
 
 
+@receiver(dbsignals.post_save, sender=Persona,
+          dispatch_uid='persona_theme_update')
+@receiver(dbsignals.post_save, sender=Addon,
+          dispatch_uid='addon_theme_update')
+def invalidate_theme_update(sender, instance, **kw):
+    if kw.get('raw'):
+        return
+    try:
+        if isinstance(instance, Addon):
+            if instance.type != amo.ADDON_PERSONA:
+                return
+            instance = instance.persona
+    except ObjectDoesNotExist:
+        return
+    instance.invalidate_theme_update()
+
+
+def invalidate_update_cache(sender, instance, **kw):
+    """Anything that changes what services/update.py can offer as an update
+    has to drop the candidates it cached for the add-on."""
+    if kw.get('raw'):
+        return
+    try:
+        if isinstance(instance, Addon):
+            addon = instance
+        elif isinstance(instance, Version):
+            addon = instance.addon
+        else:
+            addon = instance.version.addon
+    except ObjectDoesNotExist:
+        return
+    addon.invalidate_update_cache()
+
+
+for _sender in (Addon, Version, File, ApplicationsVersions,
+                IncompatibleVersions):
+    dbsignals.post_save.connect(invalidate_update_cache, sender=_sender,
+                                dispatch_uid='update_cache_save')
+    dbsignals.post_delete.connect(invalidate_update_cache, sender=_sender,
+                                  dispatch_uid='update_cache_delete')
+
+
 # webapps.models imports addons.models to get Addon, so we need to keep the
 # Webapp import down here.
 from mkt.webapps.models import Webapp
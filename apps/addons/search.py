@@ -19,11 +19,24 @@ from versions.compare import version_int
 import mkt
 from mkt.webapps.models import Installed
 
-from .models import Addon
+from .models import (Addon, attach_categories, attach_devices, attach_prices,
+                     attach_tags, attach_translations)
 
 
 log = logging.getLogger('z.es')
 
+# What `extract` reads that isn't on the add-on, attached in bulk.
+TRANSFORMS = (attach_categories, attach_devices, attach_prices, attach_tags,
+              attach_translations)
+
+
+def extract_ids(ids):
+    """Extracts the documents of the add-ons in `ids`, for lib.es.pipeline."""
+    qs = Addon.uncached.filter(id__in=ids)
+    for transform in TRANSFORMS:
+        qs = qs.transform(transform)
+    return [extract(addon) for addon in qs]
+
 
 def extract(addon):
     """Extract indexable attributes from an add-on."""
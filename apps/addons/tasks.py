@@ -20,9 +20,7 @@ from versions.models import Version
 
 # pulling tasks from cron
 from . import cron, search  # NOQA
-from .models import (Addon, attach_categories, attach_devices, attach_prices,
-                     attach_tags, attach_translations, CompatOverride,
-                     IncompatibleVersions, Preview)
+from .models import Addon, CompatOverride, IncompatibleVersions, Preview
 
 
 log = logging.getLogger('z.task')
@@ -109,9 +107,8 @@ def delete_preview_files(id, **kw):
 @task(acks_late=True, ignore_result=False)
 def index_addons(ids, **kw):
     log.info('Indexing addons %s-%s. [%s]' % (ids[0], ids[-1], len(ids)))
-    transforms = (attach_categories, attach_devices, attach_prices,
-                  attach_tags, attach_translations)
-    index_objects(ids, Addon, search, kw.pop('index', None), transforms)
+    index_objects(ids, Addon, search, kw.pop('index', None),
+                  search.TRANSFORMS)
 
 
 @task
@@ -266,6 +263,7 @@ def update_incompatible_appversions(data, **kw):
     # Increment namespace cache of compat versions.
     for addon_id in addon_ids:
         cache_ns_key('d2c-versions:%s' % addon_id, increment=True)
+        cache_ns_key('update:%s' % addon_id, increment=True)
 
 
 def make_checksum(header_path, footer_path):
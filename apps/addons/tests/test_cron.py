@@ -246,6 +246,28 @@ class AvgDailyUserCountTestCase(amo.tests.TestCase):
         addon = Addon.objects.get(pk=3615)
         eq_(addon.average_daily_users, 1234)
 
+    @mock.patch('addons.tasks.index_addons.delay')
+    def test_adu_is_written_in_bulk(self, index_addons):
+        addon = Addon.objects.get(pk=3615)
+        with self.assertNumQueries(2):
+            cron._update_addon_average_daily_users(
+                [(3615, addon.total_downloads + 5), (999999, 5)])
+        addon = Addon.objects.no_cache().get(pk=3615)
+        eq_(addon.average_daily_users, addon.total_downloads + 5)
+        index_addons.assert_called_with([3615])
+
+
+class DownloadTotalsTestCase(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    @mock.patch('addons.tasks.index_addons.delay')
+    def test_totals(self, index_addons):
+        cron._update_addon_download_totals([(3615, 12, 345), (999999, 1, 2)])
+        addon = Addon.objects.get(pk=3615)
+        eq_(addon.average_daily_downloads, 12)
+        eq_(addon.total_downloads, 345)
+        index_addons.assert_called_with([3615])
+
 
 class TestReindex(amo.tests.ESTestCase):
 
@@ -38,6 +38,7 @@ from devhub.models import ActivityLog, AddonLog, RssKey, SubmitStep
 from editors.models import EscalationQueue
 from files.models import File, Platform
 from files.tests.test_models import TestLanguagePack, UploadTest
+from lib import recommend
 from market.models import AddonPaymentData, AddonPremium, Price
 from reviews.models import Review
 from translations.models import TranslationSequence, Translation
@@ -251,6 +252,14 @@ class TestAddonModels(amo.tests.TestCase):
         a = Addon.objects.get(pk=3615)
         eq_(a.current_version.id, 81551)
 
+    def test_transformer_cached(self):
+        for _ in range(2):
+            addons = list(Addon.objects.no_transforms().filter(pk=3615))
+            Addon.transformer(addons)
+        version = addons[0]._current_version
+        eq_(version.id, 81551)
+        assert version.from_cache
+
     def test_current_version_listed(self):
         a = Addon.objects.get(pk=3723)
         eq_(a.current_version.id, 89774)
@@ -1528,6 +1537,22 @@ class TestAddonRecommendations(amo.tests.TestCase):
             for rec in recs:
                 eq_(scores[addon][rec.other_addon_id], rec.score)
 
+    def test_scores_from_index(self):
+        # Add-ons in 3 collections or less aren't recommended, nor get
+        # recommendations.
+        index = recommend.MinHashIndex.build({1: [1, 2, 3, 4],
+                                              2: [1, 2, 3, 4],
+                                              3: [1, 2, 3], 5: [7, 8]})
+        path = tempfile.mktemp()
+        index.save(path)
+        try:
+            with patch.object(settings, 'RECS_INDEX_PATH', path):
+                scores = AddonRecommendation.scores([5299, 1, 3, 4])
+        finally:
+            os.remove(path)
+        eq_(sorted(scores), [1, 5299])
+        eq_(scores[1], {2: 1.})
+
 
 class TestAddonDependencies(amo.tests.TestCase):
     fixtures = ['base/apps',
@@ -133,3 +133,48 @@ class TestThemeUpdate(amo.tests.TestCase):
 
         self.check_good(
             json.loads(self.get_update('en-US', 813, 'src=gp').get_json()))
+
+
+@mock.patch.object(theme_update.ThemeUpdate, 'render_json')
+class TestThemeUpdateCache(amo.tests.TestCase):
+    fixtures = ['addons/persona']
+
+    def get_json(self, *args):
+        update = theme_update.ThemeUpdate(*args)
+        update.cursor = connection.cursor()
+        return update.get_json()
+
+    def test_cached(self, render_json):
+        render_json.return_value = '{}'
+        eq_(self.get_json('en-US', 15663), '{}')
+        eq_(self.get_json('en-US', 15663), '{}')
+        eq_(render_json.call_count, 1)
+
+    def test_not_found_cached(self, render_json):
+        render_json.return_value = None
+        eq_(self.get_json('en-US', 999), None)
+        eq_(self.get_json('en-US', 999), None)
+        eq_(render_json.call_count, 1)
+
+    def test_keyed_on_locale_and_source(self, render_json):
+        render_json.return_value = '{}'
+        self.get_json('en-US', 15663)
+        self.get_json('fr', 15663)
+        self.get_json('en-US', 15663, 'src=gp')
+        eq_(render_json.call_count, 3)
+
+    def test_unknown_locale(self, render_json):
+        render_json.return_value = '{}'
+        self.get_json('en-US', 15663)
+        self.get_json('en-us', 15663)
+        self.get_json('x y\x00' * 100, 15663)
+        eq_(render_json.call_count, 1)
+
+    def test_invalidated_on_save(self, render_json):
+        render_json.return_value = '{}'
+        self.get_json('en-US', 15663)
+        self.get_json('en-US', 813, 'src=gp')
+        Addon.objects.get(pk=15663).persona.save()
+        self.get_json('en-US', 15663)
+        self.get_json('en-US', 813, 'src=gp')
+        eq_(render_json.call_count, 4)
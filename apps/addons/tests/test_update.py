@@ -7,6 +7,7 @@ import urlparse
 from django.db import connection
 from django.utils.encoding import smart_str
 
+import mock
 from nose.tools import eq_
 
 import amo
@@ -566,6 +567,74 @@ class TestDefaultToCompat(amo.tests.TestCase):
         self.check(self.expected)
 
 
+class UpdateCacheMixin(object):
+    """Run the lookups through the in-process update cache."""
+
+    def setUp(self):
+        super(UpdateCacheMixin, self).setUp()
+        update.update_cache.clear()
+        patcher = mock.patch.object(update.update_cache, 'timeout', 300)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(update.update_cache.clear)
+
+
+class TestLookupCache(UpdateCacheMixin, TestLookup):
+    pass
+
+
+class TestDefaultToCompatCache(UpdateCacheMixin, TestDefaultToCompat):
+    pass
+
+
+class TestUpdateCache(UpdateCacheMixin, amo.tests.TestCase):
+    fixtures = ['addons/update',
+                'base/apps',
+                'base/appversion',
+                'base/platforms']
+
+    def setUp(self):
+        super(TestUpdateCache, self).setUp()
+        self.addon = Addon.objects.get(id=1865)
+        self.app = Application.objects.get(id=1)
+
+    def get(self):
+        up = update.Update({
+            'id': self.addon.guid,
+            'appID': self.app.guid,
+            'appVersion': '3.0.12',
+            'reqVersion': '',
+        })
+        up.cursor = connection.cursor()
+        assert up.is_valid()
+        up.get_update()
+        return up.data['row'].get('version_id')
+
+    def test_cached(self):
+        eq_(self.get(), 115509)
+        with mock.patch.object(update.update_cache, 'load') as load:
+            eq_(self.get(), 115509)
+            assert not load.called
+
+    def test_invalidated_on_file_change(self):
+        eq_(self.get(), 115509)
+        File.objects.get(version=115509).update(status=amo.STATUS_DISABLED)
+        eq_(self.get(), 112396)
+
+    def test_expired(self):
+        eq_(self.get(), 115509)
+        with mock.patch.object(update, 'time') as time:
+            time.return_value = 2 ** 40
+            with mock.patch.object(update.update_cache, 'load') as load:
+                self.get()
+                assert load.called
+
+    def test_sql_fallback(self):
+        with mock.patch.object(update.update_cache, 'resolve') as resolve:
+            resolve.side_effect = ValueError
+            eq_(self.get(), 115509)
+
+
 class TestResponse(amo.tests.TestCase):
     fixtures = ['base/addon_3615',
                 'base/platforms',
@@ -1,7 +1,9 @@
 import hashlib
 import logging
+import os
 import random
 
+from django.conf import settings
 from django.db.models import Q
 from django.utils.encoding import smart_str
 
@@ -9,6 +11,7 @@ import commonware.log
 
 import amo
 from amo.utils import memoize
+from lib import recommend
 
 
 safe_key = lambda x: hashlib.md5(smart_str(x).lower().strip()).hexdigest()
@@ -17,6 +20,8 @@ safe_key = lambda x: hashlib.md5(smart_str(x).lower().strip()).hexdigest()
 log = commonware.log.getLogger('z.redis')
 rnlog = logging.getLogger('z.rn')
 
+_recs_index = {}
+
 
 def reverse_name_lookup(key, webapp=False):
     from addons.models import Addon
@@ -99,3 +104,20 @@ def get_creatured_ids(category, lang):
     random.shuffle(others)
     random.shuffle(per_locale)
     return map(int, filter(None, per_locale + others))
+
+
+def get_recs_index():
+    """
+    Returns the MinHash index of the add-ons in synced collections, mapped
+    once per process and again when the crons replace it, or None.
+    """
+    path = settings.RECS_INDEX_PATH
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+    current = _recs_index.get(path)
+    if current is None or current[0] != modified:
+        current = _recs_index[path] = (modified,
+                                       recommend.MinHashIndex.load(path))
+    return current[1]
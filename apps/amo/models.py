@@ -2,7 +2,7 @@ import contextlib
 import threading
 
 from django.conf import settings
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.utils import translation
 
 import caching.base
@@ -40,6 +40,25 @@ def skip_cache():
         _locals.skip_cache = old
 
 
+@contextlib.contextmanager
+def defer_caching():
+    """
+    Within this context, the results of cached queries are only stored at
+    the end of it, if nothing was raised. Whatever is attached to the objects
+    in the meantime is cached with them.
+    """
+    if getattr(_locals, 'deferred_caching', None) is not None:
+        yield
+        return
+    _locals.deferred_caching = deferred = []
+    try:
+        yield
+    finally:
+        _locals.deferred_caching = None
+    for machine, objects in deferred:
+        _cache_objects(machine, objects)
+
+
 # This is sadly a copy and paste of annotate to get around this
 # ticket http://code.djangoproject.com/ticket/14707
 def annotate(self, *args, **kwargs):
@@ -113,6 +132,19 @@ class CachingRawQuerySet(RawQuerySet, caching.base.CachingRawQuerySet):
 CachingQuerySet = caching.base.CachingQuerySet
 CachingQuerySet.__bases__ = (TransformQuerySet,) + CachingQuerySet.__bases__
 
+_cache_objects = caching.base.CacheMachine.cache_objects
+
+
+def cache_objects(self, objects):
+    # Hold on to the objects until the end of `defer_caching`.
+    deferred = getattr(_locals, 'deferred_caching', None)
+    if deferred is not None:
+        deferred.append((self, objects))
+    else:
+        _cache_objects(self, objects)
+
+caching.base.CacheMachine.cache_objects = cache_objects
+
 
 class UncachedManagerBase(models.Manager):
 
@@ -395,6 +427,45 @@ def manual_order(qs, pks, pk_name='id'):
             order_by=['_manual'])
 
 
+def bulk_update(model, columns):
+    """
+    Sets many rows of `model` at once, `columns` maps field names to
+    `{pk: value}` dicts. It's a single UPDATE with a CASE per field::
+
+        UPDATE addons SET total_downloads = CASE id WHEN 1 THEN 10
+          WHEN 2 THEN 20 ELSE total_downloads END WHERE id IN (1, 2)
+
+    Nothing is invalidated and no signal is sent, that's up to the caller.
+    """
+    pks = set()
+    for values in columns.values():
+        pks.update(values)
+    if not pks:
+        return
+
+    opts = model._meta
+    qn = connection.ops.quote_name
+    sets, params = [], []
+    for name, values in sorted(columns.items()):
+        if not values:
+            continue
+        field = opts.get_field(name)
+        column = qn(field.column)
+        cases = []
+        for pk, value in values.items():
+            cases.append('WHEN %s THEN %s')
+            params.extend([pk, field.get_db_prep_save(value, connection)])
+        sets.append('%s = CASE %s %s ELSE %s END' % (
+            column, qn(opts.pk.column), ' '.join(cases), column))
+    params.extend(pks)
+
+    cursor = connection.cursor()
+    cursor.execute('UPDATE %s SET %s WHERE %s IN (%s)' % (
+        qn(opts.db_table), ', '.join(sets), qn(opts.pk.column),
+        ', '.join(['%s'] * len(pks))), params)
+    transaction.commit_unless_managed()
+
+
 class BlobField(models.Field):
     """MySQL blob column.
 
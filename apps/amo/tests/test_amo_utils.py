@@ -11,9 +11,11 @@ from django.utils import translation
 import mock
 from nose.tools import eq_, assert_raises, raises
 
-from amo.utils import (cache_ns_key, escape_all, find_language,
-                       LocalFileStorage, no_translation, resize_image,
-                       rm_local_tmp_dir, slugify, slug_validator, to_language)
+from amo.utils import (cache_ns_key, drop_post_commit, end_post_commit,
+                       escape_all, find_language, LocalFileStorage, memoize,
+                       Memoized, memoize_get, memoize_key, no_translation,
+                       post_commit, resize_image, rm_local_tmp_dir, slugify,
+                       slug_validator, start_post_commit, to_language)
 from product_details import product_details
 
 u = u'Ελληνικά'
@@ -226,6 +228,143 @@ class TestCacheNamespaces(unittest.TestCase):
         eq_(cache_ns_key(self.namespace), expected)
 
 
+class TestMemoize(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+        @memoize('test-memoize', time=60)
+        def add(x, y=1):
+            self.calls.append((x, y))
+            return x + y
+        self.add = add
+
+    def test_cached(self):
+        eq_(self.add(1), 2)
+        eq_(self.add(1), 2)
+        eq_(self.add(1, y=2), 3)
+        eq_(self.calls, [(1, 1), (1, 2)])
+        eq_(memoize_get('test-memoize', 1), 2)
+
+    def test_deleted(self):
+        self.add(1)
+        cache.delete(memoize_key('test-memoize', 1))
+        self.add(1)
+        eq_(len(self.calls), 2)
+
+    def test_none_not_cached(self):
+        calls = []
+
+        @memoize('test-memoize-none')
+        def nothing():
+            calls.append(1)
+        nothing()
+        nothing()
+        eq_(len(calls), 2)
+
+    @mock.patch('amo.utils.time.time')
+    def test_stale_refreshed_once(self, time):
+        time.return_value = 1000
+        self.add(1)
+        time.return_value = 1061
+        # Someone else is refreshing it.
+        cache.add(memoize_key('test-memoize', 1) + ':lock', 1)
+        eq_(self.add(1), 2)
+        eq_(len(self.calls), 1)
+        cache.delete(memoize_key('test-memoize', 1) + ':lock')
+        eq_(self.add(1), 2)
+        eq_(len(self.calls), 2)
+
+    @mock.patch('amo.utils.random.random')
+    @mock.patch('amo.utils.time.time')
+    def test_early_expiration(self, time, random):
+        time.return_value = 1000
+        # It took 10 seconds to compute and expires in 10 seconds.
+        cache.set(memoize_key('test-memoize', 1), Memoized(2, 1060, 10))
+        time.return_value = 1050
+        random.return_value = .5
+        self.add(1)
+        eq_(len(self.calls), 0)
+        random.return_value = .99
+        self.add(1)
+        eq_(len(self.calls), 1)
+
+    @mock.patch('amo.utils.MEMOIZE_POLL', 0)
+    def test_miss_waits(self):
+        key = memoize_key('test-memoize', 1)
+        cache.add(key + ':lock', 1)
+
+        def computed(*args):
+            cache.set(key, Memoized(5, 0, 0))
+        with mock.patch('amo.utils.time.sleep', computed):
+            eq_(self.add(1), 5)
+        eq_(self.calls, [])
+
+    @mock.patch('amo.utils.MEMOIZE_POLL', 0)
+    def test_miss_lock_released(self):
+        key = memoize_key('test-memoize', 1)
+        cache.add(key + ':lock', 1)
+
+        def failed(*args):
+            cache.delete(key + ':lock')
+        with mock.patch('amo.utils.time.sleep', failed):
+            eq_(self.add(1), 2)
+        eq_(self.calls, [(1, 1)])
+
+    def test_namespace(self):
+        calls = []
+
+        @memoize('test-memoize-ns', time=0, namespace='test-memoize')
+        def get():
+            calls.append(1)
+            return len(calls)
+        eq_(get(), 1)
+        eq_(get(), 1)
+        cache_ns_key('test-memoize', increment=True)
+        eq_(get(), 2)
+
+    def test_method(self):
+        class Foo(object):
+            @memoize('test-memoize-method')
+            def bar(self, x):
+                return x * 2
+
+            def __str__(self):
+                return 'foo'
+        eq_(Foo().bar(2), 4)
+        eq_(memoize_get('test-memoize-method', Foo(), 2), 4)
+
+
+class TestPostCommit(unittest.TestCase):
+
+    def setUp(self):
+        self.fn = mock.Mock()
+
+    def tearDown(self):
+        end_post_commit(None)
+
+    def test_outside_request(self):
+        post_commit(self.fn, 1, a=2)
+        self.fn.assert_called_with(1, a=2)
+
+    @mock.patch('amo.utils.transaction.is_managed', lambda: True)
+    def test_after_request(self):
+        start_post_commit(None)
+        post_commit(self.fn, 1)
+        assert not self.fn.called
+        end_post_commit(None)
+        self.fn.assert_called_with(1)
+
+    @mock.patch('amo.utils.transaction.is_managed', lambda: True)
+    def test_failed_request(self):
+        start_post_commit(None)
+        post_commit(self.fn, 1)
+        drop_post_commit(None)
+        end_post_commit(None)
+        assert not self.fn.called
+
+
 def test_escape_all():
     x = '-'.join([u, u])
     y = ' - '.join([u, u])
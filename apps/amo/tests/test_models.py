@@ -3,7 +3,7 @@ from mock import Mock
 from nose.tools import eq_
 
 import amo.models
-from amo.models import manual_order
+from amo.models import bulk_update, manual_order
 from amo.tests import TestCase
 from amo import models as context
 from addons.models import Addon
@@ -22,6 +22,24 @@ class ManualOrderTest(TestCase):
         eq_(semi_arbitrary_order, [addon.id for addon in addons])
 
 
+class BulkUpdateTest(TestCase):
+    fixtures = ('base/addon_3615', 'base/addon_5299_gcal')
+
+    def test_update(self):
+        bulk_update(Addon, {'total_downloads': {3615: 10, 5299: 20},
+                            'average_daily_users': {5299: 5}})
+        addons = dict((a.id, a) for a in Addon.objects.no_cache().all())
+        eq_(addons[3615].total_downloads, 10)
+        eq_(addons[5299].total_downloads, 20)
+        eq_(addons[5299].average_daily_users, 5)
+        # Rows without a value keep theirs.
+        assert addons[3615].average_daily_users != 5
+
+    def test_nothing(self):
+        with self.assertNumQueries(0):
+            bulk_update(Addon, {'total_downloads': {}})
+
+
 def test_skip_cache():
     eq_(getattr(context._locals, 'skip_cache', False), False)
     with context.skip_cache():
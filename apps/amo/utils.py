@@ -7,11 +7,13 @@ import errno
 import functools
 import hashlib
 import itertools
+import math
 import operator
 import os
 import random
 import re
 import shutil
+import threading
 import time
 import unicodedata
 import urllib
@@ -27,8 +29,12 @@ from django.core.cache import cache
 from django.core.files.storage import (FileSystemStorage,
                                        default_storage as storage)
 from django.core.serializers import json
+from django.core.signals import (got_request_exception, request_finished,
+                                 request_started)
 from django.core.validators import ValidationError, validate_slug
 from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.db import transaction
+from django.dispatch import receiver
 from django.forms.fields import Field
 from django.http import HttpRequest
 from django.template import Context, loader
@@ -646,28 +652,115 @@ def memoize_key(prefix, *args, **kwargs):
 
 def memoize_get(prefix, *args, **kwargs):
     """Returns the content of the cache given the key."""
-    return cache.get(memoize_key(prefix, *args, **kwargs))
+    entry = cache.get(memoize_key(prefix, *args, **kwargs))
+    if isinstance(entry, Memoized):
+        return entry.value
 
 
-def memoize(prefix, time=60):
+# How long a caller computing a memoized value holds its lock, at most.
+MEMOIZE_LOCK_TIMEOUT = 30
+# How long the other callers wait for it before computing it too.
+MEMOIZE_WAIT = 5
+MEMOIZE_POLL = .05
+
+# What memoize caches: the value, when it expires and how many seconds it
+# took to compute.
+Memoized = collections.namedtuple('Memoized', 'value expires delta')
+
+
+def memoize(prefix, time=60, stale=None, namespace=None, beta=1):
     """
-    A simple memoize that caches into memcache, using a simple
-    key based on stringing args and kwargs. Keep args simple.
+    A memoize that caches into memcache, using a simple key based on
+    stringing args and kwargs. Keep args simple.
+
+    Values are fresh for `time` seconds, or until deleted if it's 0, and kept
+    `stale` seconds longer (`time` by default). Only one caller computes a
+    value at a time: while it does, the others are served the stale value or,
+    if there's none, wait for the new one.
+
+    A value is also recomputed early, at random, as it gets closer to expiry
+    and the longer it took to compute, so busy keys are refreshed before they
+    expire; `beta` above 1 favors refreshing earlier.
+
+    Keys are under the `namespace` of cache_ns_key, if any, so that
+    incrementing it invalidates them all.
+
+    Hits, stale hits, misses and compute times are sent to statsd as
+    `memoize.<prefix>.<stat>`.
     """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             key = memoize_key(prefix, *args, **kwargs)
-            data = cache.get(key)
-            if data is not None:
-                return data
-            data = func(*args, **kwargs)
-            cache.set(key, data, time)
-            return data
+            if namespace:
+                key = '%s:%s' % (cache_ns_key(namespace), key)
+            return _memoized(key, prefix, time, time if stale is None else
+                             stale, beta, func, args, kwargs)
         return wrapper
     return decorator
 
 
+def _memoized(key, prefix, timeout, stale, beta, func, args, kwargs):
+    stat = 'memoize.%s.' % prefix.replace(':', '.')
+    lock = '%s:lock' % key
+    entry = cache.get(key)
+    if isinstance(entry, Memoized):
+        if not timeout or not _expiring(entry, beta):
+            statsd.incr(stat + 'hit')
+            return entry.value
+        if not cache.add(lock, 1, MEMOIZE_LOCK_TIMEOUT):
+            # Another caller is refreshing it.
+            statsd.incr(stat + 'stale')
+            return entry.value
+    else:
+        statsd.incr(stat + 'miss')
+        if not cache.add(lock, 1, MEMOIZE_LOCK_TIMEOUT):
+            entry = _wait_for(key, lock)
+            if entry is not None:
+                statsd.incr(stat + 'waited')
+                return entry.value
+            lock = None
+
+    start = time.time()
+    try:
+        value = func(*args, **kwargs)
+        delta = time.time() - start
+        statsd.timing(stat + 'compute', int(delta * 1000))
+        # None isn't cached, to tell it from a miss.
+        if value is not None:
+            cache.set(key, Memoized(value, time.time() + timeout, delta),
+                      timeout + stale if timeout else 0)
+    finally:
+        if lock:
+            cache.delete(lock)
+    return value
+
+
+def _expiring(entry, beta):
+    """
+    Whether to recompute `entry` already, see "Optimal Probabilistic Cache
+    Stampede Prevention" (Vattani et al.).
+    """
+    return (time.time() - entry.delta * beta * math.log(1 - random.random())
+            >= entry.expires)
+
+
+def _wait_for(key, lock):
+    """
+    Waits for the value of `key`, computed by the holder of `lock`. Returns
+    None if it takes too long or the lock is released without a value.
+    """
+    waited = 0
+    while waited < MEMOIZE_WAIT:
+        time.sleep(MEMOIZE_POLL)
+        waited += MEMOIZE_POLL
+        found = cache.get_many([key, lock])
+        if isinstance(found.get(key), Memoized):
+            return found[key]
+        if lock not in found:
+            return None
+
+
 def cache_ns_key(namespace, increment=False):
     """
     Returns a key with namespace value appended. If increment is True, the
@@ -736,6 +829,41 @@ def guard(name):
             msg.delete()
 
 
+_post_commit = threading.local()
+
+
+def post_commit(fn, *args, **kw):
+    """
+    Calls `fn(*args, **kw)` once what was written so far is committed: right
+    away outside of a managed transaction, else once the request is done,
+    the views managing their transaction having committed it by then. It's
+    not called if the request failed.
+    """
+    pending = getattr(_post_commit, 'pending', None)
+    if pending is not None and transaction.is_managed():
+        pending.append((fn, args, kw))
+    else:
+        fn(*args, **kw)
+
+
+@receiver(request_started, dispatch_uid='amo_post_commit_start')
+def start_post_commit(sender, **kw):
+    _post_commit.pending = []
+
+
+@receiver(got_request_exception, dispatch_uid='amo_post_commit_failed')
+def drop_post_commit(sender, **kw):
+    _post_commit.pending = []
+
+
+@receiver(request_finished, dispatch_uid='amo_post_commit_end')
+def end_post_commit(sender, **kw):
+    pending = getattr(_post_commit, 'pending', None) or []
+    _post_commit.pending = None
+    for fn, args, kwargs in pending:
+        fn(*args, **kwargs)
+
+
 class Token:
     """
     A simple token, useful for security. It can have an expiry
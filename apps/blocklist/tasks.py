@@ -0,0 +1,12 @@
+import commonware.log
+from celeryutils import task
+
+from . import utils
+
+log = commonware.log.getLogger('z.task')
+
+
+@task
+def warm_blocklist(**kw):
+    log.info('Warming the blocklist.')
+    utils.warm()
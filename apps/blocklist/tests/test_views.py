@@ -1,15 +1,19 @@
 import base64
+import gzip
+from cStringIO import StringIO
 from datetime import datetime
 from xml.dom import minidom
 
 from django.conf import settings
 from django.core.cache import cache
 
+import mock
 from nose.tools import eq_
 
 import amo
 import amo.tests
 from amo.urlresolvers import reverse
+from blocklist import utils
 from blocklist.models import (BlocklistApp, BlocklistCA, BlocklistDetail,
                               BlocklistGfx, BlocklistItem, BlocklistPlugin)
 
@@ -517,3 +521,52 @@ class BlocklistCATest(BlocklistViewTest):
         dom = minidom.parseString(r.content)
         ca = dom.getElementsByTagName('caBlocklistEntry')[0]
         eq_(base64.b64decode(ca.childNodes[0].toxml()), self.ca.data)
+
+
+class BlocklistVariantTest(BlocklistViewTest):
+
+    def setUp(self):
+        super(BlocklistVariantTest, self).setUp()
+        self.item = BlocklistItem.objects.create(guid='guid@addon.com',
+                                                 details=self.details)
+
+    def test_gzip(self):
+        r = self.client.get(self.fx4_url, HTTP_ACCEPT_ENCODING='gzip')
+        eq_(r['Content-Encoding'], 'gzip')
+        assert 'Accept-Encoding' in r['Vary']
+        xml = gzip.GzipFile(fileobj=StringIO(r.content)).read()
+        eq_(xml, self.client.get(self.fx4_url).content)
+
+    def test_loaded_once(self):
+        with mock.patch.object(utils, 'Blocklist',
+                               wraps=utils.Blocklist) as blocklist:
+            self.client.get(self.fx4_url)
+            # Another variant is rendered from the same blocklist.
+            self.client.get(self.tb4_url)
+            eq_(blocklist.call_count, 1)
+            self.item.update(guid='other@addon.com')
+            self.assertContains(self.client.get(self.tb4_url),
+                                'other@addon.com')
+            eq_(blocklist.call_count, 2)
+
+    @mock.patch.object(utils, 'WARM_VARIANTS', 0)
+    def test_stale_while_rendering(self):
+        old = self.client.get(self.fx4_url).content
+        self.item.update(guid='other@addon.com')
+        # Another request is rendering the new version.
+        key = utils.variant_key('3', amo.FIREFOX.guid, '4.0')
+        cache.add(key + ':lock', 1, version=utils.get_keyversion())
+        eq_(self.client.get(self.fx4_url).content, old)
+
+    @mock.patch.object(utils, 'WARM_VARIANTS', 1)
+    def test_warm(self):
+        self.client.get(self.fx4_url)
+        utils.invalidate()
+        self.client.get(self.fx4_url)
+        self.client.get(self.tb4_url)
+        self.item.update(guid='other@addon.com')
+        key = utils.variant_key('3', amo.FIREFOX.guid, '4.0')
+        assert 'other@addon.com' in cache.get(
+            key, version=utils.get_keyversion())['xml']
+        key = utils.variant_key('3', amo.THUNDERBIRD.guid, '4.0')
+        eq_(cache.get(key, version=utils.get_keyversion()), None)
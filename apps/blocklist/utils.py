@@ -0,0 +1,253 @@
+"""
+The blocklist served to clients, materialized.
+
+Every row of the blocklist is loaded at once into a `Blocklist`, kept in
+memory by each process until something in the blocklist changes. Items,
+plugins and gfx entries are indexed by app guid when first asked for, and
+the version ranges of plugins are compared as ints.
+
+The XML of each (apiver, app, appver) variant is rendered from it when it's
+requested and cached along with its gzipped body. A single request renders
+a variant after a change, the others are served the previous version in
+the meantime. The variants requested most are then rendered again by
+`warm`, right after the change.
+"""
+import base64
+import collections
+import copy
+import gzip
+import hashlib
+import threading
+import time
+import uuid
+from cStringIO import StringIO
+from datetime import datetime
+from operator import attrgetter
+
+from django.core.cache import cache
+from django.utils.encoding import smart_str
+
+import commonware.log
+import jingo
+
+import amo
+from amo.utils import sorted_groupby
+from versions.compare import version_int
+
+from .models import (BlocklistApp, BlocklistCA, BlocklistGfx, BlocklistItem,
+                     BlocklistPlugin)
+
+log = commonware.log.getLogger('z.blocklist')
+
+App = collections.namedtuple('App', 'guid min max')
+BlItem = collections.namedtuple('BlItem', 'rows os modified block_id')
+
+TIMEOUT = 60 * 60
+# Held by the request rendering a variant, for that long at most.
+LOCK_TIMEOUT = 30
+# How many of the variants requested most are rendered after a change.
+WARM_VARIANTS = 50
+
+_lock = threading.Lock()
+_current = {}
+
+
+class Blocklist(object):
+    """All of the blocklist, loaded with a query per table."""
+
+    def __init__(self):
+        item_apps = collections.defaultdict(list)
+        plugin_apps = collections.defaultdict(list)
+        for app in BlocklistApp.uncached.order_by('id'):
+            if app.blitem_id:
+                item_apps[app.blitem_id].append(app)
+            if app.blplugin_id:
+                plugin_apps[app.blplugin_id].append(app)
+        items = (BlocklistItem.uncached.select_related('details')
+                 .order_by('-modified'))
+        self.items = [(i, item_apps[i.id]) for i in items]
+        plugins = (BlocklistPlugin.uncached.select_related('details')
+                   .order_by('id'))
+        self.plugins = [(p, plugin_apps[p.id]) for p in plugins]
+        self.gfxs = list(BlocklistGfx.objects.order_by('id'))
+        cas = BlocklistCA.objects.all()[:1]
+        self.cas = base64.b64encode(cas[0].data) if cas else None
+        self._items, self._plugins = {}, {}
+
+    def _memoize(self, memo, app, fn):
+        # Don't let random guids fill the memory.
+        if app not in amo.APP_GUIDS:
+            return fn(app)
+        if app not in memo:
+            memo[app] = fn(app)
+        return memo[app]
+
+    def get_items(self, app):
+        """
+        Returns `(items, details)`: the items of `app`, with the version
+        ranges of an add-on collapsed into one item, and the first row of
+        each add-on.
+        """
+        return self._memoize(self._items, app, self._get_items)
+
+    def _get_items(self, app):
+        rows = []
+        for item, item_apps in self.items:
+            apps = [a for a in item_apps if a.guid is None or a.guid == app]
+            if apps or not item_apps:
+                row = copy.copy(item)
+                row.apps = [App(a.guid, a.min, a.max) for a in apps
+                            if a.guid]
+                rows.append(row)
+
+        items, details = {}, {}
+        for guid, rs in sorted_groupby(rows, 'guid'):
+            rs = list(rs)
+            by_id = sorted(rs, key=attrgetter('id'))
+            os = [r.os for r in by_id if r.os]
+            items[guid] = BlItem(by_id, os[0] if os else None,
+                                 rs[0].modified, rs[0].block_id)
+            details[guid] = by_id[0]
+        return items, details
+
+    def get_plugins(self, apiver, app, appver=None):
+        plugins = self._memoize(self._plugins, app, self._get_plugins)
+        # API versions < 3 ignore targetApplication entries for plugins so
+        # only block the plugin if the appver is within the block range.
+        if apiver < 3 and appver is not None:
+            app_version = version_int(appver)
+            plugins = [p for p in plugins if p.app_range is None or
+                       p.app_range[0] < app_version < p.app_range[1]]
+        return plugins
+
+    def _get_plugins(self, app):
+        plugins = []
+        for plugin, apps in self.plugins:
+            for a in apps or [None]:
+                if a is not None and a.guid is not None and a.guid != app:
+                    continue
+                row = copy.copy(plugin)
+                row.app_guid, row.app_min, row.app_max = (
+                    (a.guid, a.min, a.max) if a else (None, None, None))
+                row.app_range = None
+                if row.app_min and row.app_max:
+                    row.app_range = (version_int(row.app_min),
+                                     version_int(row.app_max))
+                plugins.append(row)
+        return plugins
+
+    def get_gfxs(self, app):
+        return [g for g in self.gfxs if g.guid is None or g.guid == app]
+
+    def render(self, apiver, app, appver):
+        """Returns the XML of a variant."""
+        items = self.get_items(app)[0]
+        plugins = self.get_plugins(apiver, app, appver)
+        gfxs = self.get_gfxs(app)
+
+        # Find the latest created/modified date across all sections.
+        all_ = list(items.values()) + plugins + gfxs
+        if all_:
+            last_update = max(x.modified for x in all_)
+        else:
+            last_update = datetime.now()
+        # The client expects milliseconds, Python's time returns seconds.
+        last_update = int(time.mktime(last_update.timetuple()) * 1000)
+        data = dict(items=items, plugins=plugins, gfxs=gfxs, apiver=apiver,
+                    appguid=app, appver=appver, last_update=last_update,
+                    cas=self.cas)
+        if not jingo._helpers_loaded:
+            jingo.load_helpers()
+        template = jingo.env.get_template('blocklist/blocklist.xml')
+        return template.render(data)
+
+
+def get_keyversion():
+    cache.add('blocklist:keyversion', 1)
+    return cache.get('blocklist:keyversion')
+
+
+def get_blocklist():
+    """Returns the current `Blocklist`, loaded once per process."""
+    cache.add('blocklist:generation', uuid.uuid4().hex, 0)
+    generation = cache.get('blocklist:generation')
+    current = _current.get('blocklist')
+    if current is None or current[0] != generation:
+        with _lock:
+            current = _current.get('blocklist')
+            if current is None or current[0] != generation:
+                current = _current['blocklist'] = (generation, Blocklist())
+    return current[1]
+
+
+def invalidate():
+    """Something in the blocklist changed; drops every variant."""
+    cache.set('blocklist:generation', uuid.uuid4().hex, 0)
+    cache.add('blocklist:keyversion', 1)
+    cache.incr('blocklist:keyversion')
+
+
+def variant_key(apiver, app, appver):
+    key = 'blocklist:%s:%s:%s' % (apiver, app, appver)
+    # Use md5 to make sure the memcached key is clean.
+    return hashlib.md5(smart_str(key)).hexdigest()
+
+
+def render_variant(apiver, app, appver):
+    """Returns `{'xml': body, 'gzip': gzipped body}` of a variant."""
+    xml = smart_str(get_blocklist().render(int(apiver), app, appver))
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as fp:
+        fp.write(xml)
+    return {'xml': xml, 'gzip': buf.getvalue()}
+
+
+def get_variant(apiver, app, appver):
+    """Returns the cached variant, see `render_variant`."""
+    version = get_keyversion()
+    key = variant_key(apiver, app, appver)
+    variant = cache.get(key, version=version)
+    if variant is not None:
+        return variant
+
+    lock = key + ':lock'
+    locked = cache.add(lock, 1, LOCK_TIMEOUT, version=version)
+    if not locked:
+        # Another request is rendering it.
+        variant = cache.get(key, version=version - 1)
+        if variant is not None:
+            return variant
+    try:
+        variant = render_variant(apiver, app, appver)
+        cache.set(key, variant, TIMEOUT, version=version)
+    finally:
+        if locked:
+            cache.delete(lock, version=version)
+    count_variant(apiver, app, appver)
+    return variant
+
+
+def count_variant(apiver, app, appver):
+    """Counts the renders of each variant, to find the popular ones."""
+    variants = cache.get('blocklist:variants') or {}
+    variant = (apiver, app, appver)
+    variants[variant] = variants.get(variant, 0) + 1
+    if len(variants) > WARM_VARIANTS * 4:
+        popular = sorted(variants, key=variants.get, reverse=True)
+        variants = dict((v, variants[v])
+                        for v in popular[:WARM_VARIANTS * 2])
+    cache.set('blocklist:variants', variants, 0)
+
+
+def warm():
+    """Renders the variants requested most for the current keyversion."""
+    version = get_keyversion()
+    if not cache.add('blocklist:warmed:%s' % version, 1, TIMEOUT):
+        return
+    variants = cache.get('blocklist:variants') or {}
+    popular = sorted(variants, key=variants.get, reverse=True)
+    for apiver, app, appver in popular[:WARM_VARIANTS]:
+        key = variant_key(apiver, app, appver)
+        cache.set(key, render_variant(apiver, app, appver), TIMEOUT,
+                  version=version)
+    log.info('Warmed %s blocklist variants.' % len(popular[:WARM_VARIANTS]))
@@ -1,3 +1,4 @@
+import bisect
 import logging
 from collections import defaultdict
 
@@ -11,9 +12,11 @@ import amo
 import amo.search
 import amo.utils
 from addons.models import Addon
+from files.models import File
 from search.utils import floor_version
 from stats.models import UpdateCount
 from versions.compare import version_int as vint
+from versions.models import ApplicationsVersions, Version
 from lib.es.utils import get_indices
 
 from .models import AppCompat, CompatReport, CompatTotals
@@ -30,74 +33,22 @@ def compatibility_report_task(index=None, aliased=True):
 
 @task(ignore_result=False)
 def _compatibility_report(index=None, aliased=True):
-    docs = defaultdict(dict)
     indices = get_indices(index)
 
-    # Gather all the data for the index.
+    # Gather all the data for the index, with a few queries per app.
+    latest = UpdateCount.objects.aggregate(d=Max('date'))['d']
+    updates, reports = {}, {}
     for app in amo.APP_USAGE:
-        versions = [c for c in amo.COMPAT if c['app'] == app.id]
-
         log.info(u'Making compat report for %s.' % app.pretty)
-        latest = UpdateCount.objects.aggregate(d=Max('date'))['d']
         qs = UpdateCount.objects.filter(addon__appsupport__app=app.id,
                                         addon__disabled_by_user=False,
                                         addon__status__in=amo.VALID_STATUSES,
                                         addon___current_version__isnull=False,
                                         date=latest)
+        updates[app] = dict(qs.values_list('addon', 'count'))
+        reports[app] = get_reports(app)
 
-        updates = dict(qs.values_list('addon', 'count'))
-        for chunk in amo.utils.chunked(updates.items(), 50):
-            chunk = dict(chunk)
-            for addon in Addon.objects.filter(id__in=chunk):
-                doc = docs[addon.id]
-                doc.update(id=addon.id, slug=addon.slug, guid=addon.guid,
-                           self_hosted=addon.is_selfhosted(),
-                           binary=addon.binary_components,
-                           name=unicode(addon.name), created=addon.created,
-                           current_version=addon.current_version.version,
-                           current_version_id=addon.current_version.pk)
-                doc['count'] = chunk[addon.id]
-                doc.setdefault('top_95',
-                               defaultdict(lambda: defaultdict(dict)))
-                doc.setdefault('top_95_all', {})
-                doc.setdefault('usage', {})[app.id] = updates[addon.id]
-                doc.setdefault('works', {}).setdefault(app.id, {})
-
-                # Populate with default counts for all app versions.
-                for ver in versions:
-                    doc['works'][app.id][vint(ver['main'])] = {
-                        'success': 0,
-                        'failure': 0,
-                        'total': 0,
-                        'failure_ratio': 0.0,
-                    }
-
-                # Group reports by `major`.`minor` app version.
-                reports = (CompatReport.objects
-                           .filter(guid=addon.guid, app_guid=app.guid)
-                           .values_list('app_version', 'works_properly')
-                           .annotate(Count('id')))
-                for ver, works_properly, cnt in reports:
-                    ver = vint(floor_version(ver))
-                    major = [v['main'] for v in versions
-                             if vint(v['previous']) < ver <= vint(v['main'])]
-                    if major:
-                        w = doc['works'][app.id][vint(major[0])]
-                        # Tally number of success and failure reports.
-                        w['success' if works_properly else 'failure'] += cnt
-                        w['total'] += cnt
-                        # Calculate % of incompatibility reports.
-                        w['failure_ratio'] = w['failure'] / float(w['total'])
-
-                if app not in addon.compatible_apps:
-                    continue
-                compat = addon.compatible_apps[app]
-                d = {'min': compat.min.version_int,
-                     'max': compat.max.version_int}
-                doc.setdefault('support', {})[app.id] = d
-                doc.setdefault('max_version', {})[app.id] = compat.max.version
-
-        total = sum(updates.values())
+        total = sum(updates[app].values())
         # Remember the total so we can show % of usage later.
         compat_total, created = CompatTotals.objects.safer_get_or_create(
             app=app.id,
@@ -105,12 +56,145 @@ def _compatibility_report(index=None, aliased=True):
         if not created:
             compat_total.update(total=total)
 
+    ids = set()
+    for app_updates in updates.values():
+        ids.update(app_updates)
+    docs = build_docs(updates, get_addons(ids), reports)
+
+    # Send it all to the index.
+    for chunk in amo.utils.chunked(docs.values(), 150):
+        for doc in chunk:
+            for index in indices:
+                AppCompat.index(doc, id=doc['id'], bulk=True, index=index)
+        amo.search.get_es().flush_bulk(forced=True)
+
+
+def compat_buckets(app):
+    """
+    Returns a function giving the version int of the `main` version of the
+    `amo.COMPAT` entry a version int belongs to, `previous < ver <= main`,
+    or None. The ranges are sorted once, versions are found by bisection.
+    """
+    ranges = sorted((vint(c['main']), vint(c['previous']))
+                    for c in amo.COMPAT if c['app'] == app.id)
+    mains = [main for main, previous in ranges]
+
+    def bucket(ver):
+        i = bisect.bisect_left(mains, ver)
+        if i < len(ranges) and ranges[i][1] < ver:
+            return ranges[i][0]
+    return bucket
+
+
+def get_reports(app):
+    """
+    Returns the counts of the reports for `app`, in a single query, as
+    `{guid: {main version int: [success, failure]}}`.
+    """
+    bucket = compat_buckets(app)
+    # Group reports by `major`.`minor` app version.
+    buckets = {}
+    reports = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    qs = (CompatReport.objects.filter(app_guid=app.guid)
+          .values_list('guid', 'app_version', 'works_properly')
+          .annotate(Count('id')).order_by())
+    for guid, ver, works_properly, cnt in qs:
+        if ver not in buckets:
+            buckets[ver] = bucket(vint(floor_version(ver)))
+        main = buckets[ver]
+        if main is not None:
+            reports[guid][main][0 if works_properly else 1] += cnt
+    return reports
+
+
+def get_addons(ids):
+    """
+    Returns `{id: fields}` of the add-ons of the docs, `support` maps app
+    ids to the min and max version ints and the max version of the current
+    version. That's a few queries per 1000 add-ons.
+    """
+    addons = {}
+    for chunk in amo.utils.chunked(list(ids), 1000):
+        qs = Addon.objects.no_cache().filter(id__in=chunk).only_translations()
+        chunk = dict((addon._current_version_id, addon) for addon in qs)
+        versions = dict(Version.objects.no_cache().filter(id__in=chunk)
+                        .values_list('id', 'version'))
+        binary = set(File.objects.no_cache()
+                     .filter(version__in=chunk, binary_components=True)
+                     .values_list('version', flat=True))
+        support = defaultdict(dict)
+        for version, app, min_, max_, max_version in (
+                ApplicationsVersions.objects.no_cache()
+                .filter(version__in=chunk)
+                .values_list('version', 'application', 'min__version_int',
+                             'max__version_int', 'max__version')):
+            support[version][app] = (min_, max_, max_version)
+
+        for version_id, addon in chunk.items():
+            if version_id not in versions:
+                continue
+            addons[addon.id] = dict(
+                id=addon.id, slug=addon.slug, guid=addon.guid,
+                self_hosted=addon.is_selfhosted(),
+                binary=version_id in binary,
+                name=unicode(addon.name), created=addon.created,
+                current_version=versions[version_id],
+                current_version_id=version_id,
+                support=support[version_id])
+    return addons
+
+
+def build_docs(updates, addons, reports):
+    """
+    Builds the docs of the compat index in one pass over the add-ons of
+    each app: `updates` maps apps to `{addon id: count}`, `addons` and
+    `reports` are from `get_addons` and `get_reports` (for each app).
+    """
+    docs = {}
+    for app in amo.APP_USAGE:
+        mains = [vint(c['main']) for c in amo.COMPAT if c['app'] == app.id]
+        app_reports = reports[app]
+        app_updates = dict((pk, count) for pk, count in updates[app].items()
+                           if pk in addons)
+
+        for pk, count in app_updates.items():
+            addon = addons[pk]
+            doc = docs.get(pk)
+            if doc is None:
+                doc = docs[pk] = dict(
+                    (k, v) for k, v in addon.items() if k != 'support')
+                doc.update(top_95=defaultdict(lambda: defaultdict(dict)),
+                           top_95_all={}, usage={}, works={})
+            doc['count'] = count
+            doc['usage'][app.id] = count
+
+            # Tally number of success and failure reports, and the % of
+            # incompatibility reports, for all app versions.
+            works = doc['works'][app.id] = {}
+            counts = app_reports.get(addon['guid'], {})
+            for main in mains:
+                success, failure = counts.get(main, (0, 0))
+                total = success + failure
+                works[main] = {
+                    'success': success,
+                    'failure': failure,
+                    'total': total,
+                    'failure_ratio': failure / float(total) if total else 0.0,
+                }
+
+            if app.id in addon['support']:
+                min_, max_, max_version = addon['support'][app.id]
+                doc.setdefault('support', {})[app.id] = {'min': min_,
+                                                         'max': max_}
+                doc.setdefault('max_version', {})[app.id] = max_version
+
         # Figure out which add-ons are in the top 95% for this app.
+        total = sum(updates[app].values())
         running_total = 0
-        for addon, count in sorted(updates.items(), key=lambda x: x[1],
-                                   reverse=True):
+        for pk, count in sorted(app_updates.items(), key=lambda x: x[1],
+                                reverse=True):
             running_total += count
-            docs[addon]['top_95_all'][app.id] = running_total < (.95 * total)
+            docs[pk]['top_95_all'][app.id] = running_total < (.95 * total)
 
     # Mark the top 95% of add-ons compatible with the previous version for each
     # app + version combo.
@@ -129,9 +213,4 @@ def _compatibility_report(index=None, aliased=True):
             running_total += doc['count']
             doc['top_95'][app][ver] = running_total < (.95 * total)
 
-    # Send it all to the index.
-    for chunk in amo.utils.chunked(docs.values(), 150):
-        for doc in chunk:
-            for index in indices:
-                AppCompat.index(doc, id=doc['id'], bulk=True, index=index)
-        amo.search.get_es().flush_bulk(forced=True)
+    return docs
@@ -7,7 +7,9 @@ import amo
 import amo.tests
 from amo.urlresolvers import reverse
 from addons.models import Addon
+from compat.cron import compat_buckets, get_reports
 from compat.models import CompatReport
+from versions.compare import version_int as vint
 
 
 # This is the structure sent to /compatibility/incoming from the ACR.
@@ -39,6 +41,32 @@ class TestCompatReportModel(amo.tests.TestCase):
         eq_(CompatReport.get_counts(guid), {'success': 2, 'failure': 1})
 
 
+class TestCompatBuckets(amo.tests.TestCase):
+
+    def test_buckets(self):
+        versions = [c for c in amo.COMPAT if c['app'] == amo.FIREFOX.id]
+        bucket = compat_buckets(amo.FIREFOX)
+        for ver in ['3.0', '4.0', '4.0.1', '5.0a1', '5.0', '6.0', '99.0']:
+            ver = vint(ver)
+            major = [vint(v['main']) for v in versions
+                     if vint(v['previous']) < ver <= vint(v['main'])]
+            eq_(bucket(ver), major[0] if major else None)
+
+    def test_reports(self):
+        guid = '{2fa4ed95-0317-4c6a-a74c-5f3e3912c1f9}'
+        for version, works in [('5.0', True), ('5.0a1', True),
+                               ('5.0.1', False), ('4.0', False),
+                               ('1.0', False)]:
+            CompatReport.objects.create(guid=guid, works_properly=works,
+                                        app_guid=amo.FIREFOX.guid,
+                                        app_version=version)
+        CompatReport.objects.create(guid=guid, works_properly=False,
+                                    app_guid=amo.THUNDERBIRD.guid,
+                                    app_version='5.0')
+        reports = get_reports(amo.FIREFOX)
+        eq_(dict(reports[guid]), {vint('5.0'): [2, 1], vint('4.0'): [0, 1]})
+
+
 class TestIndex(amo.tests.TestCase):
 
     # TODO: Test valid version processing here.
@@ -0,0 +1,16 @@
+import commonware.log
+import cronjobs
+
+from editors.models import EditorQueue
+
+log = commonware.log.getLogger('z.cron')
+
+
+@cronjobs.register
+def reconcile_editor_queue():
+    """
+    Rebuild the editor queues from scratch, in case a change to an add-on
+    didn't go through the signals (e.g. a queryset update).
+    """
+    EditorQueue.refresh()
+    log.info('Editor queues rebuilt: %s' % EditorQueue.counts())
@@ -152,8 +152,8 @@ class QueueSearchForm(happyforms.Form):
         if data['application_id']:
             qs = qs.filter_raw('apps_match.application_id =',
                                data['application_id'])
-            # We join twice so it includes all apps, and not just the ones
-            # filtered by the search criteria.
+            # The apps shown come from the queue, so they include all apps
+            # and not just the ones filtered by the search criteria.
             app_join = ('LEFT JOIN applications_versions apps_match ON '
                         '(versions.id = apps_match.version_id)')
             qs.base_query['from'].extend([app_join])
@@ -166,15 +166,14 @@ class QueueSearchForm(happyforms.Form):
                 qs.base_query['from'].extend(joins)
                 qs = qs.filter_raw('max_version.version =',
                                    data['max_version'])
+                qs.base_query['group_by'] = 'id'
         if data['platform_ids']:
             qs = qs.filter_raw('files.platform_id IN', data['platform_ids'])
-            # Adjust _file_platform_ids so that it includes ALL platforms
-            # not the ones filtered by the search criteria:
+            # The platforms shown come from the queue, so they include ALL
+            # platforms and not the ones filtered by the search criteria.
             qs.base_query['from'].extend([
-                """LEFT JOIN files all_files
-                   ON (all_files.version_id = versions.id)"""])
-            group = 'GROUP_CONCAT(DISTINCT all_files.platform_id)'
-            qs.base_query['select']['_file_platform_ids'] = group
+                'JOIN files ON (files.version_id = versions.id)'])
+            qs.base_query['group_by'] = 'id'
         if data['text_query']:
             lang = get_language()
             joins = [
@@ -192,6 +191,7 @@ class QueueSearchForm(happyforms.Form):
                          ad_name_local.locale=%%(%s)s)"""
                          % qs._param(lang)]
             qs.base_query['from'].extend(joins)
+            qs.base_query['group_by'] = 'id'
             fuzzy_q = u'%' + data['text_query'] + u'%'
             qs = qs.filter_raw(
                     Q('addon_name LIKE', fuzzy_q) |
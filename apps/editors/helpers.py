@@ -18,9 +18,8 @@ from addons.models import Addon
 from amo.helpers import absolutify, breadcrumbs, page_title
 from amo.urlresolvers import reverse
 from amo.utils import send_mail as amo_send_mail
-from editors.models import (EscalationQueue, ReviewerScore, ViewFastTrackQueue,
-                            ViewFullReviewQueue, ViewPendingQueue,
-                            ViewPreliminaryQueue)
+from editors.models import (EscalationQueue, FastTrackQueue, FullReviewQueue,
+                            PendingQueue, PreliminaryQueue, ReviewerScore)
 from editors.sql_table import SQLTable
 from versions.models import Version
 
@@ -261,25 +260,25 @@ class EditorQueueTable(SQLTable, ItemStateTable):
 class ViewPendingQueueTable(EditorQueueTable):
 
     class Meta(EditorQueueTable.Meta):
-        model = ViewPendingQueue
+        model = PendingQueue
 
 
 class ViewFullReviewQueueTable(EditorQueueTable):
 
     class Meta(EditorQueueTable.Meta):
-        model = ViewFullReviewQueue
+        model = FullReviewQueue
 
 
 class ViewPreliminaryQueueTable(EditorQueueTable):
 
     class Meta(EditorQueueTable.Meta):
-        model = ViewPreliminaryQueue
+        model = PreliminaryQueue
 
 
 class ViewFastTrackQueueTable(EditorQueueTable):
 
     class Meta(EditorQueueTable.Meta):
-        model = ViewFastTrackQueue
+        model = FastTrackQueue
 
 
 log = commonware.log.getLogger('z.mailer')
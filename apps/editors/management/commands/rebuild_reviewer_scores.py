@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from editors.models import ReviewerScoreRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily reviewer score rollups from reviewer_scores'
+
+    def handle(self, *args, **options):
+        ReviewerScoreRollup.rebuild()
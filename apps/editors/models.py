@@ -1,3 +1,4 @@
+import bisect
 import copy
 import datetime
 
@@ -5,8 +6,9 @@ import waffle
 
 from django.conf import settings
 from django.core.cache import cache
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models import Sum
+from django.dispatch import receiver
 from django.template import Context, loader
 from django.utils.datastructures import SortedDict
 
@@ -17,13 +19,15 @@ import amo.models
 from access.models import Group
 from amo.helpers import absolutify
 from amo.urlresolvers import reverse
-from amo.utils import cache_ns_key, send_mail
+from amo.utils import (cache_ns_key, chunked, memoize, post_commit,
+                        send_mail)
 from addons.models import Addon, Persona
 from devhub.models import ActivityLog
 from editors.sql_model import RawSQLModel
+from files.models import File
 from translations.fields import save_signal, TranslatedField
 from users.models import UserProfile
-from versions.models import version_uploaded
+from versions.models import ApplicationsVersions, Version, version_uploaded
 
 import commonware.log
 
@@ -108,6 +112,8 @@ class ViewQueue(RawSQLModel):
     has_info_request = models.BooleanField()
     has_editor_comment = models.BooleanField()
     _application_ids = models.CharField(max_length=255)
+    latest_version_id = models.IntegerField()
+    waiting_since = models.DateTimeField()
     waiting_time_days = models.IntegerField()
     waiting_time_hours = models.IntegerField()
     waiting_time_min = models.IntegerField()
@@ -128,6 +134,7 @@ class ViewQueue(RawSQLModel):
                 ('binary_components', 'files.binary_components'),
                 ('premium_type', 'addons.premium_type'),
                 ('latest_version', 'versions.version'),
+                ('latest_version_id', 'versions.id'),
                 ('has_editor_comment', 'versions.has_editor_comment'),
                 ('has_info_request', 'versions.has_info_request'),
                 ('_file_platform_ids', """GROUP_CONCAT(DISTINCT
@@ -192,6 +199,7 @@ class ViewFullReviewQueue(ViewQueue):
     def base_query(self):
         q = super(ViewFullReviewQueue, self).base_query()
         q['select'].update({
+            'waiting_since': 'MAX(versions.nomination)',
             'waiting_time_days':
                 'TIMESTAMPDIFF(DAY, MAX(versions.nomination), NOW())',
             'waiting_time_hours':
@@ -212,6 +220,7 @@ class VersionSpecificQueue(ViewQueue):
     def base_query(self):
         q = copy.deepcopy(super(VersionSpecificQueue, self).base_query())
         q['select'].update({
+            'waiting_since': 'MAX(files.created)',
             'waiting_time_days':
                 'TIMESTAMPDIFF(DAY, MAX(files.created), NOW())',
             'waiting_time_hours':
@@ -258,6 +267,223 @@ class ViewFastTrackQueue(VersionSpecificQueue):
         return q
 
 
+class EditorQueue(models.Model):
+    """
+    The add-ons in each editor queue, materialized from the `ViewQueue`
+    queries by `refresh` when an add-on, its versions or files change. The
+    queue pages and counts read it instead of grouping the whole catalog.
+    """
+    addon = models.ForeignKey(Addon, related_name='+')
+    queue = models.CharField(max_length=20)
+    version = models.ForeignKey(Version, related_name='+')
+    addon_name = models.CharField(max_length=255, null=True)
+    binary = models.BooleanField(default=False)
+    binary_components = models.BooleanField(default=False)
+    is_jetpack = models.BooleanField(default=False)
+    is_restartless = models.BooleanField(default=False)
+    file_platform_ids = models.CharField(max_length=255, null=True)
+    application_ids = models.CharField(max_length=255, null=True)
+    waiting_since = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = 'editor_queue'
+        unique_together = ('queue', 'addon')
+
+    @classmethod
+    def refresh(cls, addons=None):
+        """
+        Brings the rows of the `addons` ids, or all the rows if `addons` is
+        None, in line with the `ViewQueue` queries. Only the rows that
+        changed are written, and the counts are invalidated only then.
+        """
+        if addons is not None:
+            addons = list(addons)
+            if not addons:
+                return
+        fields = [f for f in cls._meta.fields if not f.primary_key]
+        names = [f.attname for f in fields]
+        rows = {}
+        for queue, view in QUEUE_VIEWS.items():
+            qs = view.objects
+            if addons is not None:
+                qs = qs.filter_raw('addons.id IN', addons)
+            for row in qs:
+                rows[queue, row.id] = (
+                    row.id, queue, row.latest_version_id, row.addon_name,
+                    bool(row.binary), bool(row.binary_components),
+                    bool(row.is_jetpack), bool(row.is_restartless),
+                    row._file_platform_ids, row._application_ids,
+                    row.waiting_since)
+
+        qs = cls.objects.all()
+        if addons is not None:
+            qs = qs.filter(addon__in=addons)
+        stale = []
+        for values in qs.values_list('id', *names):
+            key = values[2], values[1]
+            if key not in rows:
+                stale.append(values[0])
+            elif rows[key] == tuple(values[1:]):
+                del rows[key]
+        if not rows and not stale:
+            return
+
+        # The rows are upserted on `(queue, addon)`: another refresh of the
+        # same add-on can't make this one fail on the unique key.
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        columns = [qn(f.column) for f in fields]
+        updates = ', '.join('%s = VALUES(%s)' % (c, c) for c in columns)
+        placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+        cursor = connection.cursor()
+        for chunk in chunked(rows.values(), 100):
+            cursor.execute(
+                'INSERT INTO %s (%s) VALUES %s ON DUPLICATE KEY UPDATE %s' %
+                (table, ', '.join(columns),
+                 ', '.join([placeholders] * len(chunk)), updates),
+                [f.get_db_prep_save(value, connection=connection)
+                 for row in chunk for f, value in zip(fields, row)])
+        for chunk in chunked(stale, 500):
+            cursor.execute('DELETE FROM %s WHERE id IN (%s)' %
+                           (table, ', '.join(['%s'] * len(chunk))), chunk)
+        transaction.commit_unless_managed()
+        cache_ns_key('editor-queue', increment=True)
+
+    @classmethod
+    @memoize('editor-queue:counts', time=0, namespace='editor-queue')
+    def counts(cls):
+        """Returns `{queue: count}`, cached until a queue changes."""
+        return dict(cls.objects.values_list('queue')
+                    .annotate(models.Count('id')).order_by())
+
+
+class MaterializedQueue(ViewQueue):
+    """A queue read from `EditorQueue`, with the same columns as its view."""
+    queue = None
+
+    def base_query(self):
+        waiting = 'TIMESTAMPDIFF(%s, q.waiting_since, NOW())'
+        return {
+            'select': SortedDict([
+                ('id', 'q.addon_id'),
+                ('addon_name', 'q.addon_name'),
+                ('addon_status', 'addons.status'),
+                ('addon_type_id', 'addons.addontype_id'),
+                ('addon_slug', 'addons.slug'),
+                ('admin_review', 'addons.adminreview'),
+                ('is_site_specific', 'addons.sitespecific'),
+                ('external_software', 'addons.externalsoftware'),
+                ('binary', 'q.binary'),
+                ('binary_components', 'q.binary_components'),
+                ('premium_type', 'addons.premium_type'),
+                ('latest_version', 'versions.version'),
+                ('latest_version_id', 'versions.id'),
+                ('has_editor_comment', 'versions.has_editor_comment'),
+                ('has_info_request', 'versions.has_info_request'),
+                ('_file_platform_ids', 'q.file_platform_ids'),
+                ('is_jetpack', 'q.is_jetpack'),
+                ('is_restartless', 'q.is_restartless'),
+                ('_application_ids', 'q.application_ids'),
+                ('waiting_since', 'q.waiting_since'),
+                ('waiting_time_days', waiting % 'DAY'),
+                ('waiting_time_hours', waiting % 'HOUR'),
+                ('waiting_time_min', waiting % 'MINUTE'),
+            ]),
+            'from': [
+                'editor_queue AS q',
+                'JOIN addons ON (addons.id = q.addon_id)',
+                'JOIN versions ON (versions.id = q.version_id)',
+            ],
+            'where': ["q.queue = '%s'" % self.queue],
+        }
+
+
+class FullReviewQueue(MaterializedQueue):
+    queue = 'nominated'
+
+
+class PendingQueue(MaterializedQueue):
+    queue = 'pending'
+    is_version_specific = True
+
+
+class PreliminaryQueue(MaterializedQueue):
+    queue = 'prelim'
+    is_version_specific = True
+
+
+class FastTrackQueue(MaterializedQueue):
+    queue = 'fast_track'
+    is_version_specific = True
+
+
+QUEUE_VIEWS = SortedDict([('fast_track', ViewFastTrackQueue),
+                          ('nominated', ViewFullReviewQueue),
+                          ('pending', ViewPendingQueue),
+                          ('prelim', ViewPreliminaryQueue)])
+
+
+# The fields the queue queries read, by model: saving an add-on, version or
+# file only refreshes its queues when one of them changed.
+QUEUE_FIELDS = {
+    Addon: ('status', 'disabled_by_user', 'type', 'name', 'default_locale',
+            'latest_version'),
+    Version: ('addon', 'nomination', 'deleted'),
+    File: ('version', 'status', 'binary', 'binary_components', 'platform',
+           'jetpack_version', 'no_restart', 'requires_chrome'),
+}
+
+
+def queue_fields_changed(sender, old_attr, new_attr):
+    """Whether an on_change of `sender` changed a field in `QUEUE_FIELDS`."""
+    if old_attr.get('id') is None:
+        return True
+    for name in QUEUE_FIELDS[sender]:
+        field = sender._meta.get_field(name)
+        if field.attname in new_attr:
+            new = new_attr[field.attname]
+        elif field.name in new_attr:
+            # update(latest_version=...) passes the object.
+            new = getattr(new_attr[field.name], 'pk', new_attr[field.name])
+        else:
+            continue
+        if new != old_attr.get(field.attname):
+            return True
+    return False
+
+
+def update_editor_queue(sender, instance, **kw):
+    """
+    Refreshes the queues of the add-on of `instance` once the change is
+    committed, if it touched what the queues read.
+    """
+    if kw.get('raw') or settings.MARKETPLACE:
+        return
+    if 'old_attr' in kw and not queue_fields_changed(
+            sender, kw['old_attr'], kw['new_attr']):
+        return
+    if issubclass(sender, Addon):
+        addons = [instance.id]
+    elif issubclass(sender, Version):
+        addons = [instance.addon_id]
+    else:
+        addons = list(Version.with_deleted.filter(id=instance.version_id)
+                      .values_list('addon', flat=True))
+    from . import tasks
+    post_commit(tasks.refresh_editor_queue.delay, addons)
+
+
+for _sender in (Addon, Version, File):
+    _sender.on_change(update_editor_queue)
+models.signals.post_save.connect(
+    update_editor_queue, sender=ApplicationsVersions,
+    dispatch_uid='editor_queue_save_ApplicationsVersions')
+for _sender in (Addon, Version, File, ApplicationsVersions):
+    models.signals.post_delete.connect(
+        update_editor_queue, sender=_sender,
+        dispatch_uid='editor_queue_delete_%s' % _sender.__name__)
+
+
 class PerformanceGraph(ViewQueue):
     id = models.IntegerField()
     yearmonth = models.CharField(max_length=7)
@@ -414,7 +640,6 @@ class ReviewerScore(amo.models.ModelBase):
         if score:
             cls.objects.create(user=user, addon=addon, score=score,
                                note_key=event)
-            cls.get_key(invalidate=True)
             user_log.info(
                 u'Awarding %s points to user %s for "%s" for addon %s' % (
                     score, user, amo.REVIEWED_CHOICES[event], addon.id))
@@ -431,7 +656,6 @@ class ReviewerScore(amo.models.ModelBase):
         score = amo.REVIEWED_SCORES.get(event)
 
         cls.objects.create(user=user, addon=addon, score=score, note_key=event)
-        cls.get_key(invalidate=True)
         user_log.info(
             u'Awarding %s points to user %s for "%s" for review %s' % (
                 score, user, amo.REVIEWED_CHOICES[event], review_id))
@@ -444,9 +668,9 @@ class ReviewerScore(amo.models.ModelBase):
         if val is not None:
             return val
 
-        val = (ReviewerScore.uncached.filter(user=user)
-                                     .aggregate(total=Sum('score'))
-                                     .values())[0]
+        val = (ReviewerScoreRollup.objects.filter(user=user)
+                                          .aggregate(total=Sum('score'))
+                                          .values())[0]
         if val is None:
             val = 0
 
@@ -513,24 +737,32 @@ class ReviewerScore(amo.models.ModelBase):
         return val
 
     @classmethod
-    def _leaderboard_query(cls, since=None, types=None):
+    def get_leaderboard(cls, since=None, types=None):
         """
-        Returns common SQL to leaderboard calls.
+        Returns the `Leaderboard` of the points since the given date, of the
+        given types, built from the daily rollups.
         """
-        query = (cls.objects
+        key = cls.get_key('get_leaderboard:%s:%s' % (
+            since.isoformat() if since else '',
+            ','.join(map(str, sorted(types))) if types else ''))
+        val = cache.get(key)
+        if val is not None:
+            return val
+
+        query = (ReviewerScoreRollup.objects
                     .values_list('user__id', 'user__display_name')
                     .annotate(total=Sum('score'))
                     .exclude(user__groups__name__in=('No Reviewer Incentives',
                                                      'Staff', 'Admins'))
-                    .order_by('-total'))
-
+                    .order_by())
         if since is not None:
-            query = query.filter(created__gte=since)
-
+            query = query.filter(date__gte=since)
         if types is not None:
             query = query.filter(note_key__in=types)
 
-        return query
+        val = Leaderboard(query)
+        cache.set(key, val, 0)
+        return val
 
     @classmethod
     def get_leaderboards(cls, user, days=7, types=None):
@@ -547,68 +779,35 @@ class ReviewerScore(amo.models.ModelBase):
         elements instead of the normal 3.
 
         """
-        key = cls.get_key('get_leaderboards:%s' % user.id)
-        val = cache.get(key)
-        if val is not None:
-            return val
-
         week_ago = datetime.date.today() - datetime.timedelta(days=days)
+        leaderboard = cls.get_leaderboard(since=week_ago, types=types)
 
-        leader_top = []
-        leader_near = []
-
-        query = cls._leaderboard_query(since=week_ago, types=types)
-        scores = []
-
-        user_rank = 0
-        in_leaderboard = False
-        for rank, row in enumerate(query, 1):
-            user_id, name, total = row
-            scores.append({
-                'user_id': user_id,
-                'name': name,
-                'rank': rank,
-                'total': int(total),
-            })
-            if user_id == user.id:
-                user_rank = rank
-                in_leaderboard = True
-
-        if not in_leaderboard:
-            leader_top = scores[:5]
+        user_rank = leaderboard.rank(user.id)
+        if user_rank <= 5:  # User is in top 5 or not in the leaderboard.
+            leader_top = leaderboard.top(5)
+            leader_near = []
         else:
-            if user_rank <= 5:  # User is in top 5, show top 5.
-                leader_top = scores[:5]
-            else:
-                leader_top = scores[:3]
-                leader_near = [scores[user_rank - 2], scores[user_rank - 1]]
-                try:
-                    leader_near.append(scores[user_rank])
-                except IndexError:
-                    pass  # User is last on the leaderboard.
-
-        val = {
+            leader_top = leaderboard.top(3)
+            leader_near = leaderboard.near(user_rank)
+
+        return {
             'leader_top': leader_top,
             'leader_near': leader_near,
             'user_rank': user_rank,
         }
-        cache.set(key, val, 0)
-        return val
 
     @classmethod
     def all_users_by_score(cls):
         """
         Returns reviewers ordered by highest total points first.
         """
-        query = cls._leaderboard_query()
         scores = []
         prev = None
 
-        for row in query:
-            user_id, name, total = row
+        for row in cls.get_leaderboard().scores:
             user_level = len(amo.REVIEWED_LEVELS) - 1
             for i, level in enumerate(amo.REVIEWED_LEVELS):
-                if total < level['points']:
+                if row['total'] < level['points']:
                     user_level = i
                     break
 
@@ -620,15 +819,137 @@ class ReviewerScore(amo.models.ModelBase):
                 prev = level
 
             scores.append({
-                'user_id': user_id,
-                'name': name,
-                'total': int(total),
+                'user_id': row['user_id'],
+                'name': row['name'],
+                'total': row['total'],
                 'level': level,
             })
 
         return scores
 
 
+class ReviewerScoreRollup(models.Model):
+    """
+    The points of each user per day and event, kept up to date as reviewer
+    scores are saved and deleted, so the totals and leaderboards don't add
+    up every row of `reviewer_scores`.
+    """
+    user = models.ForeignKey(UserProfile, related_name='+')
+    date = models.DateField()
+    note_key = models.SmallIntegerField(default=0)
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'reviewer_score_rollups'
+        unique_together = ('user', 'date', 'note_key')
+
+    @classmethod
+    def add(cls, user_id, score, note_key, date=None):
+        """Adds `score` points to the rollup of the day, in one statement."""
+        cursor = connection.cursor()
+        cursor.execute("""
+            INSERT INTO reviewer_score_rollups (user_id, date, note_key, score)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE score = score + VALUES(score)""",
+            [user_id, date or datetime.date.today(), note_key, score])
+        transaction.commit_unless_managed()
+
+    @classmethod
+    def rebuild(cls):
+        """Rebuilds all the rollups from `reviewer_scores`."""
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM reviewer_score_rollups')
+        cursor.execute("""
+            INSERT INTO reviewer_score_rollups (user_id, date, note_key, score)
+            SELECT user_id, DATE(created), note_key, SUM(score)
+            FROM reviewer_scores
+            GROUP BY user_id, DATE(created), note_key""")
+        transaction.commit_unless_managed()
+        ReviewerScore.get_key(invalidate=True)
+
+
+# The (user, day, event, score) of the reviewer scores being saved, by id,
+# as they were before the save.
+_saved_scores = {}
+
+
+def _score_rollup(user_id, created, note_key, score):
+    return user_id, created.date(), note_key, score
+
+
+@receiver(models.signals.pre_save, sender=ReviewerScore,
+          dispatch_uid='reviewer_score_rollup_before')
+def reviewer_score_before_save(sender, instance, **kw):
+    if kw.get('raw') or not instance.id:
+        return
+    old = (ReviewerScore.uncached.filter(id=instance.id)
+           .values_list('user', 'created', 'note_key', 'score'))
+    if old:
+        _saved_scores[instance.id] = _score_rollup(*old[0])
+
+
+@receiver(models.signals.post_save, sender=ReviewerScore,
+          dispatch_uid='reviewer_score_rollup_save')
+def reviewer_score_saved(sender, instance, **kw):
+    """Moves the points of an added or edited score to its rollup."""
+    if kw.get('raw'):
+        return
+    old = _saved_scores.pop(instance.id, None)
+    new = _score_rollup(instance.user_id, instance.created,
+                        instance.note_key, instance.score)
+    if old == new:
+        return
+    if old:
+        user_id, date, note_key, score = old
+        ReviewerScoreRollup.add(user_id, -score, note_key, date)
+    user_id, date, note_key, score = new
+    ReviewerScoreRollup.add(user_id, score, note_key, date)
+    ReviewerScore.get_key(invalidate=True)
+
+
+@receiver(models.signals.post_delete, sender=ReviewerScore,
+          dispatch_uid='reviewer_score_rollup_delete')
+def reviewer_score_deleted(sender, instance, **kw):
+    """Takes the points of a deleted score off its rollup."""
+    ReviewerScoreRollup.add(instance.user_id, -instance.score,
+                            instance.note_key, instance.created.date())
+    ReviewerScore.get_key(invalidate=True)
+
+
+class Leaderboard(object):
+    """
+    Reviewers ranked by total points, highest first, from `(user id, name,
+    total)` rows. The rank of a user is found by bisection.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(((int(total), user_id, name)
+                       for user_id, name, total in rows),
+                      key=lambda r: (-r[0], r[1]))
+        self.keys = [(-total, user_id) for total, user_id, name in rows]
+        self.totals = dict((user_id, total) for total, user_id, name in rows)
+        self.scores = [{'user_id': user_id, 'name': name, 'rank': rank,
+                        'total': total}
+                       for rank, (total, user_id, name) in enumerate(rows, 1)]
+
+    def __len__(self):
+        return len(self.scores)
+
+    def rank(self, user_id):
+        """The rank of the user, 0 if not in the leaderboard."""
+        if user_id not in self.totals:
+            return 0
+        return bisect.bisect_left(self.keys,
+                                  (-self.totals[user_id], user_id)) + 1
+
+    def top(self, limit):
+        return self.scores[:limit]
+
+    def near(self, rank):
+        """The users ranked right before and after `rank`, and that one."""
+        return self.scores[max(rank - 2, 0):rank + 1]
+
+
 class EscalationQueue(amo.models.ModelBase):
     addon = models.ForeignKey(Addon)
 
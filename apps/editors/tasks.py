@@ -6,6 +6,7 @@ from celeryutils import task
 from hera.contrib.django_utils import flush_urls
 
 from devhub.models import ActivityLog, CommentLog, VersionLog
+from editors.models import EditorQueue
 from versions.models import Version
 
 log = commonware.log.getLogger('z.task')
@@ -50,3 +51,8 @@ def add_versionlog(items, **kw):
                 vl.created = al.created
                 vl.save()
 
+
+@task
+def refresh_editor_queue(addons, **kw):
+    """Brings the editor queue rows of the `addons` ids up to date."""
+    EditorQueue.refresh(addons)
@@ -4,15 +4,19 @@ import time
 
 from django.core import mail
 
+import mock
 from nose.tools import eq_
 
 import amo
 import amo.tests
 from addons.models import Addon
+from amo.utils import cache_ns_key
 from versions.models import Version, version_uploaded, ApplicationsVersions
 from files.models import Platform, File
 from applications.models import Application, AppVersion
-from editors.models import (EditorSubscription, RereviewQueue, ReviewerScore,
+from editors.models import (EditorQueue, EditorSubscription,
+                            FullReviewQueue, Leaderboard, PendingQueue,
+                            RereviewQueue, ReviewerScore, ReviewerScoreRollup,
                             send_notifications, ViewFastTrackQueue,
                             ViewFullReviewQueue, ViewPendingQueue,
                             ViewPreliminaryQueue)
@@ -318,6 +322,72 @@ class TestFastTrackQueue(TestQueue):
         eq_(self.query(), ['full'])
 
 
+class TestEditorQueue(amo.tests.TestCase):
+
+    def test_signals(self):
+        ad = create_addon_file('Nominated', '0.1', amo.STATUS_NOMINATED,
+                               amo.STATUS_UNREVIEWED)
+        eq_(EditorQueue.counts(), {'nominated': 1})
+        row = FullReviewQueue.objects.get()
+        eq_(row.id, ad['addon'].id)
+        eq_(row.latest_version_id, ad['version'].id)
+        eq_(row.addon_name, u'Nominated')
+
+        ad['addon'].update(status=amo.STATUS_PUBLIC)
+        eq_(EditorQueue.counts(), {'pending': 1})
+        eq_(PendingQueue.objects.get().id, ad['addon'].id)
+
+        ad['file'].update(status=amo.STATUS_PUBLIC)
+        eq_(EditorQueue.counts(), {})
+
+    def test_refresh(self):
+        ad = create_addon_file('Nominated', '0.1', amo.STATUS_NOMINATED,
+                               amo.STATUS_UNREVIEWED)
+        # Queryset updates don't send signals.
+        Addon.objects.filter(id=ad['addon'].id).update(
+            status=amo.STATUS_PUBLIC)
+        eq_(EditorQueue.counts(), {'nominated': 1})
+        EditorQueue.refresh()
+        eq_(EditorQueue.counts(), {'pending': 1})
+
+    def test_waiting_time(self):
+        ad = create_addon_file('Nominated', '0.1', amo.STATUS_NOMINATED,
+                               amo.STATUS_UNREVIEWED)
+        ad['version'].update(nomination=self.days_ago(3))
+        eq_(FullReviewQueue.objects.get().waiting_time_days, 3)
+
+    @mock.patch.object(EditorQueue, 'refresh')
+    def test_unrelated_change(self, refresh):
+        ad = create_addon_file('Nominated', '0.1', amo.STATUS_NOMINATED,
+                               amo.STATUS_UNREVIEWED)
+        refresh.reset_mock()
+        ad['addon'].update(average_daily_users=10)
+        ad['version'].update(has_info_request=True)
+        ad['file'].update(size=1024)
+        assert not refresh.called
+        ad['file'].update(status=amo.STATUS_PUBLIC)
+        refresh.assert_called_with([ad['addon'].id])
+
+    def test_refresh_unchanged(self):
+        create_addon_file('Nominated', '0.1', amo.STATUS_NOMINATED,
+                          amo.STATUS_UNREVIEWED)
+        key = cache_ns_key('editor-queue')
+        EditorQueue.refresh()
+        eq_(cache_ns_key('editor-queue'), key)
+
+    def test_refresh_updates_in_place(self):
+        ad = create_addon_file('Nominated', '0.1', amo.STATUS_NOMINATED,
+                               amo.STATUS_UNREVIEWED)
+        row = EditorQueue.objects.get()
+        Version.objects.filter(id=ad['version'].id).update(
+            nomination=self.days_ago(3))
+        key = cache_ns_key('editor-queue')
+        EditorQueue.refresh([ad['addon'].id])
+        assert cache_ns_key('editor-queue') != key
+        eq_(EditorQueue.objects.get().id, row.id)
+        eq_(FullReviewQueue.objects.get().waiting_time_days, 3)
+
+
 class TestEditorSubscription(amo.tests.TestCase):
     fixtures = ['base/addon_3615', 'base/users']
 
@@ -589,6 +659,59 @@ class TestReviewerScore(amo.tests.TestCase):
         eq_(users[1]['user_id'], user2.id)
         eq_(users[1]['level'], '')
 
+    def test_rollup(self):
+        user2 = UserProfile.objects.get(email='regular@mozilla.com')
+        self._give_points()
+        self._give_points()
+        self._give_points(user=user2, status=amo.STATUS_LITE)
+        rollups = ReviewerScoreRollup.objects.order_by('user')
+        eq_([(r.user_id, r.note_key, r.score) for r in rollups],
+            sorted([(self.user.id, amo.REVIEWED_ADDON_FULL,
+                     amo.REVIEWED_SCORES[amo.REVIEWED_ADDON_FULL] * 2),
+                    (user2.id, amo.REVIEWED_ADDON_PRELIM,
+                     amo.REVIEWED_SCORES[amo.REVIEWED_ADDON_PRELIM])]))
+
+    def test_rollup_rebuild(self):
+        self._give_points()
+        self._give_points(status=amo.STATUS_LITE)
+        (ReviewerScore.objects.filter(note_key=amo.REVIEWED_ADDON_FULL)
+                              .update(created=self.days_ago(10)))
+        ReviewerScoreRollup.objects.all().delete()
+        ReviewerScoreRollup.rebuild()
+        eq_(ReviewerScoreRollup.objects.count(), 2)
+        eq_(ReviewerScore.get_total(self.user),
+            amo.REVIEWED_SCORES[amo.REVIEWED_ADDON_FULL] +
+            amo.REVIEWED_SCORES[amo.REVIEWED_ADDON_PRELIM])
+        leaders = ReviewerScore.get_leaderboards(self.user)
+        eq_(leaders['leader_top'][0]['total'],
+            amo.REVIEWED_SCORES[amo.REVIEWED_ADDON_PRELIM])
+
+    def test_rollup_manual_score(self):
+        # Like an admin adding, editing and deleting points by hand.
+        score = ReviewerScore.objects.create(user=self.user, score=50,
+                                             note='Thanks')
+        eq_(ReviewerScore.get_total(self.user), 50)
+        score.score = 20
+        score.save()
+        eq_(ReviewerScore.get_total(self.user), 20)
+        score.update(score=30)
+        eq_(ReviewerScore.get_total(self.user), 30)
+        eq_(ReviewerScoreRollup.objects.get().score, 30)
+        score.delete()
+        eq_(ReviewerScore.get_total(self.user), 0)
+        eq_(ReviewerScoreRollup.objects.get().score, 0)
+
+    def test_leaderboard(self):
+        leaderboard = Leaderboard([(i, 'user %s' % i, 10 * (i % 4))
+                                   for i in range(1, 9)])
+        eq_([(s['user_id'], s['rank']) for s in leaderboard.top(3)],
+            [(3, 1), (7, 2), (2, 3)])
+        eq_(leaderboard.rank(7), 2)
+        eq_(leaderboard.rank(8), 8)
+        eq_(leaderboard.rank(9), 0)
+        eq_([s['user_id'] for s in leaderboard.near(5)], [6, 1, 5])
+        eq_([s['user_id'] for s in leaderboard.near(8)], [4, 8])
+
     def test_caching(self):
         self._give_points()
 
@@ -23,7 +23,7 @@ from amo.urlresolvers import reverse
 from amo.utils import urlparams
 from applications.models import Application
 from devhub.models import ActivityLog
-from editors.models import EditorSubscription, ReviewerScore
+from editors.models import EditorQueue, EditorSubscription, ReviewerScore
 from files.models import File
 from reviews.models import Review, ReviewFlag
 from users.models import UserProfile
@@ -1317,26 +1317,31 @@ class TestQueueSearch(SearchTest):
         title = 'Justin Bieber Theme'
         bieber = Version.objects.filter(addon__name__localized_string=title)
 
+        def update_bieber(days):
+            # Queryset updates don't send signals, reconcile the queue.
+            bieber.update(nomination=datetime.now() - timedelta(days=days))
+            EditorQueue.refresh()
+
         # Exclude anything out of range:
-        bieber.update(nomination=datetime.now() - timedelta(days=5))
+        update_bieber(5)
         r = self.search(waiting_time_days=2)
         addons = self.named_addons(r)
         assert title not in addons, ('Unexpected results: %r' % addons)
 
         # Include anything submitted up to requested days:
-        bieber.update(nomination=datetime.now() - timedelta(days=2))
+        update_bieber(2)
         r = self.search(waiting_time_days=5)
         addons = self.named_addons(r)
         assert title in addons, ('Unexpected results: %r' % addons)
 
         # Special case: exclude anything under 10 days:
-        bieber.update(nomination=datetime.now() - timedelta(days=8))
+        update_bieber(8)
         r = self.search(waiting_time_days='10+')
         addons = self.named_addons(r)
         assert title not in addons, ('Unexpected results: %r' % addons)
 
         # Special case: include anything 10 days and over:
-        bieber.update(nomination=datetime.now() - timedelta(days=12))
+        update_bieber(12)
         r = self.search(waiting_time_days='10+')
         addons = self.named_addons(r)
         assert title in addons, ('Unexpected results: %r' % addons)
@@ -1394,6 +1399,8 @@ class TestQueueSearchVersionSpecific(SearchTest):
         new_created = datetime.now() - timedelta(days=days)
         self.bieber.update(created=new_created)
         self.bieber[0].files.update(created=new_created)
+        # Queryset updates don't send signals, reconcile the queue.
+        EditorQueue.refresh()
 
     def test_age_of_submission(self):
         Version.objects.update(created=datetime.now() - timedelta(days=1))
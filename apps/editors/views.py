@@ -26,11 +26,9 @@ from amo.utils import paginate
 from amo.urlresolvers import reverse
 from devhub.models import ActivityLog, CommentLog
 from editors import forms
-from editors.models import (AddonCannedResponse, EditorSubscription, EventLog,
-                            PerformanceGraph, ReviewerScore,
-                            ViewFastTrackQueue, ViewFullReviewQueue,
-                            ViewPendingQueue, ViewPreliminaryQueue,
-                            ViewQueue)
+from editors.models import (AddonCannedResponse, EditorQueue,
+                            EditorSubscription, EventLog, PerformanceGraph,
+                            ReviewerScore, ViewQueue)
 from editors.helpers import (ViewFastTrackQueueTable, ViewFullReviewQueueTable,
                              ViewPendingQueueTable, ViewPreliminaryQueueTable)
 from reviews.forms import ReviewFlagFormSet
@@ -353,24 +351,26 @@ def _queue(request, TableObj, tab, qs=None):
 
 
 def queue_counts(type=None, **kw):
-    def construct_query(query_type, days_min=None, days_max=None):
-        def apply_query(query, *args):
-            query = query.having(*args)
-            return query
-
-        query = query_type.objects
+    def construct_query(queue, days_min=None, days_max=None):
+        if not days_min and not days_max:
+            return lambda: EditorQueue.counts().get(queue, 0)
 
+        # Whole days waited, like TIMESTAMPDIFF(DAY, waiting_since, NOW()).
+        now = datetime.now()
+        query = EditorQueue.objects.filter(queue=queue)
         if days_min:
-            query = apply_query(query, 'waiting_time_days >=', days_min)
+            query = query.filter(
+                waiting_since__lte=now - timedelta(days=days_min))
         if days_max:
-            query = apply_query(query, 'waiting_time_days <=', days_max)
+            query = query.filter(
+                waiting_since__gt=now - timedelta(days=days_max + 1))
 
         return query.count
 
-    counts = {'pending': construct_query(ViewPendingQueue, **kw),
-              'nominated': construct_query(ViewFullReviewQueue, **kw),
-              'prelim': construct_query(ViewPreliminaryQueue, **kw),
-              'fast_track': construct_query(ViewFastTrackQueue, **kw),
+    counts = {'pending': construct_query('pending', **kw),
+              'nominated': construct_query('nominated', **kw),
+              'prelim': construct_query('prelim', **kw),
+              'fast_track': construct_query('fast_track', **kw),
               'moderated': (
                   Review.objects.exclude(addon__type=amo.ADDON_WEBAPP)
                                 .filter(reviewflag__isnull=False,
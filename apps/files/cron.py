@@ -15,27 +15,51 @@ from files.models import FileValidation
 log = commonware.log.getLogger('z.cron')
 
 
+def _tree_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name))[stat.ST_SIZE]
+            except OSError:
+                pass
+    return size
+
+
 @cronjobs.register
 def cleanup_extracted_file():
+    """
+    Removes the least recently used trees extracted for the file viewer
+    until they fit in FILE_VIEWER_DISK_BUDGET.
+    """
     log.info('Removing extracted files for file viewer.')
     root = os.path.join(settings.TMP_PATH, 'file_viewer')
+    trees = []
     for path in os.listdir(root):
         full = os.path.join(root, path)
-        age = time.time() - os.stat(full)[stat.ST_ATIME]
-        if (age) > (60 * 60):
-            log.debug('Removing extracted files: %s, %dsecs old.' % (full, age))
-            shutil.rmtree(full)
-            # Nuke out the file and diff caches when the file gets removed.
-            id = os.path.basename(path)
-            try:
-                int(id)
-            except ValueError:
-                continue
-
-            key = hashlib.md5()
-            key.update(str(id))
-            cache.delete('%s:memoize:%s:%s' % (settings.CACHE_PREFIX,
-                                               'file-viewer', key.hexdigest()))
+        # The viewer touches the trees it uses.
+        trees.append((os.stat(full)[stat.ST_MTIME], _tree_size(full), path))
+
+    used = sum(size for mtime, size, path in trees)
+    for mtime, size, path in sorted(trees):
+        if used <= settings.FILE_VIEWER_DISK_BUDGET:
+            break
+        full = os.path.join(root, path)
+        log.debug('Removing extracted files: %s, %dsecs old.'
+                  % (full, time.time() - mtime))
+        shutil.rmtree(full)
+        used -= size
+        # Nuke out the file and diff caches when the file gets removed.
+        # Trees named after a hash have a manifest instead.
+        try:
+            int(path)
+        except ValueError:
+            continue
+
+        key = hashlib.md5()
+        key.update(str(path))
+        cache.delete('%s:memoize:%s:%s' % (settings.CACHE_PREFIX,
+                                           'file-viewer', key.hexdigest()))
 
 
 @cronjobs.register
@@ -3,8 +3,10 @@ import json
 import mimetypes
 import os
 import stat
+import uuid
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import default_storage as storage
 from django.utils.datastructures import SortedDict
 from django.utils.encoding import smart_unicode
@@ -16,8 +18,9 @@ from jingo import register, env
 from tower import ugettext as _
 
 import amo
-from amo.utils import memoize, Message, rm_local_tmp_dir
+from amo.utils import memoize, rm_local_tmp_dir, smart_path
 from amo.urlresolvers import reverse
+from files.models import FileManifest
 from files.utils import extract_xpi, get_md5
 from validator.testcases.packagelayout import (blacklisted_extensions,
                                                blacklisted_magic_numbers)
@@ -29,6 +32,9 @@ blacklisted_extensions = [b for b in list(blacklisted_extensions)
                             if b != 'sh']
 task_log = commonware.log.getLogger('z.task')
 
+# Seconds an extraction holds its lock on the extracted tree, at most.
+EXTRACTION_TIMEOUT = 60 * 5
+
 
 @register.function
 def file_viewer_class(value, key):
@@ -65,6 +71,9 @@ class FileViewer(object):
     Provide access to a storage-managed file by copying it locally and
     extracting info from it. `src` is a storage-managed path and `dest` is a
     local temp path.
+
+    Files with the same hash share the same `dest` and the same manifest,
+    the list of the files inside them (see `FileManifest`).
     """
 
     def __init__(self, file_obj, is_webapp=False):
@@ -72,41 +81,62 @@ class FileViewer(object):
         self.addon = self.file.version.addon
         self.is_webapp = is_webapp
         self.src = file_obj.file_path
+        # Search engines are copied under their own filename, so they can't
+        # be shared.
+        self.hash = ('' if self.is_search_engine() else
+                     file_obj.hash.split(':')[-1])
         self.dest = os.path.join(settings.TMP_PATH, 'file_viewer',
-                                 str(file_obj.pk))
+                                 self.hash or str(file_obj.pk))
         self._files, self.selected = None, None
 
     def __str__(self):
         return str(self.file.id)
 
     def _extraction_cache_key(self):
+        # Keyed like `dest`, which is shared by the files with the same hash.
         return ('%s:file-viewer:extraction-in-progress:%s' %
-                (settings.CACHE_PREFIX, self.file.id))
+                (settings.CACHE_PREFIX, os.path.basename(self.dest)))
 
     def extract(self):
         """
-        Will make all the directories and expand the files.
-        Raises error on nasty files.
+        Will make all the directories and expand the files, then save their
+        manifest. Raises error on nasty files.
+
+        The files are expanded next to `dest` and moved there once they're
+        all in, under a lock shared by the files with the same hash. Returns
+        False, without extracting anything, if the lock is taken.
         """
+        key = self._extraction_cache_key()
+        if not cache.add(key, True, EXTRACTION_TIMEOUT):
+            return False
+        try:
+            self._extract()
+            if self.hash:
+                FileManifest.save_entries(self.hash, self._read_manifest())
+        finally:
+            cache.delete(key)
+        return True
+
+    def _extract(self):
         try:
             os.makedirs(os.path.dirname(self.dest))
         except OSError, err:
             pass
 
+        tmp = '%s.%s.tmp' % (self.dest, uuid.uuid4().hex)
         if self.is_search_engine() and self.src.endswith('.xml'):
-            try:
-                os.makedirs(self.dest)
-            except OSError, err:
-                pass
+            os.makedirs(tmp)
             copyfileobj(storage.open(self.src),
-                        open(os.path.join(self.dest,
-                                          self.file.filename), 'w'))
+                        open(os.path.join(tmp, self.file.filename), 'w'))
         else:
             try:
-                extract_xpi(self.src, self.dest, expand=True)
+                extract_xpi(self.src, tmp, expand=True)
             except Exception, err:
                 task_log.error('Error (%s) extracting %s' % (err, self.src))
                 raise
+        if os.path.exists(self.dest):
+            rm_local_tmp_dir(self.dest)
+        os.rename(tmp, self.dest)
 
     def cleanup(self):
         if os.path.exists(self.dest):
@@ -118,8 +148,16 @@ class FileViewer(object):
 
     def is_extracted(self):
         """If the file has been extracted or not."""
-        return (os.path.exists(self.dest) and not
-                Message(self._extraction_cache_key()).get())
+        extracted = (os.path.exists(self.dest) and not
+                     cache.get(self._extraction_cache_key()))
+        if extracted:
+            # The least recently used trees are removed first, see
+            # files.cron.cleanup_extracted_file.
+            try:
+                os.utime(self.dest, None)
+            except OSError:
+                pass
+        return extracted
 
     def _is_binary(self, mimetype, path):
         """Uses the filename to see if the file can be shown in HTML or not."""
@@ -255,15 +293,32 @@ class FileViewer(object):
         if self._files:
             return self._files
 
-        if not self.is_extracted():
-            return {}
         # In case a cron job comes along and deletes the files
         # mid tree building.
         try:
-            self._files = self._get_files()
-            return self._files
+            entries = self.get_manifest()
         except (OSError, IOError):
             return {}
+        if entries is None:
+            return {}
+        self._files = self._get_files(entries)
+        return self._files
+
+    def get_manifest(self):
+        """
+        Returns the entries of the files inside the file, or None if they
+        aren't known and the file isn't extracted.
+
+        The entries of a file with a hash are saved by `extract`, so that
+        listing and diffing the files don't need them extracted again.
+        """
+        if self.hash:
+            entries = FileManifest.get_entries(self.hash)
+            if entries is not None:
+                return entries
+        if not self.is_extracted():
+            return None
+        return self._read_manifest()
 
     def truncate(self, filename, pre_length=15,
                  post_length=10, ellipsis=u'..'):
@@ -303,8 +358,9 @@ class FileViewer(object):
         return 'plain'
 
     @memoize(prefix='file-viewer', time=60 * 60)
-    def _get_files(self):
-        all_files, res = [], SortedDict()
+    def _read_manifest(self):
+        """Reads the entries of the extracted files, in the tree order."""
+        all_files, entries = [], []
         # Not using os.path.walk so we get just the right order.
 
         def iterate(path):
@@ -320,34 +376,44 @@ class FileViewer(object):
 
         iterate(self.dest)
 
-        url_prefix = 'mkt.%s' if self.is_webapp else '%s'
         for path in all_files:
             filename = smart_unicode(os.path.basename(path), errors='replace')
-            short = smart_unicode(path[len(self.dest) + 1:], errors='replace')
             mime, encoding = mimetypes.guess_type(filename)
             if not mime and filename == 'manifest.webapp':
                 mime = 'application/x-web-app-manifest+json'
             directory = os.path.isdir(path)
-
-            res[short] = {
+            stats = os.stat(path)
+            entries.append({
                 'binary': self._is_binary(mime, path),
-                'depth': short.count(os.sep),
                 'directory': directory,
-                'filename': filename,
-                'full': path,
                 'md5': get_md5(path) if not directory else '',
                 'mimetype': mime or 'application/octet-stream',
+                'modified': stats[stat.ST_MTIME],
+                'short': smart_unicode(path[len(self.dest) + 1:],
+                                       errors='replace'),
+                'size': stats[stat.ST_SIZE],
+            })
+
+        return entries
+
+    def _get_files(self, entries):
+        res = SortedDict()
+        url_prefix = 'mkt.%s' if self.is_webapp else '%s'
+        for entry in entries:
+            short = entry['short']
+            filename = os.path.basename(short)
+            res[short] = dict(entry, **{
+                'depth': short.count(os.sep),
+                'filename': filename,
+                'full': os.path.join(self.dest, smart_path(short)),
                 'syntax': self.get_syntax(filename),
-                'modified': os.stat(path)[stat.ST_MTIME],
-                'short': short,
-                'size': os.stat(path)[stat.ST_SIZE],
                 'truncated': self.truncate(filename),
                 'url': reverse(url_prefix % 'files.list',
                                args=[self.file.id, 'file', short]),
                 'url_serve': reverse(url_prefix % 'files.redirect',
                                      args=[self.file.id, short]),
                 'version': self.file.version.version,
-            }
+            })
 
         return res
 
@@ -192,6 +192,9 @@ class File(amo.models.OnChangeMixin, amo.models.ModelBase):
                              os.path.join(dest, nfd_str(f.filename)))
         if upload.validation:
             FileValidation.from_json(f, upload.validation)
+        import files.tasks
+        # The task would look for the file before it's committed.
+        amo.utils.post_commit(files.tasks.build_manifest.delay, f.id)
         return f
 
     @classmethod
@@ -698,6 +701,31 @@ class FileValidation(amo.models.ModelBase):
         return new
 
 
+class FileManifest(amo.models.ModelBase):
+    """
+    The files inside a file, as listed by the file viewer. They are read
+    once for all the files with the same content, keyed by its hash.
+    """
+    hash = models.CharField(max_length=255, unique=True)
+    entries = models.TextField()
+
+    class Meta:
+        db_table = 'file_manifests'
+
+    @classmethod
+    def get_entries(cls, hash):
+        """Returns the entries saved for `hash`, or None."""
+        try:
+            return json.loads(cls.objects.get(hash=hash).entries)
+        except cls.DoesNotExist:
+            return None
+
+    @classmethod
+    def save_entries(cls, hash, entries):
+        cls.objects.get_or_create(hash=hash,
+                                  defaults={'entries': json.dumps(entries)})
+
+
 def nfd_str(u):
     """Uses NFD to normalize unicode strings."""
     if isinstance(u, unicode):
@@ -24,7 +24,8 @@ from amo.utils import Message, get_email_backend
 from addons.models import Addon
 from versions.compare import version_int as vint
 from versions.models import Version, ApplicationsVersions
-from .models import File
+from .helpers import FileViewer
+from .models import File, FileManifest
 from .utils import JetpackUpgrader, parse_addon
 
 task_log = logging.getLogger('z.task')
@@ -36,8 +37,6 @@ def extract_file(viewer, **kw):
     # This message is for end users so they'll see a nice error.
     msg = Message('file-viewer:%s' % viewer)
     msg.delete()
-    # This flag is so that we can signal when the extraction is completed.
-    flag = Message(viewer._extraction_cache_key())
     task_log.debug('[1@%s] Unzipping %s for file viewer.' % (
                   extract_file.rate_limit, viewer))
 
@@ -52,7 +51,26 @@ def extract_file(viewer, **kw):
         task_log.error('[1@%s] Error unzipping: %s' %
                        (extract_file.rate_limit, err))
 
-    flag.delete()
+
+@task
+def build_manifest(file_id, **kw):
+    """
+    Extracts a new file and saves its manifest, so that the file viewer
+    doesn't have to read the extracted files again.
+    """
+    file_ = File.objects.get(pk=file_id)
+    addon = file_.version.addon
+    if addon.is_webapp() and not addon.is_packaged:
+        return
+    viewer = FileViewer(file_, is_webapp=addon.is_webapp())
+    if not viewer.hash or FileManifest.get_entries(viewer.hash) is not None:
+        return
+    task_log.info('[1@None] Building the manifest of file %s.' % file_id)
+    try:
+        viewer.extract()
+    except Exception, err:
+        task_log.error('Error building the manifest of file %s: %s' %
+                       (file_id, err))
 
 
 # The version/file creation methods expect a files.FileUpload object.
@@ -0,0 +1,39 @@
+import os
+import shutil
+import time
+
+from django.conf import settings
+
+import mock
+from nose.tools import eq_
+
+import amo.tests
+from files.cron import cleanup_extracted_file
+
+
+class TestCleanupExtractedFile(amo.tests.TestCase):
+
+    def setUp(self):
+        self.root = os.path.join(settings.TMP_PATH, 'file_viewer')
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+        now = time.time()
+        for age, name in enumerate(['new', 'old', 'older']):
+            os.makedirs(os.path.join(self.root, name))
+            with open(os.path.join(self.root, name, 'f'), 'w') as f:
+                f.write('x' * 10)
+            used = now - age * 60
+            os.utime(os.path.join(self.root, name), (used, used))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    @mock.patch.object(settings, 'FILE_VIEWER_DISK_BUDGET', 20)
+    def test_least_recently_used_removed(self):
+        cleanup_extracted_file()
+        eq_(sorted(os.listdir(self.root)), ['new', 'old'])
+
+    @mock.patch.object(settings, 'FILE_VIEWER_DISK_BUDGET', 30)
+    def test_under_budget(self):
+        cleanup_extracted_file()
+        eq_(len(os.listdir(self.root)), 3)
@@ -2,6 +2,8 @@
 import os
 import mimetypes
 import shutil
+import struct
+import tempfile
 import zipfile
 
 from django.conf import settings
@@ -15,8 +17,8 @@ from nose.tools import eq_
 import amo.tests
 from amo.urlresolvers import reverse
 from files.helpers import FileViewer, DiffHelper
-from files.models import File
-from files.utils import SafeUnzip
+from files.models import File, FileManifest
+from files.utils import SafeUnzip, SubFile, extract_xpi
 
 root = os.path.join(settings.ROOT, 'apps/files/fixtures/files')
 get_file = lambda x: '%s/%s' % (root, x)
@@ -25,6 +27,7 @@ get_file = lambda x: '%s/%s' % (root, x)
 def make_file(pk, file_path, **kwargs):
     obj = Mock()
     obj.id = pk
+    obj.hash = ''
     for k, v in kwargs.items():
         setattr(obj, k, v)
     obj.file_path = file_path
@@ -200,6 +203,82 @@ class TestFileHelper(amo.tests.TestCase):
         eq_({}, self.viewer.get_files())
 
 
+class TestFileManifest(amo.tests.TestCase):
+
+    def setUp(self):
+        self.viewer = self.get_viewer(1)
+
+    def tearDown(self):
+        self.viewer.cleanup()
+
+    def get_viewer(self, pk):
+        return FileViewer(make_file(pk, get_file('dictionary-test.xpi'),
+                                    hash='sha256:abc'))
+
+    def test_dest(self):
+        eq_(os.path.basename(self.viewer.dest), 'abc')
+        eq_(self.get_viewer(2).dest, self.viewer.dest)
+
+    def test_no_manifest(self):
+        eq_(self.viewer.get_manifest(), None)
+        eq_(self.viewer.get_files(), {})
+
+    def test_manifest_saved(self):
+        self.viewer.extract()
+        files = self.viewer.get_files()
+        entries = FileManifest.get_entries('abc')
+        eq_(len(entries), 14)
+        install = [e for e in entries if e['short'] == 'install.js'][0]
+        eq_(install['md5'], files['install.js']['md5'])
+        eq_(install['binary'], False)
+        eq_(install['directory'], False)
+
+    def test_files_from_manifest(self):
+        self.viewer.extract()
+        files = self.viewer.get_files()
+        self.viewer.cleanup()
+
+        # The files are listed without being extracted again.
+        other = self.get_viewer(2)
+        assert not other.is_extracted()
+        other_files = other.get_files()
+        eq_(other_files.keys(), files.keys())
+        eq_(other_files['install.js']['md5'], files['install.js']['md5'])
+        eq_(other_files['install.js']['full'], files['install.js']['full'])
+        assert other_files['install.js']['url'] != files['install.js']['url']
+
+    def test_extraction_locked_by_hash(self):
+        other = self.get_viewer(2)
+        key = self.viewer._extraction_cache_key()
+        eq_(other._extraction_cache_key(), key)
+        cache.add(key, True)
+        eq_(other.extract(), False)
+        assert not other.is_extracted()
+        eq_(FileManifest.get_entries('abc'), None)
+
+    @patch('files.helpers.extract_xpi')
+    def test_failed_extraction_not_saved(self, extract_xpi):
+        extract_xpi.side_effect = IOError
+        self.assertRaises(IOError, self.viewer.extract)
+        assert not self.viewer.is_extracted()
+        eq_(FileManifest.get_entries('abc'), None)
+        eq_(cache.get(self.viewer._extraction_cache_key()), None)
+
+    @patch('files.helpers.get_md5')
+    def test_diff_from_manifests(self, get_md5):
+        get_md5.return_value = 'md5'
+        self.viewer.extract()
+        self.viewer.get_files()
+        hashed = get_md5.call_count
+        assert hashed
+
+        helper = DiffHelper(make_file(1, self.viewer.src, hash='sha256:abc'),
+                            make_file(2, self.viewer.src, hash='sha256:abc'))
+        files = helper.get_files()
+        eq_(get_md5.call_count, hashed)
+        eq_([f for f in files.values() if f['diff']], [])
+
+
 class TestSearchEngineHelper(amo.tests.TestCase):
     fixtures = ['base/addon_4594_a9', 'base/apps']
 
@@ -385,3 +464,63 @@ class TestSafeUnzipFile(amo.tests.TestCase, amo.tests.AMOPaths):
         zip.is_valid()
         zip.info[2].filename = 'META-INF/foo.sf'
         assert not zip.is_signed()
+
+    def make_zip(self, entries, compression=zipfile.ZIP_STORED):
+        fd, path = tempfile.mkstemp(suffix='.xpi')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        zip = zipfile.ZipFile(path, 'w', compression)
+        for name, data in entries:
+            zip.writestr(name, data)
+        zip.close()
+        return path
+
+    def test_duplicate_names(self):
+        zip = SafeUnzip(self.make_zip([('a', '1'), ('a', '2')]))
+        self.assertRaises(forms.ValidationError, zip.is_valid)
+
+    def test_members_out_of_archive(self):
+        path = self.make_zip([('a', 'x' * 1000)])
+        data = open(path, 'rb').read()
+        open(path, 'wb').write(data[:100] + data[1000:])
+        zip = SafeUnzip(path)
+        self.assertRaises(forms.ValidationError, zip.is_valid)
+
+    def test_open_member_stored(self):
+        inner = open(self.make_zip([('test', 'hello')]), 'rb').read()
+        zip = SafeUnzip(self.make_zip([('test.jar', inner)]))
+        zip.is_valid()
+        member = zip.open_member('test.jar')
+        assert isinstance(member, SubFile)
+        eq_(member.read(), inner)
+        member.seek(-4, 2)
+        eq_(member.read(10), inner[-4:])
+        eq_(zip.extract_from_manifest('jar:test.jar!/test'), 'hello')
+
+    def test_open_member_deflated(self):
+        inner = open(self.make_zip([('test', 'hello')]), 'rb').read()
+        zip = SafeUnzip(self.make_zip([('test.jar', inner)],
+                                      zipfile.ZIP_DEFLATED))
+        zip.is_valid()
+        eq_(zip.open_member('test.jar').read(), inner)
+        eq_(zip.extract_from_manifest('jar:test.jar!/test'), 'hello')
+
+    def test_extract_xpi_expand(self):
+        inner = open(self.make_zip([('test', 'hello')]), 'rb').read()
+        path = self.make_zip([('a.jar', inner), ('b.jar', 'not a jar')])
+        dest = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dest)
+        extract_xpi(path, dest, expand=True)
+        eq_(open(os.path.join(dest, 'a.jar', 'test')).read(), 'hello')
+        eq_(open(os.path.join(dest, 'b.jar')).read(), 'not a jar')
+
+    def test_extract_xpi_wrong_size(self):
+        path = self.make_zip([('a', 'x' * 1000)], zipfile.ZIP_DEFLATED)
+        data = open(path, 'rb').read()
+        # Says the file is 10 bytes in the central directory.
+        size = data.rindex('PK\x01\x02') + 24
+        open(path, 'wb').write(data[:size] + struct.pack('<I', 10) +
+                               data[size + 4:])
+        dest = tempfile.mkdtemp()
+        self.assertRaises(forms.ValidationError, extract_xpi, path, dest)
+        assert not os.path.exists(dest)
@@ -6,8 +6,8 @@ import logging
 import os
 import re
 import shutil
-import stat
 import StringIO
+import struct
 import tempfile
 import zipfile
 from datetime import datetime
@@ -272,6 +272,55 @@ class WebAppParser(object):
         return trans
 
 
+# Deflated nested archives are inflated to a temporary file, kept in memory
+# up to that size.
+SPOOL_SIZE = 2 ** 20
+CHUNK_SIZE = 2 ** 16
+EXPAND_WHITELIST = ('.jar', '.xpi')
+EXPAND_DEPTH = 10
+
+
+class SubFile(object):
+    """
+    A read-only, seekable view of `size` bytes of `fileobj` from `offset`, so
+    that a member stored in an archive can be opened as an archive itself
+    without being copied.
+    """
+
+    def __init__(self, fileobj, offset, size):
+        self.fileobj = fileobj
+        self.offset = offset
+        self.size = size
+        self.pos = 0
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.size
+        if pos < 0:
+            raise IOError('Invalid argument')
+        self.pos = pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        left = max(self.size - self.pos, 0)
+        if size is None or size < 0 or size > left:
+            size = left
+        if not size:
+            return ''
+        # The file may be shared with other views, always seek first.
+        self.fileobj.seek(self.offset + self.pos)
+        data = self.fileobj.read(size)
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        pass
+
+
 class SafeUnzip(object):
     def __init__(self, source, mode='r'):
         self.source = source
@@ -293,6 +342,9 @@ class SafeUnzip(object):
             return False
 
         _info = zip.infolist()
+        zip.fp.seek(0, 2)
+        size = zip.fp.tell()
+        names = set()
 
         for info in _info:
             if '..' in info.filename or info.filename.startswith('/'):
@@ -305,6 +357,15 @@ class SafeUnzip(object):
                           % (self.source, info.file_size))
                 raise forms.ValidationError(_('Invalid archive.'))
 
+            # Members out of the archive, or shadowing another one.
+            if (info.header_offset < 0
+                or info.header_offset + info.compress_size > size
+                or info.filename in names):
+                log.error('Extraction error, invalid central directory: '
+                          '%s, %s' % (self.source, info.filename))
+                raise forms.ValidationError(_('Invalid archive.'))
+            names.add(info.filename)
+
         self.info = _info
         self.zip = zip
         return True
@@ -333,7 +394,7 @@ class SafeUnzip(object):
         if type == 'jar':
             parts = path.split('!')
             for part in parts[:-1]:
-                jar = self.__class__(StringIO.StringIO(jar.zip.read(part)))
+                jar = self.__class__(jar.open_member(part))
                 jar.is_valid(fatal=True)
             path = parts[-1]
         return jar.extract_path(path[1:] if path.startswith('/') else path)
@@ -342,84 +403,142 @@ class SafeUnzip(object):
         """Given a path, extracts the content at path."""
         return self.zip.read(path)
 
-    def extract_info_to_dest(self, info, dest):
-        """Extracts the given info to a directory and checks the file size."""
-        self.zip.extract(info, dest)
-        dest = os.path.join(dest, info.filename)
-        if not os.path.isdir(dest):
+    def open_member(self, info):
+        """
+        Returns a seekable file of the content of a member: a view of the
+        archive if the member is stored, an inflated copy otherwise.
+        """
+        if not isinstance(info, zipfile.ZipInfo):
+            info = self.zip.getinfo(info)
+        if info.compress_type == zipfile.ZIP_STORED:
+            fp = self.zip.fp
+            fp.seek(info.header_offset)
+            header = struct.unpack(zipfile.structFileHeader,
+                                   fp.read(zipfile.sizeFileHeader))
+            if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+                raise BadZipfile('Bad magic number for file header')
+            offset = (info.header_offset + zipfile.sizeFileHeader +
+                      header[zipfile._FH_FILENAME_LENGTH] +
+                      header[zipfile._FH_EXTRA_FIELD_LENGTH])
+            return SubFile(fp, offset, info.compress_size)
+
+        spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+        try:
+            self.copy_info(info, spool)
+        except:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
+
+    def copy_info(self, info, dest):
+        """
+        Streams the content of the given info to the file dest, checking
+        that it is no bigger than the archive says.
+        """
+        size = 0
+        source = self.zip.open(info)
+        try:
+            while size <= info.file_size:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size <= info.file_size:
+                    dest.write(chunk)
+        finally:
+            source.close()
+        if size != info.file_size:
+            log.error('Extraction error, uncompressed size: %s, %s not %s'
+                      % (self.source, size, info.file_size))
+            raise forms.ValidationError(_('Invalid archive.'))
+
+    def extract_info_to_dest(self, info, dest, expand=0):
+        """
+        Extracts the given info to a directory and checks the file size.
+
+        If expand is given, an archive in EXPAND_WHITELIST is extracted to a
+        directory of the same name instead, expanding the archives it
+        contains up to expand levels deep. It is kept as a file if it's not
+        a valid archive.
+        """
+        target = os.path.join(dest, info.filename)
+        if info.filename.endswith('/'):
             # Directories consistently report their size incorrectly.
-            size = os.stat(dest)[stat.ST_SIZE]
-            if size != info.file_size:
-                log.error('Extraction error, uncompressed size: %s, %s not %s'
-                          % (self.source, size, info.file_size))
-                raise forms.ValidationError(_('Invalid archive.'))
+            if not os.path.isdir(target):
+                os.makedirs(target)
+            return
+
+        parent = os.path.dirname(target)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        if (expand and os.path.splitext(info.filename)[1] in EXPAND_WHITELIST
+            and self.expand_info(info, target, expand - 1)):
+            return
+        with open(target, 'wb') as fp:
+            self.copy_info(info, fp)
+
+    def expand_info(self, info, dest, expand=0):
+        """
+        Extracts the archive in the given info to the directory dest,
+        returns False if it is not a valid archive.
+        """
+        member = self.open_member(info)
+        try:
+            jar = self.__class__(member)
+            if not jar.is_valid(fatal=False):
+                return False
+            try:
+                jar.extract_to_dest(dest, expand)
+            except:
+                if os.path.isdir(dest):
+                    rm_local_tmp_dir(dest)
+                raise
+            finally:
+                jar.close()
+            return True
+        finally:
+            member.close()
 
-    def extract_to_dest(self, dest):
+    def extract_to_dest(self, dest, expand=0):
         """Extracts the zip file to a directory."""
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
         for info in self.info:
-            self.extract_info_to_dest(info, dest)
+            self.extract_info_to_dest(info, dest, expand)
 
     def close(self):
         self.zip.close()
 
 
-def extract_zip(source, remove=False, fatal=True):
-    """Extracts the zip file. If remove is given, removes the source file."""
-    tempdir = tempfile.mkdtemp()
-
-    zip = SafeUnzip(source)
-    try:
-        if zip.is_valid(fatal):
-            zip.extract_to_dest(tempdir)
-    except:
-        rm_local_tmp_dir(tempdir)
-        raise
-
-    if remove:
-        os.remove(source)
-    return tempdir
-
-
-def copy_over(source, dest):
-    """
-    Copies from the source to the destination, removing the destination
-    if it exists and is a directory.
-    """
-    if os.path.exists(dest) and os.path.isdir(dest):
-        shutil.rmtree(dest)
-    shutil.copytree(source, dest)
-    shutil.rmtree(source)
-
-
 def extract_xpi(xpi, path, expand=False):
     """
-    If expand is given, will look inside the expanded file
-    and find anything in the whitelist and try and expand it as well.
-    It will do up to 10 iterations, after that you are on your own.
+    Extracts the xpi to path, replacing the directory if it exists.
+
+    If expand is given, will look inside the xpi and find anything in the
+    whitelist and try and expand it as well, up to EXPAND_DEPTH levels deep,
+    after that you are on your own.
 
     It will replace the expanded file with a directory and the expanded
     contents. If you have 'foo.jar', that contains 'some-image.jpg', then
     it will create a folder, foo.jar, with an image inside.
+
+    Everything is extracted in a single pass, streaming each file straight
+    to path: nothing is copied around and nested archives aren't read in
+    memory. Nothing is left in path if the extraction fails.
     """
-    expand_whitelist = ['.jar', '.xpi']
-    tempdir = extract_zip(xpi)
-
-    if expand:
-        for x in xrange(0, 10):
-            flag = False
-            for root, dirs, files in os.walk(tempdir):
-                for name in files:
-                    if os.path.splitext(name)[1] in expand_whitelist:
-                        src = os.path.join(root, name)
-                        if not os.path.isdir(src):
-                            dest = extract_zip(src, remove=True, fatal=False)
-                            if dest:
-                                copy_over(dest, src)
-                                flag = True
-            if not flag:
-                break
-
-    copy_over(tempdir, path)
+    zip = SafeUnzip(xpi)
+    zip.is_valid()
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    try:
+        zip.extract_to_dest(path, EXPAND_DEPTH if expand else 0)
+    except:
+        if os.path.isdir(path):
+            rm_local_tmp_dir(path)
+        raise
+    finally:
+        zip.close()
 
 
 def parse_xpi(xpi, addon=None):
@@ -443,7 +562,8 @@ def parse_xpi(xpi, addon=None):
         log.error('XPI parse error', exc_info=True)
         raise forms.ValidationError(_('Could not parse install.rdf.'))
     finally:
-        rm_local_tmp_dir(path)
+        if os.path.exists(path):
+            rm_local_tmp_dir(path)
 
     return check_rdf(rdf, addon)
 
@@ -9,7 +9,7 @@ from tower import ugettext_lazy as _
 import amo
 import amo.models
 from amo.decorators import write
-from amo.utils import get_locale_from_lang, memoize_key
+from amo.utils import cache_ns_key, get_locale_from_lang, memoize_key
 from constants.payments import PROVIDER_CURRENCIES
 from mkt.constants import apps, payments
 from stats.models import Contribution
@@ -157,6 +157,26 @@ class AddonPurchase(amo.models.ModelBase):
         return u'%s: %s' % (self.addon, self.user)
 
 
+@receiver(models.signals.post_save, sender=AddonPurchase,
+          dispatch_uid='addon_purchase_receipt_verify')
+@receiver(models.signals.post_delete, sender=AddonPurchase,
+          dispatch_uid='addon_purchase_receipt_verify')
+@receiver(models.signals.post_save, sender=Contribution,
+          dispatch_uid='contribution_receipt_verify')
+def invalidate_receipt_verdicts(sender, instance, **kw):
+    """
+    Drops the verdicts services/verify.py cached for the receipts of this
+    user and app, so refunds and chargebacks take effect straight away.
+    """
+    if kw.get('raw') or not (instance.addon_id and instance.user_id):
+        return
+    if (sender == Contribution and
+        instance.type not in [amo.CONTRIB_REFUND, amo.CONTRIB_CHARGEBACK]):
+        return
+    cache_ns_key('receipt-verify:%s:%s' % (instance.addon_id,
+                                           instance.user_id), increment=True)
+
+
 @write
 @receiver(models.signals.post_save, sender=Contribution,
           dispatch_uid='create_addon_purchase')
@@ -0,0 +1,23 @@
+import commonware.log
+from celery.task.sets import TaskSet
+import cronjobs
+
+from amo.utils import chunked
+from addons.models import Addon
+from . import tasks
+
+cron_log = commonware.log.getLogger('z.cron')
+
+
+@cronjobs.register
+def rebuild_review_aggregates():
+    """
+    Rebuild the review denorms and aggregates of all the add-ons, in chunks
+    run in parallel.
+    """
+    ids = list(Addon.objects.values_list('id', flat=True).order_by('id'))
+    cron_log.info('Rebuilding the review aggregates of %s add-ons.'
+                  % len(ids))
+    ts = [tasks.rebuild_review_aggregates.subtask(args=chunk)
+          for chunk in chunked(ids, 500)]
+    TaskSet(ts).apply_async()
@@ -1,3 +1,5 @@
+import contextlib
+import threading
 from datetime import datetime, timedelta
 import logging
 
@@ -17,6 +19,26 @@ from users.models import UserProfile
 
 log = logging.getLogger('z.review')
 
+_locals = threading.local()
+
+
+@contextlib.contextmanager
+def batch_refresh():
+    """
+    Within this context, reviews saved or deleted aren't refreshed one by
+    one: all of them are when it exits, see `Review.refresh`.
+    """
+    if getattr(_locals, 'pairs', None) is not None:
+        yield
+        return
+    _locals.pairs = set()
+    try:
+        yield
+    finally:
+        pairs, _locals.pairs = _locals.pairs, None
+        if pairs:
+            Review.refresh_many(pairs)
+
 
 class ReviewManager(amo.models.ManagerBase):
 
@@ -98,6 +120,11 @@ class Review(amo.models.ModelBase):
         from addons.models import update_search_index
         from . import tasks
 
+        pairs = getattr(_locals, 'pairs', None)
+        if pairs is not None:
+            pairs.add((self.addon_id, self.user_id))
+            return
+
         if update_denorm:
             pair = self.addon_id, self.user_id
             # Do this immediately so is_latest is correct. Use default
@@ -108,6 +135,19 @@ class Review(amo.models.ModelBase):
         tasks.addon_review_aggregates.delay(self.addon_id, using='default')
         update_search_index(self.addon.__class__, self.addon)
 
+    @staticmethod
+    def refresh_many(pairs):
+        """
+        Refreshes the reviews of all (addon, user) `pairs` at once, and the
+        aggregates of their add-ons in a single task.
+        """
+        from . import tasks
+
+        tasks.update_denorm(*pairs, using='default')
+        addons = sorted(set(addon for addon, user in pairs))
+        tasks.addon_review_aggregates.delay(*addons, using='default',
+                                            reindex=True)
+
     @staticmethod
     def transformer(reviews):
         user_ids = dict((r.user_id, r) for r in reviews)
@@ -178,14 +218,22 @@ class GroupedRating(object):
 
     @classmethod
     def set(cls, addon, using=None):
+        return cls.set_many([addon], using=using)[addon]
+
+    @classmethod
+    def set_many(cls, addons, using=None):
+        """Sets the grouped ratings of `addons` with a single query."""
         q = (Review.objects.valid().using(using)
-             .filter(addon=addon, is_latest=True)
-             .values_list('rating')
-             .annotate(models.Count('rating')))
-        counts = dict(q)
-        ratings = [(rating, counts.get(rating, 0)) for rating in range(1, 6)]
-        cache.set(cls.key(addon), ratings)
-        return ratings
+             .filter(addon__in=addons, is_latest=True)
+             .values_list('addon', 'rating')
+             .annotate(models.Count('rating')).order_by())
+        counts = dict(((addon, rating), count) for addon, rating, count in q)
+        grouped = dict((addon, [(rating, counts.get((addon, rating), 0))
+                                for rating in range(1, 6)])
+                       for addon in addons)
+        cache.set_many(dict((cls.key(addon), ratings)
+                            for addon, ratings in grouped.items()))
+        return grouped
 
 
 class Spam(object):
@@ -1,10 +1,11 @@
 import logging
 
-from django.db.models import Count, Avg, F
+from django.db.models import Count, Avg
 
 import caching.base as caching
 from celeryutils import task
 
+import amo.models
 from addons.models import Addon
 from .models import Review, GroupedRating
 
@@ -19,72 +20,126 @@ def update_denorm(*pairs, **kw):
     """
     log.info('[%s@%s] Updating review denorms.' %
              (len(pairs), update_denorm.rate_limit))
-    using = kw.get('using')
-    for addon, user in pairs:
-        reviews = list(Review.objects.valid().no_cache().using(using)
-                       .filter(addon=addon, user=user).order_by('created'))
-        if not reviews:
-            continue
+    addons = set(addon for addon, user in pairs)
+    users = set(user for addon, user in pairs)
+    _update_denorms(addons, users, pairs=set(pairs), using=kw.get('using'))
+
 
+def _update_denorms(addons, users=None, pairs=None, using=None):
+    """
+    Sets `previous_count` and `is_latest` of the reviews of `addons`, by
+    `users` if given and only for `pairs` of (addon, user) if given, with a
+    query for all the reviews and an UPDATE of those that changed.
+    """
+    qs = (Review.objects.valid().no_cache().using(using)
+          .filter(addon__in=addons).order_by('created', 'id'))
+    if users is not None:
+        qs = qs.filter(user__in=users)
+
+    by_pair = {}
+    for review in qs:
+        pair = review.addon_id, review.user_id
+        if pairs is None or pair in pairs:
+            by_pair.setdefault(pair, []).append(review)
+
+    changed, previous_count, is_latest = [], {}, {}
+    for reviews in by_pair.values():
         for idx, review in enumerate(reviews):
-            review.previous_count = idx
-            review.is_latest = False
-        reviews[-1].is_latest = True
+            latest = idx == len(reviews) - 1
+            if review.previous_count != idx or review.is_latest != latest:
+                changed.append(review)
+                previous_count[review.id] = idx
+                is_latest[review.id] = latest
 
-        for review in reviews:
-            review.save()
+    if changed:
+        amo.models.bulk_update(Review, {'previous_count': previous_count,
+                                        'is_latest': is_latest})
+        Review.objects.invalidate(*changed)
+    return changed
 
 
 @task
 def addon_review_aggregates(*addons, **kw):
-    log.info('[%s@%s] Updating total reviews.' %
+    log.info('[%s@%s] Updating review aggregates.' %
              (len(addons), addon_review_aggregates.rate_limit))
-    using = kw.get('using')
-    addon_objs = list(Addon.objects.filter(pk__in=addons))
-    stats = dict(Review.objects.valid().no_cache().using(using)
-                 .filter(addon__in=addons, is_latest=True)
-                 .values_list('addon')
-                 .annotate(Count('addon')))
-    for addon in addon_objs:
-        addon.update(total_reviews=stats.get(addon.id, 0))
-
-    log.info('[%s@%s] Updating average ratings.' %
-             (len(addons), addon_review_aggregates.rate_limit))
-    stats = dict(Review.objects.valid().no_cache().using(using)
-                 .filter(addon__in=addons)
-                 .values_list('addon')
-                 .annotate(Avg('rating')))
-    for addon in addon_objs:
-        addon.update(average_rating=stats.get(addon.id, 0))
-
-    # Delay bayesian calculations to avoid slave lag.
-    addon_bayesian_rating.apply_async(args=addons, countdown=5)
-    addon_grouped_rating.apply_async(args=addons, kwargs={'using': using})
+    changed = _update_aggregates(addons, using=kw.get('using'))
+    if changed and kw.get('reindex'):
+        from addons.tasks import index_addons
+        index_addons.delay(changed)
 
 
-@task
-def addon_bayesian_rating(*addons, **kw):
-    log.info('[%s@%s] Updating bayesian ratings.' %
-             (len(addons), addon_bayesian_rating.rate_limit))
+def _update_aggregates(addons, using=None):
+    """
+    Sets the total reviews, the average and the bayesian ratings of `addons`
+    with a grouped query per field and a single UPDATE of those that changed,
+    then caches their grouped ratings. Returns the ids of the changed add-ons.
+    """
+    reviews = Review.objects.valid().no_cache().using(using)
+    totals = dict(reviews.filter(addon__in=addons, is_latest=True)
+                  .values_list('addon').annotate(Count('addon')).order_by())
+    averages = dict(reviews.filter(addon__in=addons)
+                    .values_list('addon').annotate(Avg('rating')).order_by())
+
+    objs = list(Addon.objects.no_cache().using(using).filter(id__in=addons)
+                .no_transforms())
+    columns = {'total_reviews': {}, 'average_rating': {},
+               'bayesian_rating': {}}
+    avg = _bayesian_average()
+    changed = []
+    for addon in objs:
+        values = {'total_reviews': totals.get(addon.id, 0),
+                  'average_rating': averages.get(addon.id, 0)}
+        if avg is not None and values['average_rating'] is not None:
+            values['bayesian_rating'] = _bayesian_rating(
+                avg, values['total_reviews'], values['average_rating'])
+        updated = [k for k, v in values.items() if getattr(addon, k) != v]
+        for k in updated:
+            columns[k][addon.id] = values[k]
+        if updated:
+            changed.append(addon)
+
+    if changed:
+        amo.models.bulk_update(Addon, columns)
+        Addon.objects.invalidate(*changed)
+    GroupedRating.set_many(addons, using=using)
+    return [addon.id for addon in changed]
+
+
+def _bayesian_average():
+    """The average rating and number of reviews of all add-ons, cached."""
     f = lambda: Addon.objects.aggregate(rating=Avg('average_rating'),
                                         reviews=Avg('total_reviews'))
     avg = caching.cached(f, 'task.bayes.avg', 60 * 60 * 60)
     # Rating can be NULL in the DB, so don't update it if it's not there.
-    if avg['rating'] is None:
-        return
+    if avg['rating'] is not None:
+        return avg
+
+
+def _bayesian_rating(avg, total_reviews, average_rating):
+    if not total_reviews:
+        return 0
     mc = avg['reviews'] * avg['rating']
-    for addon in Addon.uncached.filter(id__in=addons):
-        if addon.average_rating is None:
-            # Ignoring addons with no average rating.
-            continue
+    return ((mc + total_reviews * float(average_rating)) /
+            (avg['reviews'] + total_reviews))
 
-        q = Addon.objects.filter(id=addon.id)
-        if addon.total_reviews:
-            num = mc + F('total_reviews') * F('average_rating')
-            denom = avg['reviews'] + F('total_reviews')
-            q.update(bayesian_rating=num / denom)
-        else:
-            q.update(bayesian_rating=0)
+
+@task
+def addon_bayesian_rating(*addons, **kw):
+    log.info('[%s@%s] Updating bayesian ratings.' %
+             (len(addons), addon_bayesian_rating.rate_limit))
+    avg = _bayesian_average()
+    if avg is None:
+        return
+    objs = list(Addon.uncached.filter(id__in=addons).no_transforms())
+    ratings = {}
+    for addon in objs:
+        # Ignoring addons with no average rating.
+        if addon.average_rating is not None:
+            ratings[addon.id] = _bayesian_rating(avg, addon.total_reviews,
+                                                 addon.average_rating)
+    if ratings:
+        amo.models.bulk_update(Addon, {'bayesian_rating': ratings})
+        Addon.objects.invalidate(*objs)
 
 
 @task
@@ -93,6 +148,20 @@ def addon_grouped_rating(*addons, **kw):
     # We stick this all in memcached since it's not critical.
     log.info('[%s@%s] Updating addon grouped ratings.' %
              (len(addons), addon_grouped_rating.rate_limit))
+    GroupedRating.set_many(addons, using=kw.get('using'))
+
+
+@task
+def rebuild_review_aggregates(*addons, **kw):
+    """
+    Recomputes the denormalized fields of all the reviews of `addons`, then
+    their aggregates, and reindexes the add-ons that changed.
+    """
+    log.info('[%s@%s] Rebuilding review aggregates.' %
+             (len(addons), rebuild_review_aggregates.rate_limit))
     using = kw.get('using')
-    for addon in addons:
-        GroupedRating.set(addon, using=using)
+    _update_denorms(addons, using=using)
+    changed = _update_aggregates(addons, using=using)
+    if changed:
+        from addons.tasks import index_addons
+        index_addons.delay(changed)
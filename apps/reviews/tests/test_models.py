@@ -1,12 +1,14 @@
 from django.utils import translation
 
+import mock
 from nose.tools import eq_
 import test_utils
 
 import amo.tests
 from addons.models import Addon
 from reviews import tasks
-from reviews.models import check_spam, Review, GroupedRating, Spam
+from reviews.models import (batch_refresh, check_spam, Review, GroupedRating,
+                            Spam)
 from users.models import UserProfile
 
 
@@ -56,6 +58,61 @@ class TestGroupedRating(amo.tests.TestCase):
         eq_(GroupedRating.get(1865, update_none=False), None)
         eq_(GroupedRating.get(1865, update_none=True), self.grouped_ratings)
 
+    def test_set_many(self):
+        grouped = GroupedRating.set_many([1865, 3])
+        eq_(grouped, {1865: self.grouped_ratings,
+                      3: [(r, 0) for r in range(1, 6)]})
+        eq_(GroupedRating.get(3, update_none=False), grouped[3])
+
+
+class TestAggregates(amo.tests.TestCase):
+    fixtures = ['base/users']
+
+    def setUp(self):
+        self.addon = Addon.objects.create(type=amo.ADDON_EXTENSION)
+        self.users = list(UserProfile.objects.all()[:2])
+
+    def review(self, user, rating):
+        return Review.objects.create(addon=self.addon, user=user,
+                                     rating=rating)
+
+    def test_denorm(self):
+        first = self.review(self.users[0], 2)
+        second = self.review(self.users[0], 4)
+        other = self.review(self.users[1], 5)
+        eq_([(r.previous_count, r.is_latest) for r in
+             Review.objects.no_cache().order_by('id')],
+            [(0, False), (1, True), (0, True)])
+
+        Review.objects.filter(id__in=[first.id, second.id]).update(
+            previous_count=5, is_latest=True)
+        changed = tasks._update_denorms([self.addon.id])
+        eq_(sorted(r.id for r in changed), [first.id, second.id])
+        eq_(Review.objects.no_cache().get(id=other.id).is_latest, True)
+
+    def test_aggregates(self):
+        self.review(self.users[0], 2)
+        self.review(self.users[0], 4)
+        self.review(self.users[1], 5)
+        addon = Addon.objects.no_cache().get(id=self.addon.id)
+        eq_(addon.total_reviews, 2)
+        eq_(round(addon.average_rating, 2), 3.67)
+
+        Addon.objects.filter(id=addon.id).update(total_reviews=0)
+        eq_(tasks._update_aggregates([addon.id]), [addon.id])
+        eq_(Addon.objects.no_cache().get(id=addon.id).total_reviews, 2)
+        eq_(tasks._update_aggregates([addon.id]), [])
+
+    @mock.patch('reviews.tasks.addon_review_aggregates.delay')
+    def test_batch_refresh(self, aggregates):
+        for rating in range(1, 6):
+            self.review(self.users[0], rating)
+        aggregates.reset_mock()
+        with batch_refresh():
+            Review.objects.filter(user=self.users[0]).delete()
+        aggregates.assert_called_once_with(self.addon.id, using='default',
+                                           reindex=True)
+
 
 class TestSpamTest(amo.tests.TestCase):
     fixtures = ['base/apps', 'base/platforms', 'reviews/test_models']
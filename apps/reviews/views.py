@@ -19,7 +19,7 @@ from addons.decorators import addon_view_factory, has_purchased
 from addons.models import Addon
 
 from .helpers import user_can_delete_review
-from .models import Review, ReviewFlag, GroupedRating, Spam
+from .models import Review, ReviewFlag, GroupedRating, Spam, batch_refresh
 from . import forms
 
 log = commonware.log.getLogger('z.reviews')
@@ -245,7 +245,8 @@ def spam(request):
             log.info('SPAMMER: %s deleted %s' %
                      (request.amo_user.username, user.username))
             if not user.is_developer:
-                Review.objects.filter(user=user).delete()
+                with batch_refresh():
+                    Review.objects.filter(user=user).delete()
                 user.anonymize()
             messages.success(request, 'Deleted that dirty spammer.')
 
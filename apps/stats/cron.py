@@ -11,7 +11,7 @@ from amo.utils import chunked
 from addons.models import Addon
 from .models import (AddonCollectionCount, CollectionCount,
                      UpdateCount)
-from . import tasks
+from . import tasks, totals
 from lib.es.utils import raise_if_reindex_in_progress
 
 task_log = commonware.log.getLogger('z.task')
@@ -51,8 +51,10 @@ def update_global_totals(date=None):
     if date:
         date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
     today = date or datetime.date.today()
+    # The stats of stats.totals are computed together, the other jobs each
+    # run their own query.
     today_jobs = [dict(job=job, date=today) for job in
-                  tasks._get_daily_jobs(date)]
+                  tasks._get_daily_jobs(date) if job not in totals.STATS]
 
     max_update = date or UpdateCount.objects.aggregate(max=Max('date'))['max']
     metrics_jobs = [dict(job=job, date=max_update) for job in
@@ -60,6 +62,28 @@ def update_global_totals(date=None):
 
     ts = [tasks.update_global_totals.subtask(kwargs=kw)
           for kw in today_jobs + metrics_jobs]
+    if date:
+        ts.append(tasks.update_global_totals_range.subtask(args=[date, date]))
+    else:
+        ts.append(tasks.update_global_totals_incremental.subtask())
+    TaskSet(ts).apply_async()
+
+
+@cronjobs.register
+def backfill_global_totals(start, end, days=30):
+    """
+    Recomputes the stats of stats.totals from `start` to `end` (YYYY-MM-DD),
+    in parallel chunks of `days` days.
+    """
+    start = datetime.datetime.strptime(start, '%Y-%m-%d').date()
+    end = datetime.datetime.strptime(end, '%Y-%m-%d').date()
+    step = datetime.timedelta(days=int(days))
+    ts = []
+    while start <= end:
+        chunk_end = min(start + step - datetime.timedelta(days=1), end)
+        ts.append(tasks.update_global_totals_range.subtask(
+            args=[start, chunk_end]))
+        start = chunk_end + datetime.timedelta(days=1)
     TaskSet(ts).apply_async()
 
 
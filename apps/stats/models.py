@@ -406,6 +406,19 @@ class GlobalStat(caching.base.CachingMixin, models.Model):
         get_latest_by = 'date'
 
 
+class GlobalStatWatermark(models.Model):
+    """
+    The running total of a global stat up to the end of `date`, from which
+    stats.totals carries on.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    date = models.DateField()
+    total = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'global_stats_watermark'
+
+
 class ClientData(models.Model):
     """
     Helps tracks user agent and download source data of installs and purchases.
@@ -0,0 +1,163 @@
+"""
+Stats series read from elasticsearch, bucketed by day, week or month.
+
+Totals are bucketed by elasticsearch with a `date_histogram` facet over the
+`count` of the daily documents, so any range costs one query returning one
+entry per bucket.
+
+Breakdowns are indexed as lists of `{'k': key, 'v': value}` dicts, which
+can't be summed by a facet. Their daily documents are read `WINDOW` days at
+a time, most recent first, and summed per bucket as they come: a bucket is
+handed over as soon as the documents of the next one show up, so the rows
+of a long range are never all in memory.
+
+Each window is decoded into a `Series`, which keeps the buckets in columns
+and yields the rows the views have always rendered::
+
+    {'date': first day, 'end': last day, 'count': total, 'data': {key: value}}
+"""
+import itertools
+from datetime import date, datetime, timedelta
+from operator import itemgetter
+
+# How many days of documents are read at once. There's a document per day
+# for each add-on or collection.
+WINDOW = 365
+
+
+def bucket_start(day, group):
+    """The first day of the bucket of `day`; weeks start on Monday like ES."""
+    if group == 'week':
+        return day - timedelta(days=day.weekday())
+    elif group == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_end(start, group):
+    """The last day of the bucket starting on `start`."""
+    if group == 'week':
+        return start + timedelta(days=6)
+    elif group == 'month':
+        next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return next_month - timedelta(days=1)
+    return start
+
+
+def extract(dicts):
+    """Turn a list of dicts like we store in ES into one big dict.
+
+    Also works if the list of dicts is nested inside another dict.
+
+    >>> extract([{'k': 'a', 'v': 1}, {'k': 'b', 'v': 2}])
+    {'a': 1, 'b': 2}
+    """
+    if hasattr(dicts, 'items'):
+        return dict((k, extract(v)) for k, v in dicts.items())
+    return dict((d['k'], d['v']) for d in dicts)
+
+
+def add_data(total, data):
+    """Adds the values of the `data` breakdown to `total`, nested or not."""
+    for key, value in data.items():
+        if hasattr(value, 'items'):
+            add_data(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class Series(object):
+    """
+    The buckets of a series between `start` and `end` in columns, most
+    recent first: the first and last day of each bucket within the range,
+    its count and, for breakdowns, its data.
+    """
+
+    def __init__(self, group, start, end):
+        self.group, self.start, self.end = group, start, end
+        self.dates, self.ends, self.counts, self.data = [], [], [], []
+
+    def append(self, day, count, data=None):
+        first = bucket_start(day, self.group)
+        self.dates.append(max(first, self.start))
+        self.ends.append(min(bucket_end(first, self.group), self.end))
+        self.counts.append(count)
+        self.data.append(data)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __iter__(self):
+        columns = self.dates, self.ends, self.counts, self.data
+        for date_, end, count, data in itertools.izip(*columns):
+            row = {'date': date_, 'end': end, 'count': count}
+            if data is not None:
+                row['data'] = data
+            yield row
+
+
+class Reading(object):
+    """
+    The rows of `rows`, still to be read from elasticsearch as they're
+    iterated: a response sending them can be cut short by a failed query.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+def totals(model, group, start, end, **filters):
+    """Returns the `Series` of the counts of `model`, bucketed by ES."""
+    facet = {'date_histogram': {'key_field': 'date', 'value_field': 'count',
+                                'interval': group}}
+    qs = (model.search().query(date__gte=start, date__lte=end, **filters)
+          .facet(series=facet))
+    entries = qs[:0].raw()['facets']['series']['entries']
+    series = Series(group, start, end)
+    for entry in sorted(entries, key=itemgetter('time'), reverse=True):
+        # Buckets are keyed by their first millisecond, in UTC.
+        day = datetime.utcfromtimestamp(entry['time'] / 1000).date()
+        series.append(day, int(entry['total']))
+    return series
+
+
+def breakdowns(model, field, group, start, end, **filters):
+    """
+    Yields the rows of the counts of `model` and their `field` breakdown,
+    bucketed as the documents are read, most recent first.
+    """
+    bucket = None
+    for docs in windows(model, field, start, end, **filters):
+        series = Series(group, start, end)
+        for doc in docs:
+            # Convert the datetimes to a date.
+            day = bucket_start(date(*doc['date'].timetuple()[:3]), group)
+            if bucket and bucket[0] == day:
+                bucket[1] += doc['count']
+                add_data(bucket[2], extract(doc[field]))
+            else:
+                if bucket:
+                    series.append(*bucket)
+                bucket = [day, doc['count'], extract(doc[field])]
+        for row in series:
+            yield row
+    if bucket:
+        series = Series(group, start, end)
+        series.append(*bucket)
+        for row in series:
+            yield row
+
+
+def windows(model, field, start, end, **filters):
+    """Yields the documents from `end` back to `start`, `WINDOW` days each."""
+    while end >= start:
+        first = max(start, end - timedelta(days=WINDOW - 1))
+        qs = (model.search().order_by('-date')
+              .filter(date__range=(first, end), **filters)
+              .values_dict('date', 'count', field))[:WINDOW]
+        yield qs
+        end = first - timedelta(days=1)
@@ -26,7 +26,7 @@ from lib.es.utils import get_indices
 from .models import (AddonCollectionCount, CollectionCount, CollectionStats,
                      DownloadCount, UpdateCount)
 
-from . import search
+from . import search, totals
 
 log = commonware.log.getLogger('z.task')
 
@@ -177,6 +177,18 @@ def update_global_totals(job, date, **kw):
               % tuple(p))
 
 
+@task
+def update_global_totals_incremental(**kw):
+    """Updates the stats of `stats.totals` since its watermark."""
+    totals.update()
+
+
+@task
+def update_global_totals_range(start, end, **kw):
+    """Recomputes the stats of `stats.totals` for the days in [start, end]."""
+    totals.backfill(start, end)
+
+
 def _get_daily_jobs(date=None):
     """Return a dictionary of statisitics queries.
 
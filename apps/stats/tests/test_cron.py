@@ -12,9 +12,11 @@ from bandwagon.models import CollectionAddon, Collection
 from mkt.webapps.models import Installed
 from reviews.models import Review
 from stats.models import (Contribution, DownloadCount, GlobalStat,
-                          UpdateCount, AddonCollectionCount)
-from stats import cron, tasks
+                          GlobalStatWatermark, UpdateCount,
+                          AddonCollectionCount)
+from stats import cron, tasks, totals
 from users.models import UserProfile
+from versions.models import Version
 
 
 class TestGlobalStats(amo.tests.TestCase):
@@ -105,6 +107,119 @@ class TestGlobalStats(amo.tests.TestCase):
         eq_(tasks._get_daily_jobs()['mmo_developer_count_total'](), 1)
 
 
+class TestIncrementalTotals(amo.tests.TestCase):
+
+    def setUp(self):
+        self.day = datetime.date(2013, 6, 1)
+        self.next_day = self.day + datetime.timedelta(days=1)
+        self.users = 0
+
+    def user(self, created, source=amo.LOGIN_SOURCE_MMO_BROWSERID):
+        self.users += 1
+        p = UserProfile.objects.create(username='user%s' % self.users,
+                                       source=source)
+        p.update(created=created)
+        return p
+
+    def stat(self, name, date):
+        return GlobalStat.objects.no_cache().get(name=name, date=date).count
+
+    def test_compute(self):
+        self.user(datetime.datetime(2013, 5, 1))
+        self.user(datetime.datetime(2013, 6, 1, 23, 59))
+        self.user(datetime.datetime(2013, 6, 2, 0, 0),
+                  source=amo.LOGIN_SOURCE_UNKNOWN)
+        res = totals.compute(self.day, self.next_day)
+        eq_(res[self.day]['user_count_new'], 1)
+        eq_(res[self.day]['user_count_total'], 2)
+        eq_(res[self.next_day]['user_count_new'], 1)
+        eq_(res[self.next_day]['mmo_user_count_new'], 0)
+        eq_(res[self.next_day]['user_count_total'], 3)
+        eq_(res[self.next_day]['mmo_user_count_total'], 2)
+
+    def test_compute_dates(self):
+        addon = Addon.objects.create(type=amo.ADDON_EXTENSION)
+        DownloadCount.objects.create(addon=addon, count=5, date=self.day)
+        DownloadCount.objects.create(addon=addon, count=3,
+                                     date=self.next_day)
+        res = totals.compute(self.next_day, self.next_day)
+        eq_(res[self.next_day]['addon_downloads_new'], 3)
+        eq_(res[self.next_day]['addon_total_downloads'], 8)
+
+    def test_matches_daily_jobs(self):
+        addon = Addon.objects.create(type=amo.ADDON_WEBAPP)
+        user = self.user(datetime.datetime.now())
+        Review.objects.create(addon=addon, user=user)
+        Installed.objects.create(addon=addon, user=user)
+        today = datetime.date.today()
+        res = totals.compute(today, today)[today]
+        jobs = tasks._get_daily_jobs()
+        for name in ('apps_count_new', 'apps_count_installed',
+                     'apps_review_count_new', 'mmo_user_count_new',
+                     'mmo_user_count_total'):
+            eq_(res[name], jobs[name](), name)
+
+    def test_deleted(self):
+        user = self.user(datetime.datetime.now())
+        addon = Addon.objects.create(type=amo.ADDON_EXTENSION)
+        Version.objects.create(addon=addon)
+        Version.objects.create(addon=addon, deleted=True)
+        deleted = Addon.objects.create(type=amo.ADDON_WEBAPP,
+                                       status=amo.STATUS_DELETED)
+        Review.objects.create(addon=deleted, user=user)
+        today = datetime.date.today()
+        res = totals.compute(today, today)[today]
+        eq_(res['addon_count_new'], 1)
+        eq_(res['apps_count_new'], 0)
+        eq_(res['version_count_new'], 1)
+        eq_(res['apps_review_count_new'], 0)
+        jobs = tasks._get_daily_jobs()
+        for name in ('addon_count_new', 'version_count_new'):
+            eq_(res[name], jobs[name](), name)
+
+    def test_update(self):
+        self.user(datetime.datetime(2013, 5, 1))
+        self.user(datetime.datetime(2013, 6, 1, 12))
+        totals.update(self.day)
+        eq_(self.stat('user_count_total', self.day), 2)
+        watermark = GlobalStatWatermark.objects.get(name='user_count_total')
+        eq_(watermark.date, self.day - datetime.timedelta(days=1))
+        eq_(watermark.total, 1)
+
+        # Users added before the watermark aren't seen anymore.
+        self.user(datetime.datetime(2013, 1, 1))
+        self.user(datetime.datetime(2013, 6, 2, 12))
+        totals.update(self.next_day)
+        eq_(self.stat('user_count_new', self.next_day), 1)
+        eq_(self.stat('user_count_total', self.next_day), 3)
+        eq_(GlobalStatWatermark.objects.get(name='user_count_total').total,
+            2)
+
+    def test_backfill(self):
+        self.user(datetime.datetime(2013, 5, 1))
+        self.user(datetime.datetime(2013, 6, 2, 12))
+        totals.backfill(self.day, self.next_day)
+        eq_(self.stat('user_count_total', self.day), 1)
+        eq_(self.stat('user_count_total', self.next_day), 2)
+        eq_(GlobalStatWatermark.objects.count(), 0)
+
+    @mock.patch('stats.cron.TaskSet')
+    def test_cron(self, task_set):
+        cron.update_global_totals()
+        subtasks = task_set.call_args[0][0]
+        jobs = [t.kwargs.get('job') for t in subtasks]
+        assert 'user_count_total' not in jobs
+        assert 'addon_count_public' in jobs
+        eq_(subtasks[-1].task, tasks.update_global_totals_incremental.name)
+
+    @mock.patch('stats.cron.TaskSet')
+    def test_backfill_cron(self, task_set):
+        cron.backfill_global_totals('2013-01-01', '2013-03-01', days=30)
+        eq_([list(t.args) for t in task_set.call_args[0][0]],
+            [[datetime.date(2013, 1, 1), datetime.date(2013, 1, 30)],
+             [datetime.date(2013, 1, 31), datetime.date(2013, 3, 1)]])
+
+
 class TestGoogleAnalytics(amo.tests.TestCase):
     @mock.patch.object(settings, 'GOOGLE_ANALYTICS_CREDENTIALS',
                        {'access_token': '', 'client_id': '',
@@ -4,6 +4,8 @@ import datetime
 from decimal import Decimal
 import json
 
+from django.test.client import RequestFactory
+
 import mock
 from nose.tools import eq_
 from pyquery import PyQuery as pq
@@ -12,7 +14,7 @@ import amo.tests
 from amo.urlresolvers import reverse
 from access.models import Group, GroupUser
 from bandwagon.models import Collection
-from stats import views, tasks
+from stats import series, views, tasks
 from stats import search
 from stats.models import (CollectionCount, DownloadCount, GlobalStat,
                           UpdateCount)
@@ -363,6 +365,14 @@ class TestResponses(ESStatsTest):
             {'count': 1000, 'date': '2009-06-01', 'end': '2009-06-01'},
         ])
 
+    def test_usage_json_month(self):
+        r = self.get_view_response('stats.usage_series', group='month',
+                                   format='json')
+        eq_(r.status_code, 200)
+        self.assertListEqual(json.loads(r.content), [
+            {'count': 2500, 'date': '2009-06-01', 'end': '2009-06-30'},
+        ])
+
     def test_usage_csv(self):
         r = self.get_view_response('stats.usage_series', group='day',
                                    format='csv')
@@ -524,6 +534,23 @@ class TestResponses(ESStatsTest):
             }
         ])
 
+    def test_usage_by_status_json_week(self):
+        # 2009-06-01 was a Monday.
+        r = self.get_view_response('stats.statuses_series', group='week',
+                                   format='json')
+        eq_(r.status_code, 200)
+        self.assertListEqual(json.loads(r.content), [
+            {
+                "count": 2500,
+                "date": "2009-06-01",
+                "end": "2009-06-07",
+                "data": {
+                    "userDisabled": 180,
+                    "userEnabled": 2320
+                }
+            }
+        ])
+
     def test_usage_by_status_csv(self):
         r = self.get_view_response('stats.statuses_series', group='day',
                                    format='csv')
@@ -735,6 +762,103 @@ class TestResponses(ESStatsTest):
                           2009-06-01,1,5.0,5.0""")
 
 
+class TestSeries(amo.tests.TestCase):
+
+    def setUp(self):
+        self.start = datetime.date(2012, 1, 1)
+        self.end = datetime.date(2012, 3, 15)
+
+    def doc(self, day, count, data):
+        return {'date': datetime.datetime(2012, 1, 1) +
+                        datetime.timedelta(days=day),
+                'count': count, 'data': search.es_dict(data)}
+
+    def test_buckets(self):
+        day = datetime.date(2012, 2, 15)
+        eq_(series.bucket_start(day, 'day'), day)
+        eq_(series.bucket_start(day, 'week'), datetime.date(2012, 2, 13))
+        eq_(series.bucket_start(day, 'month'), datetime.date(2012, 2, 1))
+        eq_(series.bucket_end(datetime.date(2012, 2, 13), 'week'),
+            datetime.date(2012, 2, 19))
+        eq_(series.bucket_end(datetime.date(2012, 2, 1), 'month'),
+            datetime.date(2012, 2, 29))
+        eq_(series.bucket_end(datetime.date(2012, 12, 1), 'month'),
+            datetime.date(2012, 12, 31))
+
+    def test_add_data(self):
+        total = {'a': 1, 'apps': {'fx': {'4.0': 1}}}
+        series.add_data(total, {'a': 2, 'b': 3, 'apps': {'fx': {'4.0': 1,
+                                                                '5.0': 2}}})
+        eq_(total, {'a': 3, 'b': 3, 'apps': {'fx': {'4.0': 2, '5.0': 2}}})
+
+    @mock.patch('stats.series.windows')
+    def test_breakdowns(self, windows):
+        # Most recent first, split across two windows.
+        windows.return_value = [
+            [self.doc(60, 1, {'a': 1}), self.doc(31, 2, {'a': 2})],
+            [self.doc(30, 4, {'a': 1, 'b': 3}), self.doc(0, 8, {'b': 1})]]
+        rows = list(series.breakdowns(DownloadCount, 'data', 'month',
+                                      self.start, self.end))
+        eq_(rows, [
+            {'date': datetime.date(2012, 3, 1),
+             'end': datetime.date(2012, 3, 15),
+             'count': 1, 'data': {'a': 1}},
+            {'date': datetime.date(2012, 2, 1),
+             'end': datetime.date(2012, 2, 29),
+             'count': 2, 'data': {'a': 2}},
+            {'date': datetime.date(2012, 1, 1),
+             'end': datetime.date(2012, 1, 31),
+             'count': 12, 'data': {'a': 1, 'b': 4}}])
+
+    def test_zip_overview(self):
+        downloads = series.Series('day', self.start, self.end)
+        downloads.append(datetime.date(2012, 1, 3), 10)
+        updates = series.Series('day', self.start, self.end)
+        updates.append(datetime.date(2012, 1, 4), 20)
+        updates.append(datetime.date(2012, 1, 1), 30)
+        eq_([(r['date'].day, r['data']['downloads'], r['data']['updates'])
+             for r in views.zip_overview(downloads, updates)],
+            [(4, 0, 20), (3, 10, 0), (2, 0, 0), (1, 0, 30)])
+
+    def test_reading_failure_not_cached(self):
+        def rows():
+            yield {'date': self.start, 'count': 1}
+            raise ValueError('Elasticsearch went away.')
+        request = RequestFactory().get('/')
+        r = views.render_json(request, None, series.Reading(rows()))
+        eq_(r['Cache-Control'], 'max-age=0')
+        with self.assertRaises(ValueError):
+            r.content
+
+        totals = series.Series('day', self.start, self.end)
+        totals.append(self.start, 1)
+        r = views.render_json(request, None, totals)
+        eq_(r['Cache-Control'], 'max-age=604800')
+
+    @mock.patch('stats.views.get_series')
+    def test_reading_locales_not_cached(self, get_series):
+        def rows():
+            yield {'date': self.start, 'count': 1, 'data': {'en-us': 1}}
+            raise ValueError('Elasticsearch went away.')
+        get_series.return_value = series.Reading(rows())
+        addon = amo.tests.addon_factory(public_stats=True)
+        request = RequestFactory().get('/')
+        r = views.usage_breakdown_series(
+            request, addon_id=addon.slug, group='day', start='20120101',
+            end='20120131', format='json', field='locales')
+        eq_(r['Cache-Control'], 'max-age=0')
+        with self.assertRaises(ValueError):
+            r.content
+
+    def test_csv_fields(self):
+        rows, fields = views.csv_fields(
+            {'date': self.start, 'count': n, 'data': {'a': n}}
+            for n in xrange(3))
+        eq_(fields, set(['a']))
+        eq_(list(rows), [{'date': self.start, 'count': n, 'a': n}
+                         for n in xrange(3)])
+
+
 # Test the SQL query by using known dates, for weeks and months etc.
 class TestSiteQuery(amo.tests.TestCase):
 
@@ -0,0 +1,236 @@
+"""
+Incremental global stats.
+
+The daily counters of each table are computed together, with a single query
+grouped by day over the rows of the days asked for only::
+
+    SELECT DATE(created), COUNT(*), SUM(source = 4) FROM users
+    WHERE created >= '2013-06-01' AND created < '2013-06-02' GROUP BY 1
+
+Totals are the total of the day before plus the counters of the day. The
+totals up to the last complete day are kept in `GlobalStatWatermark`, so
+the nightly run only looks at the rows added since; the first run (or a
+backfill) starts from a count of everything before its first day.
+"""
+import datetime
+import json
+
+from django.db import connection, transaction
+
+import commonware.log
+
+import amo
+from mkt.monolith.models import MonolithRecord
+
+from .models import GlobalStatWatermark
+
+log = commonware.log.getLogger('z.task')
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+class Table(object):
+    """
+    The counters of `table` (SQL expressions), grouped by the day in
+    `date_column`, and the totals kept from some of them: `totals` maps the
+    name of a total to the name of its counter. Counters starting with an
+    underscore only feed a total and aren't saved. `where` is an SQL
+    condition on the rows counted, such as leaving out deleted ones.
+    """
+
+    def __init__(self, table, counters, totals=None, date_column='created',
+                 is_date=False, joins='', where=None):
+        self.table = table
+        self.counters = counters
+        self.totals = totals or {}
+        self.date_column = date_column
+        self.is_date = is_date
+        self.joins = joins
+        self.where = where
+
+    def query(self, select, where, params, group=''):
+        names = sorted(self.counters)
+        if self.where:
+            where = '%s AND %s' % (where, self.where)
+        sql = 'SELECT %s FROM %s t %s WHERE %s %s' % (
+            ', '.join(select + ['%s' % self.counters[n] for n in names]),
+            self.table, self.joins, where, group)
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return names, cursor.fetchall()
+
+    def daily(self, start, end):
+        """Returns `{day: {counter: value}}` for the days in [start, end]."""
+        column = 't.%s' % self.date_column
+        if self.is_date:
+            day = column
+            where = '%s BETWEEN %%s AND %%s' % column
+            params = [start, end]
+        else:
+            # A range on the column itself, unlike DATE(created) = x, can use
+            # the index on created.
+            day = 'DATE(%s)' % column
+            where = '%s >= %%s AND %s < %%s' % (column, column)
+            params = [start, end + ONE_DAY]
+        names, rows = self.query([day], where, params, group='GROUP BY 1')
+        days = {}
+        for row in rows:
+            day = row[0]
+            if isinstance(day, datetime.datetime):
+                day = day.date()
+            days[day] = dict(zip(names, [int(v or 0) for v in row[1:]]))
+        return days
+
+    def before(self, start):
+        """Returns the totals of everything before `start`."""
+        names, rows = self.query([], 't.%s < %%s' % self.date_column,
+                                 [start])
+        counters = dict(zip(names, [int(v or 0) for v in rows[0]]))
+        return dict((total, counters[counter])
+                    for total, counter in self.totals.items())
+
+
+APP = amo.ADDON_WEBAPP
+
+TABLES = [
+    Table('users', {
+        'user_count_new': 'COUNT(*)',
+        'mmo_user_count_new':
+            'SUM(t.source = %s)' % amo.LOGIN_SOURCE_MMO_BROWSERID,
+    }, totals={'user_count_total': 'user_count_new',
+               'mmo_user_count_total': 'mmo_user_count_new'}),
+    # Like Addon.objects and Version.objects, deleted ones aren't counted.
+    Table('addons', {
+        'addon_count_new': 'COUNT(*)',
+        'apps_count_new': 'SUM(t.addontype_id = %s)' % APP,
+    }, where='t.status != %s' % amo.STATUS_DELETED),
+    Table('versions', {'version_count_new': 'COUNT(*)'},
+          where='t.deleted = 0'),
+    Table('reviews', {
+        'review_count_new': 'SUM(t.editorreview = 0)',
+        'apps_review_count_new':
+            'SUM(t.editorreview = 0 AND a.addontype_id = %s)' % APP,
+    }, totals={'review_count_total': 'review_count_new'},
+       joins='LEFT JOIN addons a ON a.id = t.addon_id AND a.status != %s'
+             % amo.STATUS_DELETED),
+    Table('collections', {
+        'collection_count_new': 'COUNT(*)',
+        '_collection_autopublishers_new':
+            'SUM(t.collection_type = %s)' % amo.COLLECTION_SYNCHRONIZED,
+    }, totals={'collection_count_total': 'collection_count_new',
+               'collection_count_autopublishers':
+                   '_collection_autopublishers_new'}),
+    Table('users_install', {
+        'apps_count_installed': 'SUM(a.addontype_id = %s)' % APP,
+    }, joins='INNER JOIN addons a ON a.id = t.addon_id'),
+    Table('download_counts', {
+        'addon_downloads_new': 'SUM(t.count)',
+    }, totals={'addon_total_downloads': 'addon_downloads_new'},
+       date_column='date', is_date=True),
+    Table('stats_addons_collections_counts', {
+        '_collection_addon_downloads_new': 'SUM(t.count)',
+    }, totals={'collection_addon_downloads':
+                   '_collection_addon_downloads_new'},
+       date_column='date', is_date=True),
+]
+
+# Every stat computed here, the other daily jobs are left to
+# stats.tasks._get_daily_jobs.
+STATS = set(name for table in TABLES
+            for name in table.counters.keys() + table.totals.keys()
+            if not name.startswith('_'))
+
+
+def compute(start, end, anchors=None):
+    """
+    Computes the stats of every day in [start, end].
+
+    `anchors` are the totals at the end of the day before `start`, they are
+    counted from the tables when not given. Returns `{day: {stat: value}}`.
+    """
+    days = [start + ONE_DAY * i for i in range((end - start).days + 1)]
+    results = dict((day, {}) for day in days)
+    for table in TABLES:
+        if not table.totals:
+            running = {}
+        elif anchors is not None:
+            running = dict((t, anchors[t]) for t in table.totals)
+        else:
+            running = table.before(start)
+        daily = table.daily(start, end)
+        for day in days:
+            counters = daily.get(day, {})
+            for name in table.counters:
+                results[day][name] = counters.get(name, 0)
+            for total, counter in table.totals.items():
+                running[total] += counters.get(counter, 0)
+                results[day][total] = running[total]
+    return results
+
+
+def save(results):
+    """Writes `{day: {stat: value}}` to the global_stats (and monolith)."""
+    rows, records = [], []
+    for day, stats in sorted(results.items()):
+        for name, value in sorted(stats.items()):
+            if name.startswith('_'):
+                continue
+            rows.append((name, value, day))
+            # monolith is only used for marketplace
+            if name.startswith(('apps', 'mmo')):
+                records.append(MonolithRecord(
+                    recorded=day, key=name, user_hash='none',
+                    value=json.dumps({'count': value})))
+    if not rows:
+        return
+
+    cursor = connection.cursor()
+    cursor.execute('REPLACE INTO global_stats (`name`, `count`, `date`) '
+                   'VALUES %s' % ', '.join(['(%s, %s, %s)'] * len(rows)),
+                   [v for row in rows for v in row])
+    transaction.commit_unless_managed()
+    MonolithRecord.objects.bulk_create(records)
+
+
+def update(today=None):
+    """
+    Computes and saves the stats of every day since the watermark, up to
+    `today`, then moves the watermark to the day before `today`, the last
+    complete day.
+    """
+    today = today or datetime.date.today()
+    yesterday = today - ONE_DAY
+    totals = set(t for table in TABLES for t in table.totals)
+    marks = dict((m.name, m) for m in GlobalStatWatermark.objects.all())
+
+    if set(marks) == totals and len(set(m.date for m in marks.values())) == 1:
+        start = marks.values()[0].date + ONE_DAY
+        anchors = dict((name, m.total) for name, m in marks.items())
+    else:
+        log.info('No usable global stats watermark, counting everything.')
+        start, anchors = today, None
+    if start > today:
+        return
+
+    log.info('Updating global stats from %s to %s.' % (start, today))
+    results = compute(start, today, anchors)
+    save(results)
+
+    if start <= yesterday:
+        final = results[yesterday]
+    elif anchors is not None:
+        return
+    else:
+        # The first run counted everything before today.
+        final = dict((t, results[today][t] - results[today][counter])
+                     for table in TABLES
+                     for t, counter in table.totals.items())
+    for name in totals:
+        GlobalStatWatermark(name=name, date=yesterday,
+                            total=final[name]).save()
+
+
+def backfill(start, end):
+    """Recomputes and saves the stats of the days in [start, end]."""
+    log.info('Backfilling global stats from %s to %s.' % (start, end))
+    save(compute(start, end))
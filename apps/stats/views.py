@@ -1,16 +1,16 @@
+import cPickle
 import csv
 import cStringIO
 import itertools
 import logging
+import tempfile
 import time
-from types import GeneratorType
 from datetime import date, timedelta
 
 from django import http
 from django.conf import settings
 from django.db import connection
 from django.db.models import Avg, Count, Sum, Q
-from django.utils import simplejson
 from django.utils.cache import add_never_cache_headers, patch_cache_control
 from django.utils.datastructures import SortedDict
 from django.core.serializers.json import DjangoJSONEncoder
@@ -34,6 +34,7 @@ from amo.decorators import allow_cross_site_request, json_view, login_required
 from amo.urlresolvers import reverse
 from amo.utils import memoize
 
+from . import series as stats_series
 from .models import CollectionCount, Contribution, DownloadCount, UpdateCount
 
 
@@ -50,6 +51,11 @@ GLOBAL_SERIES = ('addons_in_use', 'addons_updated', 'addons_downloaded',
                  'mmo_user_count_total', 'mmo_user_count_new',
                  'mmo_total_visitors', 'reviews_created', 'addons_created',
                  'users_created', 'my_apps')
+# Bytes of rows held in memory before spooling them to disk, see
+# `csv_fields`.
+CSV_SPOOL_SIZE = 1024 * 1024
+# Rows written to the CSV buffer before it's sent.
+CSV_CHUNK_ROWS = 100
 
 
 def dashboard(request):
@@ -61,25 +67,21 @@ def dashboard(request):
                          'stats_base_url': stats_base_url})
 
 
-def get_series(model, extra_field=None, **filters):
+def get_series(model, extra_field=None, group='day', **filters):
     """
-    Get a generator of dicts for the stats model given by the filters.
+    Get the rows of the stats model given by the filters, bucketed by
+    `group`, most recent first. `date__range` is required.
 
-    Returns {'date': , 'count': } by default. Add an extra field (such as
-    application faceting) by passing `extra_field=apps`. `apps` should be in
-    the query result.
+    Returns {'date': , 'end': , 'count': } by default. Add an extra field
+    (such as application faceting) by passing `extra_field=apps`, its
+    breakdown is returned in `data`. Totals are a `stats.series.Series`,
+    breakdowns a `stats.series.Reading`.
     """
-    extra = () if extra_field is None else (extra_field,)
-    # Put a slice on it so we get more than 10 (the default), but limit to 365.
-    qs = (model.search().order_by('-date').filter(**filters)
-          .values_dict('date', 'count', *extra))[:365]
-    for val in qs:
-        # Convert the datetimes to a date.
-        date_ = date(*val['date'].timetuple()[:3])
-        rv = dict(count=val['count'], date=date_, end=date_)
-        if extra_field:
-            rv['data'] = extract(val[extra_field])
-        yield rv
+    start, end = filters.pop('date__range')
+    if extra_field is None:
+        return stats_series.totals(model, group, start, end, **filters)
+    return stats_series.Reading(stats_series.breakdowns(
+        model, extra_field, group, start, end, **filters))
 
 
 def csv_fields(series):
@@ -87,28 +89,27 @@ def csv_fields(series):
     Figure out all the keys in the `data` dict for csv columns.
 
     Returns (series, fields). The series only contains the `data` dicts, plus
-    `count` and `date` from the top level.
+    `count` and `date` from the top level. The fields have to be known
+    before the first row is written, so the rows are spooled to a temporary
+    file, on disk past `CSV_SPOOL_SIZE`, while they're collected.
     """
-    rv = []
     fields = set()
+    spool = tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_SIZE)
     for row in series:
         fields.update(row['data'])
-        rv.append(row['data'])
         row['data'].update(count=row['count'], date=row['date'])
-    return rv, fields
+        cPickle.dump(row['data'], spool, cPickle.HIGHEST_PROTOCOL)
+    spool.seek(0)
+    return unspool(spool), fields
 
 
-def extract(dicts):
-    """Turn a list of dicts like we store in ES into one big dict.
-
-    Also works if the list of dicts is nested inside another dict.
-
-    >>> extract([{'k': 'a', 'v': 1}, {'k': 'b', 'v': 2}])
-    {'a': 1, 'b': 2}
-    """
-    if hasattr(dicts, 'items'):
-        return dict((k, extract(v)) for k, v in dicts.items())
-    return dict((d['k'], d['v']) for d in dicts)
+def unspool(spool):
+    with spool:
+        while True:
+            try:
+                yield cPickle.load(spool)
+            except EOFError:
+                return
 
 
 @addon_view
@@ -117,8 +118,10 @@ def overview_series(request, addon, group, start, end, format):
     date_range = check_series_params_or_404(group, start, end, format)
     check_stats_permission(request, addon)
 
-    dls = get_series(DownloadCount, addon=addon.id, date__range=date_range)
-    updates = get_series(UpdateCount, addon=addon.id, date__range=date_range)
+    dls = get_series(DownloadCount, group=group, addon=addon.id,
+                     date__range=date_range)
+    updates = get_series(UpdateCount, group=group, addon=addon.id,
+                         date__range=date_range)
 
     series = zip_overview(dls, updates)
 
@@ -126,33 +129,22 @@ def overview_series(request, addon, group, start, end, format):
 
 
 def zip_overview(downloads, updates):
-    # Jump through some hoops to make sure we're matching dates across download
-    # and update series and inserting zeroes for any missing days.
-    downloads, updates = list(downloads), list(updates)
-    if not (downloads or updates):
-        return
-    start_date = None
-    if downloads:
-        start_date = downloads[0]['date']
-    if updates:
-        d = updates[0]['date']
-        start_date = max(start_date, d) if start_date else d
-    downloads, updates = iter(downloads), iter(updates)
-
-    def iterator(series):
-        item = next(series)
-        next_date = start_date
-        while 1:
-            if item['date'] == next_date:
-                yield item['count']
-                item = next(series)
-            else:
-                yield 0
-            next_date = next_date - timedelta(days=1)
-
-    series = itertools.izip_longest(iterator(downloads), iterator(updates))
-    for idx, (dl_count, up_count) in enumerate(series):
-        yield {'date': start_date - timedelta(days=idx),
+    """
+    Matches the buckets of the download and update `Series`, most recent
+    first, with zeroes for the buckets missing from one of them and for
+    every day missing from both when grouping by day.
+    """
+    counts = {}
+    for idx, series in enumerate((downloads, updates)):
+        for date_, count in zip(series.dates, series.counts):
+            counts.setdefault(date_, [0, 0])[idx] = count
+    dates = sorted(counts, reverse=True)
+    if dates and downloads.group == 'day':
+        dates = [dates[0] - timedelta(days=n)
+                 for n in xrange((dates[0] - dates[-1]).days + 1)]
+    for date_ in dates:
+        dl_count, up_count = counts.get(date_, (0, 0))
+        yield {'date': date_,
                'data': {'downloads': dl_count, 'updates': up_count}}
 
 
@@ -162,7 +154,8 @@ def downloads_series(request, addon, group, start, end, format):
     date_range = check_series_params_or_404(group, start, end, format)
     check_stats_permission(request, addon)
 
-    series = get_series(DownloadCount, addon=addon.id, date__range=date_range)
+    series = get_series(DownloadCount, group=group, addon=addon.id,
+                        date__range=date_range)
 
     if format == 'csv':
         return render_csv(request, addon, series, ['date', 'count'])
@@ -177,7 +170,7 @@ def sources_series(request, addon, group, start, end, format):
     check_stats_permission(request, addon)
 
     series = get_series(DownloadCount, extra_field='_source.sources',
-                        addon=addon.id, date__range=date_range)
+                        group=group, addon=addon.id, date__range=date_range)
 
     if format == 'csv':
         series, fields = csv_fields(series)
@@ -193,7 +186,8 @@ def usage_series(request, addon, group, start, end, format):
     date_range = check_series_params_or_404(group, start, end, format)
     check_stats_permission(request, addon)
 
-    series = get_series(UpdateCount, addon=addon.id, date__range=date_range)
+    series = get_series(UpdateCount, group=group, addon=addon.id,
+                        date__range=date_range)
 
     if format == 'csv':
         return render_csv(request, addon, series, ['date', 'count'])
@@ -216,9 +210,10 @@ def usage_breakdown_series(request, addon, group,
         'statuses': '_source.status',
     }
     series = get_series(UpdateCount, extra_field=fields[field],
-                        addon=addon.id, date__range=date_range)
+                        group=group, addon=addon.id, date__range=date_range)
     if field == 'locales':
-        series = process_locales(series)
+        # Still read from elasticsearch as the response is sent.
+        series = stats_series.Reading(process_locales(series))
 
     if format == 'csv':
         if field == 'applications':
@@ -644,16 +639,8 @@ def _collection_query(request, collection, start=None, end=None):
     if not collection.can_view_stats(request):
         raise PermissionDenied
 
-    qs = (CollectionCount.search().order_by('-date')
-                         .filter(id=int(collection.pk),
-                                 date__range=(start, end))
-                         .values_dict())[:365]
-    series = []
-    for val in qs:
-        date_ = date(*val['date'].timetuple()[:3])
-        series.append(dict(count=val['count'], date=date_, end=date_,
-                           data=extract(val['data'])))
-    return series
+    return get_series(CollectionCount, extra_field='_source.data',
+                      id=int(collection.pk), date__range=(start, end))
 
 
 def collection(request, uuid, format, start=None, end=None):
@@ -666,9 +653,13 @@ def collection(request, uuid, format, start=None, end=None):
     return render_json(request, collection, series)
 
 
-def fudge_headers(response, stats):
-    """Alter cache headers. Don't cache content where data could be missing."""
-    if not stats:
+def fudge_headers(response, stats, reading=False):
+    """
+    Alter cache headers. Don't cache content where data could be missing:
+    there are no `stats`, or they're still `reading` from elasticsearch
+    as the response is sent.
+    """
+    if not stats or reading:
         add_never_cache_headers(response)
     else:
         seven_days = 60 * 60 * 24 * 7
@@ -706,36 +697,68 @@ class UnicodeCSVDictWriter(csv.DictWriter):
             self.writerow(rowdict)
 
 
+def peek(stats):
+    """Returns `(has_stats, stats)`, with `stats` still an iterable."""
+    stats = iter(stats)
+    for first in stats:
+        return True, itertools.chain([first], stats)
+    return False, stats
+
+
+class ChunkWriter(list):
+    """A stream keeping what's written to it, to send it in chunks."""
+    write = list.append
+
+    def flush(self):
+        chunk = u''.join(self)
+        del self[:]
+        return chunk
+
+
+def csv_stream(header, stats, fields):
+    buf = ChunkWriter([header])
+    writer = UnicodeCSVDictWriter(buf, fields, restval=0,
+                                  extrasaction='ignore')
+    writer.writeheader()
+    for idx, row in enumerate(stats, 1):
+        writer.writerow(row)
+        if idx % CSV_CHUNK_ROWS == 0:
+            yield buf.flush()
+    yield buf.flush()
+
+
+def json_stream(stats):
+    # Django's encoder supports date and datetime.
+    encoder = DjangoJSONEncoder()
+    yield '['
+    for idx, row in enumerate(stats):
+        yield (', ' if idx else '') + encoder.encode(row)
+    yield ']'
+
+
 @allow_cross_site_request
 def render_csv(request, addon, stats, fields,
                title=None, show_disclaimer=None):
-    """Render a stats series in CSV."""
+    """Render a stats series in CSV, sent as the rows are read."""
     # Start with a header from the template.
     ts = time.strftime('%c %z')
     context = {'addon': addon, 'timestamp': ts, 'title': title,
                'show_disclaimer': show_disclaimer}
-    response = jingo.render(request, 'stats/csv_header.txt', context)
+    header = jingo.render_to_string(request, 'stats/csv_header.txt', context)
 
-    writer = UnicodeCSVDictWriter(response, fields, restval=0,
-                                  extrasaction='ignore')
-    writer.writeheader()
-    writer.writerows(stats)
-
-    fudge_headers(response, list)
-    response['Content-Type'] = 'text/csv; charset=utf-8'
+    reading = isinstance(stats, stats_series.Reading)
+    has_stats, stats = peek(stats)
+    response = http.HttpResponse(csv_stream(header, stats, fields),
+                                 content_type='text/csv; charset=utf-8')
+    fudge_headers(response, has_stats, reading)
     return response
 
 
 @allow_cross_site_request
 def render_json(request, addon, stats):
-    """Render a stats series in JSON."""
-    response = http.HttpResponse(mimetype='text/json')
-
-    # XXX: Subclass DjangoJSONEncoder to handle generators.
-    if isinstance(stats, GeneratorType):
-        stats = list(stats)
-
-    # Django's encoder supports date and datetime.
-    fudge_headers(response, stats)
-    simplejson.dump(stats, response, cls=DjangoJSONEncoder)
+    """Render a stats series in JSON, sent as the rows are read."""
+    reading = isinstance(stats, stats_series.Reading)
+    has_stats, stats = peek(stats)
+    response = http.HttpResponse(json_stream(stats), mimetype='text/json')
+    fudge_headers(response, has_stats, reading)
     return response
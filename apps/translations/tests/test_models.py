@@ -11,7 +11,7 @@ from test_utils import ExtraAppTestCase, trans_eq
 from testapp.models import TranslatedModel, UntranslatedModel, FancyModel
 from translations.models import (Translation, PurifiedTranslation,
                                  TranslationSequence)
-from translations import widgets
+from translations import transformer, widgets
 from translations.query import order_by_translation
 
 
@@ -347,6 +347,76 @@ class TranslationTestCase(ExtraAppTestCase):
         eq_(obj.no_locale.locale, 'fr')
 
 
+class TranslationLoaderTestCase(ExtraAppTestCase):
+    fixtures = ['testapp/test_models.json']
+    extra_apps = ['translations.tests.testapp']
+
+    def setUp(self):
+        super(TranslationLoaderTestCase, self).setUp()
+        translation.activate('en-US')
+        self.models = list(TranslatedModel.objects.no_transforms())
+        self.fancy = list(FancyModel.objects.no_transforms())
+
+    def tearDown(self):
+        super(TranslationLoaderTestCase, self).tearDown()
+        transformer.end_identity_map(None)
+        translation.deactivate()
+
+    def test_mixed_models(self):
+        with self.assertNumQueries(1):
+            transformer.get_trans(self.models + self.fancy)
+        m = dict((m.id, m) for m in self.models)[1]
+        trans_eq(m.name, 'some name', 'en-US')
+        trans_eq(m.no_locale, 'blammo', 'en-US')
+        assert isinstance(self.fancy[0].purified, PurifiedTranslation)
+
+    def test_fallback(self):
+        translation.activate('fr')
+        transformer.get_trans(self.models)
+        by_id = dict((m.id, m) for m in self.models)
+        trans_eq(by_id[1].name, 'some name', 'en-US')
+        trans_eq(by_id[3].name, 'frenchie', 'fr')
+        eq_(by_id[3].description, None)
+
+    def test_batch(self):
+        with self.assertNumQueries(3):
+            with transformer.batch():
+                m = TranslatedModel.objects.get(id=1)
+                fancy = FancyModel.objects.get(id=1)
+                eq_(m.name, None)
+        trans_eq(m.name, 'some name', 'en-US')
+        eq_(fancy.linkified.localized_string, '<i>x</i> http://yyy.com')
+
+    def test_batch_cached(self):
+        with transformer.batch():
+            TranslatedModel.objects.get(id=1)
+        with self.assertNumQueries(0):
+            with transformer.batch():
+                m = TranslatedModel.objects.get(id=1)
+        assert m.from_cache
+        trans_eq(m.name, 'some name', 'en-US')
+
+    def test_identity_map(self):
+        transformer.start_identity_map(None)
+        transformer.get_trans(self.models)
+        with self.assertNumQueries(0):
+            transformer.get_trans(list(TranslatedModel.objects
+                                       .no_transforms()))
+
+        # Saving a translation empties the map.
+        m = TranslatedModel.objects.get(id=1)
+        m.name = 'new name'
+        m.save()
+        m = TranslatedModel.objects.no_transforms().get(id=1)
+        transformer.get_trans([m])
+        trans_eq(m.name, 'new name', 'en-US')
+
+    def test_no_identity_map(self):
+        transformer.get_trans(self.models)
+        with self.assertNumQueries(1):
+            transformer.get_trans(self.models)
+
+
 def test_translation_bool():
     t = lambda s: Translation(localized_string=s)
 
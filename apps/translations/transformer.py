@@ -1,87 +1,207 @@
+"""
+Attaches translations to model instances.
+
+The translations of any mix of instances (add-ons, their versions, previews,
+categories...) are fetched with a single `WHERE id IN` query on the
+translations table, using the translation ids the instances already carry.
+
+Within a request, fetched translations are kept in an identity map so that
+the same translations are not fetched twice, and `batch()` lets code that
+loads several kinds of objects fetch all of their translations at once.
+"""
+from contextlib import contextmanager
+from threading import local
+
 from django.conf import settings
+from django.core.signals import request_finished, request_started
 from django.db import connections, models
+from django.dispatch import receiver
 from django.utils import translation
 
 import multidb
 
-from translations.models import Translation
+from amo.models import defer_caching
+from translations.models import (LinkifiedTranslation, PurifiedTranslation,
+                                 Translation)
 from translations.fields import TranslatedField
 
-isnull = """IF(!ISNULL({t1}.localized_string), {t1}.{col}, {t2}.{col})
-            AS {name}_{col}"""
-join = """LEFT OUTER JOIN translations {t}
-          ON ({t}.id={model}.{name} AND {t}.locale={locale})"""
-no_locale_join = """LEFT OUTER JOIN translations {t}
-                    ON {t}.id={model}.{name}"""
-
 trans_fields = [f.name for f in Translation._meta.fields]
 
+# Stands for "any locale", used by fields with require_locale=False.
+ANY = '*'
 
-def build_query(model, connection):
-    qn = connection.ops.quote_name
-    selects, joins, params = [], [], []
+_local = local()
 
-    # The model can define a fallback locale (which may be a Field).
-    if hasattr(model, 'get_fallback'):
-        fallback = model.get_fallback()
-    else:
-        fallback = settings.LANGUAGE_CODE
 
-    if not hasattr(model._meta, 'translated_fields'):
-        model._meta.translated_fields = [f for f in model._meta.fields
-                                         if isinstance(f, TranslatedField)]
+def get_plan(model):
+    """
+    Returns `(fallback, [(name, attname, require_locale), ...])` for the
+    translated fields of `model`, computed once per model.
+    """
+    plan = model._meta.__dict__.get('_translation_plan')
+    if plan is None:
+        if not hasattr(model._meta, 'translated_fields'):
+            model._meta.translated_fields = [
+                f for f in model._meta.fields
+                if isinstance(f, TranslatedField)]
 
-    # Add the selects and joins for each translated field on the model.
-    for field in model._meta.translated_fields:
+        # The model can define a fallback locale (which may be a Field).
+        if hasattr(model, 'get_fallback'):
+            fallback = model.get_fallback()
+        else:
+            fallback = settings.LANGUAGE_CODE
         if isinstance(fallback, models.Field):
-            fallback_str = '%s.%s' % (qn(model._meta.db_table),
-                                      qn(fallback.column))
+            fallback = fallback.attname, True
         else:
-            fallback_str = '%s'
-
-        name = field.column
-        d = {'t1': 't1_' + name, 't2': 't2_' + name,
-             'model': qn(model._meta.db_table), 'name': name}
-
-        selects.extend(isnull.format(col=f, **d) for f in trans_fields)
-
-        joins.append(join.format(t=d['t1'], locale='%s', **d))
-        params.append(translation.get_language())
-
-        if field.require_locale:
-            joins.append(join.format(t=d['t2'], locale=fallback_str, **d))
-            if not isinstance(fallback, models.Field):
-                params.append(fallback)
+            fallback = fallback, False
+
+        fields = [(f.name, f.attname, f.require_locale)
+                  for f in model._meta.translated_fields]
+        plan = model._meta._translation_plan = fallback, fields
+    return plan
+
+
+def _wanted(items, lang):
+    """
+    Yields `(item, name, translation id, locale, fallback locale)` for every
+    translated field of `items` that has a translation id.
+    """
+    for item in items:
+        (fallback, is_field), fields = get_plan(item.__class__)
+        if is_field:
+            fallback = getattr(item, fallback)
+        fallback = (fallback or '').lower()
+        for name, attname, require_locale in fields:
+            trans_id = getattr(item, attname)
+            if trans_id is not None:
+                yield (item, name, trans_id, lang,
+                       fallback if require_locale else ANY)
+
+
+def fetch(keys):
+    """
+    Fetches the translation rows for `keys`, `(id, locale)` pairs where the
+    locale can be `ANY`, in one query. Returns `{key: row}`, rows that
+    don't exist are None.
+    """
+    rows = identity_map()
+    found, missing = {}, set()
+    for key in keys:
+        if rows is not None and key in rows:
+            found[key] = rows[key]
         else:
-            joins.append(no_locale_join.format(t=d['t2'], **d))
+            missing.add(key)
+    if not missing:
+        return found
+
+    ids = set(id for id, locale in missing if locale != ANY)
+    locales = set(locale for id, locale in missing if locale != ANY)
+    any_ids = set(id for id, locale in missing if locale == ANY)
+    where, params = [], []
+    if ids:
+        where.append('(id IN (%s) AND locale IN (%s))' % (
+            ','.join(map(str, ids)), ','.join(['%s'] * len(locales))))
+        params.extend(locales)
+    if any_ids:
+        where.append('id IN (%s)' % ','.join(map(str, any_ids)))
+    sql = 'SELECT %s FROM translations WHERE %s ORDER BY autoid' % (
+        ','.join(trans_fields), ' OR '.join(where))
+
+    cursor = connections[multidb.get_slave()].cursor()
+    cursor.execute(sql, params)
+    for key in missing:
+        found[key] = None
+    for row in cursor.fetchall():
+        row = dict(zip(trans_fields, row))
+        # MySQL compares locales case insensitively, so do we.
+        key = row['id'], row['locale'].lower()
+        if key in missing:
+            found[key] = row
+        key = row['id'], ANY
+        if (key in missing and found[key] is None
+            and row['localized_string'] is not None):
+            found[key] = row
 
-    # ids will be added later on.
-    sql = """SELECT {model}.{pk}, {selects} FROM {model} {joins}
-             WHERE {model}.{pk} IN {{ids}}"""
-    s = sql.format(selects=','.join(selects), joins='\n'.join(joins),
-                   model=qn(model._meta.db_table), pk=model._meta.pk.column)
-    return s, params
+    if rows is not None:
+        rows.update((key, found[key]) for key in missing)
+    return found
 
 
 def get_trans(items):
+    """Attaches the translations of `items`, which can be of any model."""
     if not items:
         return
 
-    connection = connections[multidb.get_slave()]
-    cursor = connection.cursor()
+    pending = getattr(_local, 'batch', None)
+    if pending is not None:
+        pending.extend(items)
+        return
 
-    model = items[0].__class__
-    sql, params = build_query(model, connection)
-    item_dict = dict((item.pk, item) for item in items)
-    ids = ','.join(map(str, item_dict.keys()))
+    lang = (translation.get_language() or '').lower()
+    wanted = list(_wanted(items, lang))
+    keys = set()
+    for item, name, trans_id, locale, fallback in wanted:
+        keys.add((trans_id, locale))
+        keys.add((trans_id, fallback))
+    rows = fetch(keys)
+
+    for item, name, trans_id, locale, fallback in wanted:
+        row = rows.get((trans_id, locale))
+        if not row or row['localized_string'] is None:
+            row = rows.get((trans_id, fallback))
+        if row and row['localized_string'] is not None:
+            setattr(item, name, Translation(**row))
+
+
+@contextmanager
+def batch():
+    """
+    Defers the loading of translations until the end of the block, where
+    the translations of every object loaded in it are fetched at once::
+
+        with batch():
+            versions = list(Version.objects.filter(...))
+            previews = list(Preview.objects.filter(...))
+        # versions and previews have their translations now.
+
+    Translations are not available inside the block. Batches can be nested,
+    the outermost one does the loading.
+    """
+    if getattr(_local, 'batch', None) is not None:
+        yield
+        return
+    _local.batch = pending = []
+    # Whatever is loaded here is cached once it has its translations.
+    with defer_caching():
+        try:
+            yield
+        finally:
+            _local.batch = None
+        get_trans(pending)
 
-    cursor.execute(sql.format(ids='(%s)' % ids), tuple(params))
-    step = len(trans_fields)
-    for row in cursor.fetchall():
-        # We put the item's pk as the first selected field.
-        item = item_dict[row[0]]
-        for index, field in enumerate(model._meta.translated_fields):
-            start = 1 + step * index
-            t = Translation(*row[start:start+step])
-            if t.id is not None and t.localized_string is not None:
-                setattr(item, field.name, t)
+
+def identity_map():
+    """The translation rows fetched in this request, None outside of one."""
+    return getattr(_local, 'rows', None)
+
+
+@receiver(request_started, dispatch_uid='translations_identity_map_start')
+def start_identity_map(sender, **kw):
+    _local.rows = {}
+
+
+@receiver(request_finished, dispatch_uid='translations_identity_map_end')
+def end_identity_map(sender, **kw):
+    _local.rows = None
+
+
+def clear_identity_map(sender, **kw):
+    if getattr(_local, 'rows', None):
+        _local.rows = {}
+
+for model in (Translation, PurifiedTranslation, LinkifiedTranslation):
+    for name, signal in (('save', models.signals.post_save),
+                         ('delete', models.signals.post_delete)):
+        signal.connect(clear_identity_map, sender=model,
+                       dispatch_uid='translations_identity_map_%s_%s' % (
+                           name, model.__name__))
@@ -46,7 +46,7 @@ class VersionManager(amo.models.ManagerBase):
         return qs.transform(Version.transformer)
 
 
-class Version(amo.models.ModelBase):
+class Version(amo.models.OnChangeMixin, amo.models.ModelBase):
     addon = models.ForeignKey('addons.Addon', related_name='versions')
     license = models.ForeignKey('License', null=True)
     releasenotes = PurifiedField()
@@ -216,16 +216,16 @@ class Version(amo.models.ModelBase):
     @property
     def current_queue(self):
         """Return the current queue, or None if not in a queue."""
-        from editors.models import (ViewPendingQueue, ViewFullReviewQueue,
-                                    ViewPreliminaryQueue)
+        from editors.models import (FullReviewQueue, PendingQueue,
+                                    PreliminaryQueue)
 
         if self.addon.status in [amo.STATUS_NOMINATED,
                                  amo.STATUS_LITE_AND_NOMINATED]:
-            return ViewFullReviewQueue
+            return FullReviewQueue
         elif self.addon.status == amo.STATUS_PUBLIC:
-            return ViewPendingQueue
+            return PendingQueue
         elif self.addon.status in [amo.STATUS_LITE, amo.STATUS_UNREVIEWED]:
-            return ViewPreliminaryQueue
+            return PreliminaryQueue
 
         return None
 
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+import cronjobs
+
+# Registers their doc types with the outbox.
+import addons.models  # NOQA
+import mkt.webapps.models  # NOQA
+from lib.es import outbox
+
+
+@cronjobs.register
+def index_outbox(duration=55):
+    """
+    Consumes the indexing outbox every ES_OUTBOX_WINDOW seconds for about
+    `duration` seconds, see lib.es.outbox. It runs every minute.
+    """
+    end = time.time() + int(duration)
+    while True:
+        start = time.time()
+        # Don't keep reading from the snapshots of the previous pass, on
+        # any connection.
+        for alias in connections:
+            transaction.commit_unless_managed(using=alias)
+        for name in outbox.doc_types:
+            outbox.consume(name)
+        outbox.lag()
+        wait = settings.ES_OUTBOX_WINDOW - (time.time() - start)
+        if time.time() + max(wait, 0) >= end:
+            return
+        if wait > 0:
+            time.sleep(wait)
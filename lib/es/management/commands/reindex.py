@@ -15,7 +15,7 @@ from django.conf import settings as django_settings
 from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 
-from addons.cron import reindex_addons_task
+from addons.cron import reindex_addons
 from amo.utils import timestamp_index
 from apps.addons.search import setup_mapping as put_amo_mapping
 from bandwagon.cron import reindex_collections_task
@@ -43,9 +43,9 @@ if django_settings.MARKETPLACE:
     from mkt.stats.cron import index_mkt_stats_task
     from mkt.stats.search import setup_mkt_indexes as put_mkt_stats_mapping
 
+    # Add-ons aren't indexed by a task, see Command.handle.
     _INDEXES = {'stats': [index_stats.si, index_mkt_stats_task.si],
-                'apps': [reindex_addons_task,
-                         reindex_collections_task,
+                'apps': [reindex_collections_task,
                          reindex_users_task,
                          compatibility_report_task]}
 
@@ -298,6 +298,7 @@ class Command(BaseCommand):
 
         to_remove = []
         creates = []
+        addon_indexes = []
 
         # for each index, we create a new time-stamped index
         for alias in indexes:
@@ -327,6 +328,8 @@ class Command(BaseCommand):
             step2 = create_mapping.si(new_index, alias)
             step3 = create_index(new_index, is_stats)
             creates.append(step1 | step2 | step3)
+            if not is_stats:
+                addon_indexes.append(new_index)
             # adding new index to the alias
             add_action('add', new_index, alias)
 
@@ -346,11 +349,13 @@ class Command(BaseCommand):
 
         os.environ['FORCE_INDEXING'] = '1'
         try:
-            res = (create | rename | delete | del_indexes).apply_async()
-            while not res.ready():
-                sys.stdout.write('.')
-                sys.stdout.flush()
-                time.sleep(5)
+            self.wait(create.apply_async())
+            # The add-ons are streamed from here by lib.es.pipeline: its pool
+            # of processes can't be started from a celery worker.
+            for new_index in addon_indexes:
+                log('Indexing the add-ons into %r' % new_index)
+                reindex_addons(new_index, aliased=False)
+            self.wait((rename | delete | del_indexes).apply_async())
         finally:
             del os.environ['FORCE_INDEXING']
 
@@ -360,3 +365,9 @@ class Command(BaseCommand):
         aliases = call_es('_aliases').json()
         aliases = json.dumps(aliases, sort_keys=True, indent=4)
         return _SUMMARY % (len(indexes), aliases)
+
+    def wait(self, res):
+        while not res.ready():
+            sys.stdout.write('.')
+            sys.stdout.flush()
+            time.sleep(5)
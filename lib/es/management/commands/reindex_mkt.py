@@ -19,9 +19,10 @@ from celery import task
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
-from amo.utils import chunked, timestamp_index
+from amo.utils import timestamp_index
 from addons.models import Webapp  # To avoid circular import.
 from lib.es.models import Reindexing
+from lib.es.pipeline import reindex
 from lib.es.utils import database_flagged
 
 from mkt.webapps.models import WebappIndexer
@@ -47,10 +48,6 @@ else:
 ES = pyelasticsearch.ElasticSearch(ES_URL)
 
 
-job = 'lib.es.management.commands.reindex_mkt.run_indexing'
-time_limits = settings.CELERY_TIME_LIMITS[job]
-
-
 @task
 def delete_index(old_index):
     """Removes the index."""
@@ -86,34 +83,33 @@ def create_index(new_index, alias, settings):
     ES.health(new_index, wait_for_status='green', wait_for_relocating_shards=0)
 
 
+def extract_webapps(ids):
+    return WebappIndexer.extract_documents(ids)
+
+
 def index_webapp(ids, **kw):
     index = kw.pop('index', None) or ALIAS
     sys.stdout.write('Indexing %s apps' % len(ids))
 
-    qs = Webapp.indexing_transformer(Webapp.uncached.filter(id__in=ids))
+    WebappIndexer.bulk_index(extract_webapps(ids), es=ES, index=index)
 
-    docs = [WebappIndexer.extract_document(obj.id, obj=obj) for obj in qs]
-    WebappIndexer.bulk_index(docs, es=ES, index=index)
 
-
-@task(time_limit=time_limits['hard'], soft_time_limit=time_limits['soft'])
 def run_indexing(index):
     """Index the objects.
 
     - index: name of the index
 
-    Note: Our ES doc sizes are about 5k in size. Chunking by 100 sends ~500kb
-    of data to ES at a time.
-
-    TODO: Use celery chords here to parallelize these indexing chunks. This
-          requires celery 3 (bug 825938).
+    Note: Our ES doc sizes are about 5k in size. The bulk requests are
+    bounded by ES_BULK_MAX_DOCS and ES_BULK_MAX_BYTES. This runs in the
+    command's own process: the pool of processes of lib.es.pipeline can't
+    be started from a celery worker.
 
     """
     sys.stdout.write('Indexing apps into index: %s' % index)
 
-    qs = WebappIndexer.get_indexable()
-    for chunk in chunked(list(qs), 100):
-        index_webapp(chunk, index=index)
+    indexed = reindex(WebappIndexer.get_indexable(), extract_webapps, index,
+                      WebappIndexer.get_mapping_type_name())
+    sys.stdout.write('Indexed %s apps into index: %s' % (indexed, index))
 
 
 @task
@@ -185,8 +181,8 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         """Set up reindexing tasks.
 
-        Creates a Tasktree that creates a new indexes and indexes all objects,
-        then points the alias to this new index when finished.
+        Creates a new index with a Tasktree, indexes all objects into it,
+        then points the alias to this new index with another one.
         """
         if not settings.MARKETPLACE:
             raise CommandError('This command affects only marketplace and '
@@ -235,26 +231,32 @@ class Command(BaseCommand):
             'store.compress.tv': True, 'store.compress.stored': True,
             'refresh_interval': '-1'})
 
-        # Index all the things!
-        chain |= run_indexing.si(new_index)
-
         # After indexing we optimize the index, adjust settings, and point the
         # alias to the new index.
-        chain |= update_alias.si(new_index, old_index, ALIAS, {
+        after = update_alias.si(new_index, old_index, ALIAS, {
             'number_of_replicas': num_replicas, 'refresh_interval': '5s'})
 
         # Unflag the database.
-        chain |= unflag_database.si()
+        after |= unflag_database.si()
 
         # Delete the old index, if any.
         if old_index:
-            chain |= delete_index.si(old_index)
+            after |= delete_index.si(old_index)
 
-        chain |= output_summary.si()
+        after |= output_summary.si()
 
-        self.stdout.write('\nNew index and indexing tasks all queued up.\n')
         os.environ['FORCE_INDEXING'] = '1'
         try:
-            chain.apply_async()
+            self.wait(chain.apply_async())
+            # Index all the things!
+            run_indexing(new_index)
+            self.wait(after.apply_async())
         finally:
             del os.environ['FORCE_INDEXING']
+        self.stdout.write('\n')
+
+    def wait(self, res):
+        while not res.ready():
+            sys.stdout.write('.')
+            sys.stdout.flush()
+            time.sleep(5)
@@ -6,6 +6,21 @@ class Reindexing(models.Model):
     old_index = models.CharField(max_length=255, null=True)
     new_index = models.CharField(max_length=255)
     alias = models.CharField(max_length=255)
+    # Progress of the indexing into `new_index`, see lib.es.pipeline.
+    total = models.PositiveIntegerField(default=0)
+    indexed = models.PositiveIntegerField(default=0)
+    rate = models.FloatField(default=0)  # Documents per second.
+    eta = models.DateTimeField(null=True)
 
     class Meta:
         db_table = 'zadmin_reindexing'
+
+
+class OutboxEntry(models.Model):
+    """An object whose document is out of date, see lib.es.outbox."""
+    doc_type = models.CharField(max_length=32)
+    object_id = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'es_outbox'
@@ -0,0 +1,126 @@
+"""
+The indexing outbox.
+
+Saving an add-on or an app adds a row to the `es_outbox` table, in the same
+transaction as the change, instead of queuing an indexing task per save::
+
+    outbox.enqueue('webapp', app.id)
+
+The `index_outbox` cron consumes the table every `ES_OUTBOX_WINDOW` seconds.
+The ids queued during that window are deduplicated, their documents are
+extracted in chunks and sent with the bulk API, so elasticsearch is written
+to once per changed document rather than once per save.
+
+Each doc type is consumed on its own. When an index keeps rejecting bulk
+requests its rows are left in the outbox for the next pass, and the others
+carry on. The number of rows waiting and the age of the oldest one are sent
+to statsd as `es.outbox.<doc type>.pending` and `.lag`.
+"""
+import collections
+import logging
+from datetime import datetime
+
+from django.conf import settings
+
+from django_statsd.clients import statsd
+
+from amo.utils import chunked
+from lib.es.models import OutboxEntry
+from lib.es.pipeline import BulkError, BulkWriter
+from lib.es.signals import process, reset
+from lib.es.utils import get_indices
+
+
+log = logging.getLogger('z.es')
+
+DocType = collections.namedtuple('DocType', 'extract index done')
+
+# {name: DocType}, filled by `register`.
+doc_types = {}
+
+
+def register(name, extract, index, done=None):
+    """
+    Registers the doc type `name`: `extract` takes a list of ids and returns
+    their documents, `index` returns the alias they go to and `done`, if
+    given, is called after documents were indexed.
+    """
+    doc_types[name] = DocType(extract, index, done)
+
+
+def enqueue(name, *ids):
+    """Queues the objects of `ids` for their `name` documents to be updated."""
+    OutboxEntry.objects.bulk_create(
+        [OutboxEntry(doc_type=name, object_id=id_) for id_ in ids])
+
+
+def consume(name, batch=None, chunk_size=100):
+    """
+    Indexes the objects of the first `batch` rows queued for `name`, each
+    once, and removes those rows. Returns how many rows were consumed.
+    """
+    doc_type = doc_types[name]
+    # The rows are read where they're written, a slave may not have them.
+    rows = list(OutboxEntry.objects.using('default')
+                .filter(doc_type=name).order_by('id')
+                .values_list('id', 'object_id', 'created')
+                [:batch or settings.ES_OUTBOX_BATCH])
+    if not rows:
+        return 0
+
+    ids = sorted(set(object_id for _, object_id, _ in rows))
+    writer = BulkWriter(get_indices(doc_type.index()), name)
+    try:
+        for chunk in chunked(ids, chunk_size):
+            for doc in doc_type.extract(chunk):
+                writer.add(doc)
+        writer.flush()
+    except BulkError, e:
+        # Try again next time, the rows stay queued.
+        log.error('Indexing the %s outbox failed: %s' % (name, e))
+        statsd.incr('es.outbox.%s.failed' % name)
+        return 0
+    if doc_type.done:
+        doc_type.done()
+
+    # The rows are deleted by id: a row with a lower id than these might
+    # not be visible yet, it'll be there for the next pass.
+    for chunk in chunked([id_ for id_, _, _ in rows], 500):
+        OutboxEntry.objects.filter(id__in=chunk).delete()
+
+    lag = datetime.now() - min(created for _, _, created in rows)
+    statsd.timing('es.outbox.%s.lag' % name,
+                  int(lag.days * 86400000 + lag.seconds * 1000 +
+                      lag.microseconds / 1000))
+    statsd.incr('es.outbox.%s.rows' % name, len(rows))
+    statsd.incr('es.outbox.%s.docs' % name, writer.indexed)
+    log.info('Indexed %s %s documents for %s outbox rows.' %
+             (writer.indexed, name, len(rows)))
+    return len(rows)
+
+
+def lag():
+    """Returns {doc type: (rows waiting, oldest row created)}."""
+    rv = {}
+    for name in doc_types:
+        qs = OutboxEntry.objects.using('default').filter(doc_type=name)
+        oldest = qs.order_by('id').values_list('created', flat=True)[:1]
+        rv[name] = (qs.count(), oldest[0] if oldest else None)
+        statsd.gauge('es.outbox.%s.pending' % name, rv[name][0])
+    return rv
+
+
+def drain(**kw):
+    """Consumes everything queued, for each doc type."""
+    for name in doc_types:
+        while consume(name):
+            pass
+
+
+def clear(**kw):
+    """Drops everything queued."""
+    OutboxEntry.objects.all().delete()
+
+
+process.connect(drain, dispatch_uid='lib.es.outbox.drain')
+reset.connect(clear, dispatch_uid='lib.es.outbox.clear')
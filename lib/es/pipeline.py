@@ -0,0 +1,215 @@
+"""
+Streaming reindexing.
+
+Ids are read from the database in keyset paginated chunks, a pool of
+processes turns each chunk into documents and a bulk writer sends those to
+every index being written to, in batches bounded by count and size::
+
+    reindex(Webapp.objects.all(), extract_webapps, 'apps', 'webapp')
+
+Only a few chunks are in flight at any time, so a slow Elasticsearch holds
+the extractors back instead of piling documents up in memory. Progress is
+saved on the `Reindexing` rows of the indices being written.
+"""
+import datetime
+import json
+import logging
+import multiprocessing
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+
+import pyelasticsearch
+import requests
+
+from amo.utils import JSONEncoder
+from lib.es.models import Reindexing
+from lib.es.utils import get_indices
+
+
+log = logging.getLogger('z.es')
+
+
+class BulkError(Exception):
+    pass
+
+
+def get_es():
+    return pyelasticsearch.ElasticSearch(settings.ES_URLS[0],
+                                         timeout=settings.ES_TIMEOUT)
+
+
+def keyset_ids(qs, chunk_size=100):
+    """
+    Yields the ids of `qs` in chunks, in id order.
+
+    Every chunk is an `id > last id` query on the primary key, so the last
+    chunk costs as much as the first, unlike OFFSET pagination.
+    """
+    qs = qs.order_by('id').values_list('id', flat=True)
+    last = 0
+    while True:
+        ids = list(qs.filter(id__gt=last)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+class BulkWriter(object):
+    """
+    Buffers documents and sends them to every index in `indices` with the
+    bulk API once `max_docs` documents or `max_bytes` bytes are buffered.
+
+    The body is encoded once and sent as is to each index. Sending blocks,
+    which is what holds the pipeline back. Rejections (ES queues are full)
+    and connection errors are retried with an exponential backoff.
+    """
+
+    def __init__(self, indices, doc_type, es=None, max_docs=None,
+                 max_bytes=None, retries=6):
+        self.indices = indices
+        self.doc_type = doc_type
+        self.es = es or get_es()
+        self.max_docs = max_docs or settings.ES_BULK_MAX_DOCS
+        self.max_bytes = max_bytes or settings.ES_BULK_MAX_BYTES
+        self.retries = retries
+        self.buffer, self.size = [], 0
+        self.indexed = 0
+
+    def add(self, doc, id_field='id'):
+        line = '%s\n%s\n' % (json.dumps({'index': {'_id': doc[id_field]}}),
+                             json.dumps(doc, cls=JSONEncoder))
+        self.buffer.append(line)
+        self.size += len(line)
+        if len(self.buffer) >= self.max_docs or self.size >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        body = ''.join(self.buffer)
+        for index in self.indices:
+            self.send(index, body)
+        self.indexed += len(self.buffer)
+        self.buffer, self.size = [], 0
+
+    def send(self, index, body):
+        for attempt in range(self.retries + 1):
+            try:
+                res = self.es.send_request(
+                    'POST', [index, self.doc_type, '_bulk'], body,
+                    encode_body=False)
+            except requests.exceptions.RequestException, e:
+                error = e
+            except pyelasticsearch.exceptions.ElasticHttpError, e:
+                if getattr(e, 'status_code', None) not in (429, 503):
+                    raise
+                error = e
+            else:
+                errors = [item.values()[0]['error']
+                          for item in res.get('items', [])
+                          if 'error' in item.values()[0]]
+                if not errors:
+                    return
+                if not all('EsRejectedExecutionException' in e
+                           for e in errors):
+                    # Mapping errors and the like, retrying won't help.
+                    log.error('%s documents failed to index into %s: %s' %
+                              (len(errors), index, errors[0]))
+                    return
+                error = errors[0]
+
+            wait = min(2 ** attempt * .5, 30)
+            log.warning('Bulk indexing into %s failed (%s), retrying in '
+                        '%ss.' % (index, error, wait))
+            time.sleep(wait)
+
+        raise BulkError('Bulk indexing into %s failed %s times: %s' %
+                        (index, self.retries + 1, error))
+
+
+class Progress(object):
+    """Keeps the progress of the indexing on the `Reindexing` rows."""
+
+    def __init__(self, indices, total, every=10):
+        self.indices = indices
+        self.total = total
+        self.every = every
+        self.start = self.saved = time.time()
+        self.done = 0
+
+    def update(self, done, force=False):
+        self.done = done
+        now = time.time()
+        if not force and now - self.saved < self.every:
+            return
+        self.saved = now
+        rate = done / max(now - self.start, 1e-6)
+        eta = None
+        if rate and self.total > done:
+            eta = (datetime.datetime.now() +
+                   datetime.timedelta(seconds=(self.total - done) / rate))
+        log.info('Indexed %s/%s documents into %s, %.1f docs/s, ETA %s' % (
+                 done, self.total, ', '.join(self.indices), rate, eta))
+        (Reindexing.objects.filter(new_index__in=self.indices)
+                   .update(total=self.total, indexed=done, rate=rate,
+                           eta=eta))
+
+
+def _init_worker():
+    # Forked workers must not talk over the database connections of their
+    # parent, drop them (without closing) so they open their own.
+    for conn in connections.all():
+        conn.connection = None
+
+
+def get_processes(processes=None):
+    # Celery workers are daemons and daemons can't have children.
+    if multiprocessing.current_process().daemon:
+        return 1
+    return (processes or settings.ES_REINDEX_PROCESSES or
+            multiprocessing.cpu_count())
+
+
+def reindex(qs, extract, index, doc_type, chunk_size=100, processes=None):
+    """
+    Indexes every object of `qs` into `index` (and the index it is being
+    rebuilt into, if any).
+
+    `extract` is a module level function taking a list of ids and
+    returning their documents, it runs in a pool of `processes`.
+    """
+    indices = get_indices(index)
+    writer = BulkWriter(indices, doc_type)
+    progress = Progress(indices, qs.count())
+    processes = get_processes(processes)
+
+    def write(docs):
+        for doc in docs:
+            writer.add(doc)
+        progress.update(writer.indexed)
+
+    chunks = keyset_ids(qs, chunk_size)
+    if processes == 1:
+        for ids in chunks:
+            write(extract(ids))
+    else:
+        # At most two chunks per process are in flight.
+        pool = multiprocessing.Pool(processes, _init_worker)
+        pending = deque()
+        try:
+            for ids in chunks:
+                pending.append(pool.apply_async(extract, (ids,)))
+                while len(pending) >= processes * 2:
+                    write(pending.popleft().get())
+            while pending:
+                write(pending.popleft().get())
+        finally:
+            pool.terminate()
+
+    writer.flush()
+    progress.update(writer.indexed, force=True)
+    return writer.indexed
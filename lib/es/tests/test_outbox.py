@@ -0,0 +1,100 @@
+from django.conf import settings
+
+import mock
+from nose.tools import eq_
+
+import amo.tests
+from addons.models import Addon
+from lib.es import cron, outbox
+from lib.es.models import OutboxEntry
+from lib.es.pipeline import BulkError
+from lib.es.signals import process
+
+
+class TestOutbox(amo.tests.TestCase):
+
+    def setUp(self):
+        self.extract = mock.Mock(side_effect=lambda ids: [{'id': id}
+                                                          for id in ids])
+        self.done = mock.Mock()
+        doc_types = {'fake': outbox.DocType(self.extract, lambda: 'fake',
+                                            self.done)}
+        patcher = mock.patch.dict(outbox.doc_types, doc_types, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('lib.es.pipeline.get_es')
+        self.es = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.es.send_request.return_value = {'items': []}
+
+    def test_save_enqueues(self):
+        addon = amo.tests.addon_factory()
+        OutboxEntry.objects.all().delete()
+        addon.save()
+        addon.save()
+        eq_(list(OutboxEntry.objects.values_list('doc_type', 'object_id')),
+            [(Addon._meta.db_table, addon.id)] * 2)
+
+    def test_consume_deduplicates(self):
+        outbox.enqueue('fake', 3, 1, 3, 2, 1)
+        eq_(outbox.consume('fake'), 5)
+        eq_(sum([c[0][0] for c in self.extract.call_args_list], []),
+            [1, 2, 3])
+        eq_(self.es.send_request.call_count, 1)
+        eq_(OutboxEntry.objects.count(), 0)
+        assert self.done.called
+
+    def test_consume_batch(self):
+        outbox.enqueue('fake', 1, 2, 3)
+        eq_(outbox.consume('fake', batch=2), 2)
+        eq_(list(OutboxEntry.objects.values_list('object_id', flat=True)),
+            [3])
+
+    def test_consume_chunks(self):
+        outbox.enqueue('fake', 1, 2, 3)
+        outbox.consume('fake', chunk_size=2)
+        eq_([c[0][0] for c in self.extract.call_args_list], [[1, 2], [3]])
+
+    def test_consume_nothing(self):
+        eq_(outbox.consume('fake'), 0)
+        assert not self.extract.called
+
+    @mock.patch('lib.es.outbox.BulkWriter.flush')
+    def test_rejected_stays_queued(self, flush):
+        flush.side_effect = BulkError
+        outbox.enqueue('fake', 1)
+        eq_(outbox.consume('fake'), 0)
+        eq_(OutboxEntry.objects.count(), 1)
+        assert not self.done.called
+
+    def test_lag(self):
+        eq_(outbox.lag(), {'fake': (0, None)})
+        outbox.enqueue('fake', 1, 2)
+        pending, oldest = outbox.lag()['fake']
+        eq_(pending, 2)
+        eq_(oldest, OutboxEntry.objects.order_by('id')[0].created)
+
+    def test_process_drains(self):
+        outbox.enqueue('fake', 1, 2)
+        process.send(None)
+        eq_(OutboxEntry.objects.count(), 0)
+
+    @mock.patch.object(settings, 'ES_OUTBOX_WINDOW', 5)
+    @mock.patch('lib.es.cron.time')
+    def test_cron_between_passes(self, time_):
+        clock = [0]
+        time_.time.side_effect = lambda: clock[0]
+
+        def sleep(seconds):
+            # Saved between two passes.
+            outbox.enqueue('fake', clock[0] + 10)
+            clock[0] += seconds
+        time_.sleep.side_effect = sleep
+
+        outbox.enqueue('fake', 1)
+        cron.index_outbox(duration=12)
+        eq_(time_.sleep.call_count, 2)
+        eq_([c[0][0] for c in self.extract.call_args_list],
+            [[1], [10], [15]])
+        eq_(OutboxEntry.objects.count(), 0)
@@ -0,0 +1,99 @@
+import datetime
+import json
+
+import mock
+from nose.tools import eq_, raises
+
+import amo.tests
+from addons.models import Addon
+from lib.es import pipeline
+from lib.es.models import Reindexing
+
+
+class TestKeysetIds(amo.tests.TestCase):
+    fixtures = ['base/addon_3615', 'base/addon_5299_gcal',
+                'base/addon_592']
+
+    def test_chunks(self):
+        ids = sorted(Addon.objects.values_list('id', flat=True))
+        chunks = list(pipeline.keyset_ids(Addon.objects.all(), 2))
+        eq_(chunks, [ids[i:i + 2] for i in range(0, len(ids), 2)])
+
+    def test_ordering_ignored(self):
+        qs = Addon.objects.order_by('-id').values_list('id', flat=True)
+        eq_(sum(pipeline.keyset_ids(qs, 1), []),
+            sorted(Addon.objects.values_list('id', flat=True)))
+
+
+class TestBulkWriter(amo.tests.TestCase):
+
+    def setUp(self):
+        self.es = mock.Mock()
+        self.es.send_request.return_value = {'items': []}
+        self.writer = pipeline.BulkWriter(['a', 'b'], 'addons', es=self.es,
+                                          max_docs=2, max_bytes=1000)
+
+    def bodies(self):
+        return [c[0][2] for c in self.es.send_request.call_args_list]
+
+    def test_flush_on_count(self):
+        self.writer.add({'id': 1})
+        assert not self.es.send_request.called
+        self.writer.add({'id': 2})
+        eq_([c[0][1] for c in self.es.send_request.call_args_list],
+            [['a', 'addons', '_bulk'], ['b', 'addons', '_bulk']])
+        lines = self.bodies()[0].splitlines()
+        eq_(json.loads(lines[0]), {'index': {'_id': 1}})
+        eq_(json.loads(lines[1]), {'id': 1})
+        eq_(self.writer.indexed, 2)
+
+    def test_flush_on_size(self):
+        self.writer.add({'id': 1, 'name': 'x' * 1000})
+        eq_(self.es.send_request.call_count, 2)
+
+    def test_dates(self):
+        self.writer.add({'id': 1, 'created': datetime.datetime(2013, 1, 1)})
+        self.writer.flush()
+        eq_(json.loads(self.bodies()[0].splitlines()[1])['created'],
+            '2013-01-01T00:00:00')
+
+    @mock.patch('lib.es.pipeline.time.sleep')
+    def test_retry_rejected(self, sleep):
+        rejected = {'items': [{'index': {
+            'error': 'EsRejectedExecutionException[rejected]'}}]}
+        self.es.send_request.side_effect = [rejected, {'items': []},
+                                            {'items': []}]
+        self.writer.add({'id': 1})
+        self.writer.flush()
+        eq_(self.es.send_request.call_count, 3)
+        eq_(sleep.call_count, 1)
+
+    @raises(pipeline.BulkError)
+    @mock.patch('lib.es.pipeline.time.sleep')
+    def test_give_up(self, sleep):
+        self.es.send_request.side_effect = (
+            pipeline.requests.exceptions.ConnectionError)
+        self.writer.add({'id': 1})
+        self.writer.flush()
+
+
+class TestReindex(amo.tests.TestCase):
+    fixtures = ['base/addon_3615', 'base/addon_5299_gcal']
+
+    @mock.patch('lib.es.pipeline.get_es')
+    def test_reindex(self, get_es):
+        get_es.return_value.send_request.return_value = {'items': []}
+        Reindexing.objects.create(alias='addons', new_index='addons-new',
+                                  old_index='addons-old',
+                                  start_date=datetime.datetime.now())
+        extract = lambda ids: [{'id': id} for id in ids]
+        count = Addon.objects.count()
+        eq_(pipeline.reindex(Addon.objects.all(), extract, 'addons',
+                             'addons', processes=1), count)
+
+        indices = [c[0][1][0] for c
+                   in get_es.return_value.send_request.call_args_list]
+        eq_(sorted(indices), ['addons-new', 'addons-old'])
+        reindexing = Reindexing.objects.get()
+        eq_(reindexing.total, count)
+        eq_(reindexing.indexed, count)
@@ -1,4 +1,11 @@
+import csv
 import logging
+import socket
+import struct
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from threading import Lock
 
 import requests
 import waffle
@@ -9,14 +16,180 @@ from mkt import regions
 log = logging.getLogger('z.geoip')
 
 
-class GeoIP:
+def ip_to_int(address):
+    """IPv4 dotted quad to an integer, None for anything else."""
+    try:
+        return struct.unpack('!L', socket.inet_aton(address))[0]
+    except (socket.error, TypeError, UnicodeError):
+        return None
+
+
+class LRU(object):
+    """A small thread safe least recently used mapping."""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.pop(key, None)
+            if value is not None:
+                self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            if len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+
+class LocalDB(object):
+    """
+    An IPv4 range to country table, as three parallel sorted arrays: the
+    start and end of each range and the index of its country code.
+
+    It's built from a CSV such as MaxMind's GeoIPCountryWhois.csv, of which
+    the columns used are the start and end of the range (as integers) and
+    the country code::
+
+        "1.0.0.0","1.0.0.255","16777216","16777471","AU","Australia"
+
+    A lookup is a binary search on the starts, a few thousand IPs cost as
+    much as a single request to geodude.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows)
+        self.starts = array('L', (r[0] for r in rows))
+        self.ends = array('L', (r[1] for r in rows))
+        self.codes = []
+        index = {}
+        self.countries = array('H')
+        for start, end, code in rows:
+            if code not in index:
+                index[code] = len(self.codes)
+                self.codes.append(code)
+            self.countries.append(index[code])
+
+    @classmethod
+    def from_csv(cls, path, start_col=2, end_col=3, code_col=4):
+        with open(path, 'rb') as fp:
+            rows = [(int(r[start_col]), int(r[end_col]),
+                     r[code_col].lower())
+                    for r in csv.reader(fp) if r]
+        log.info('Loaded %s IP ranges from %s' % (len(rows), path))
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, ip):
+        """
+        Returns `(country code, start, end)` of the range `ip` (an integer)
+        is in, None if it isn't in any.
+        """
+        i = bisect_right(self.starts, ip) - 1
+        if i < 0 or ip > self.ends[i]:
+            return None
+        return self.codes[self.countries[i]], self.starts[i], self.ends[i]
+
+
+_databases = {}
+_databases_lock = Lock()
+
+
+def get_db(path):
+    """The database at `path`, loaded once per process."""
+    if path not in _databases:
+        with _databases_lock:
+            if path not in _databases:
+                _databases[path] = LocalDB.from_csv(path)
+    return _databases[path]
+
+
+class LocalBackend(object):
+    """
+    Resolves IPv4 addresses against a local `LocalDB`.
+
+    Answers are cached per /24, keyed `('net', prefix)`, when the whole /24
+    is in a single range, which is nearly always the case, otherwise per
+    address, keyed `('ip', ip)`.
+    """
+
+    def __init__(self, db, cache_size=10000):
+        self.db = db
+        self.cache = LRU(cache_size)
+
+    def lookup(self, address):
+        ip = ip_to_int(address)
+        if ip is None:
+            return None
+        prefix = ip & 0xFFFFFF00
+        code = self.cache.get(('net', prefix))
+        if code is None:
+            code = self.cache.get(('ip', ip))
+        if code is not None:
+            return code
+
+        found = self.db.find(ip)
+        code = found[0] if found else ''
+        if found and found[1] <= prefix and found[2] >= prefix | 0xFF:
+            self.cache.set(('net', prefix), code)
+        else:
+            self.cache.set(('ip', ip), code)
+        return code
+
+
+class GeodudeBackend(object):
     """Call to geodude server to resolve an IP to Geo Info block."""
 
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+
+    def lookup(self, address):
+        with statsd.timer('z.geoip'):
+            res = None
+            try:
+                res = requests.post('{0}/country.json'.format(self.url),
+                                    timeout=self.timeout,
+                                    data={'ip': address})
+            except requests.Timeout:
+                log.error(('Geodude timed out looking up: {0}'
+                           .format(address)))
+            except requests.RequestException as e:
+                log.error('Geodude connection error: {0}'.format(str(e)))
+            if res and res.status_code == 200:
+                return res.json().get('country_code', '').lower()
+
+
+class GeoIP:
+    """
+    Resolves an IP to a country code, from the local database if there is
+    one (`GEOIP_DB_PATH`) and from the geodude server (`GEOIP_URL`) for
+    whatever the local database doesn't know.
+    """
+
     def __init__(self, settings):
         self.timeout = float(getattr(settings, 'GEOIP_DEFAULT_TIMEOUT', .2))
         self.url = getattr(settings, 'GEOIP_URL', '')
         self.default_val = getattr(settings, 'GEOIP_DEFAULT_VAL',
                                    regions.WORLDWIDE.slug).lower()
+        self.local = None
+        path = getattr(settings, 'GEOIP_DB_PATH', '')
+        if path:
+            try:
+                self.local = LocalBackend(
+                    get_db(path), getattr(settings, 'GEOIP_CACHE_SIZE',
+                                          10000))
+            except (IOError, ValueError, IndexError), e:
+                log.error('Could not load the GeoIP database %s: %s'
+                          % (path, e))
+        self.geodude = GeodudeBackend(self.url, self.timeout)
 
     def lookup(self, address):
         """Resolve an IP address to a block of geo information.
@@ -25,19 +198,13 @@ class GeoIP:
         return the default as defined by the settings, or "worldwide".
 
         """
+        if self.local:
+            with statsd.timer('z.geoip.local'):
+                res = self.local.lookup(address)
+            if res:
+                return res
         if self.url and waffle.switch_is_active('geoip-geodude'):
-            with statsd.timer('z.geoip'):
-                res = None
-                try:
-                    res = requests.post('{0}/country.json'.format(self.url),
-                                        timeout=self.timeout,
-                                        data={'ip': address})
-                except requests.Timeout:
-                    log.error(('Geodude timed out looking up: {0}'
-                               .format(address)))
-                except requests.RequestException as e:
-                    log.error('Geodude connection error: {0}'.format(str(e)))
-                if res and res.status_code == 200:
-                    return res.json().get('country_code',
-                                        self.default_val).lower()
+            res = self.geodude.lookup(address)
+            if res:
+                return res
         return self.default_val
@@ -1,15 +1,25 @@
+import tempfile
+
 import mock
 import requests
 from nose.tools import eq_
 
 import amo.tests
 
-from lib.geoip import GeoIP
+from lib.geoip import GeoIP, LocalBackend, LocalDB, get_db, ip_to_int
 
 
-def generate_settings(url='', default='worldwide', timeout=0.2):
+def generate_settings(url='', default='worldwide', timeout=0.2, db=''):
     return mock.Mock(GEOIP_URL=url, GEOIP_DEFAULT_VAL=default,
-                     GEOIP_DEFAULT_TIMEOUT=timeout)
+                     GEOIP_DEFAULT_TIMEOUT=timeout, GEOIP_DB_PATH=db,
+                     GEOIP_CACHE_SIZE=10)
+
+
+CSV = '''"1.0.0.0","1.0.0.255","16777216","16777471","AU","Australia"
+"1.1.1.0","1.1.1.127","16843008","16843135","US","United States"
+"1.1.1.128","1.1.1.255","16843136","16843263","BR","Brazil"
+"2.2.0.0","2.2.255.255","33685504","33751039","FR","France"
+'''
 
 
 class GeoIPTest(amo.tests.TestCase):
@@ -70,3 +80,89 @@ class GeoIPTest(amo.tests.TestCase):
         mock_post.assert_called_with('{0}/country.json'.format(url),
                                      timeout=0.2, data={'ip': ip})
         eq_(result, 'worldwide')
+
+
+class LocalDBTest(amo.tests.TestCase):
+
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(suffix='.csv')
+        self.db_file.write(CSV)
+        self.db_file.flush()
+        self.db = LocalDB.from_csv(self.db_file.name)
+
+    def tearDown(self):
+        self.db_file.close()
+
+    def test_find(self):
+        eq_(len(self.db), 4)
+        eq_(self.db.find(ip_to_int('1.0.0.0'))[0], 'au')
+        eq_(self.db.find(ip_to_int('1.0.0.255'))[0], 'au')
+        eq_(self.db.find(ip_to_int('1.1.1.127'))[0], 'us')
+        eq_(self.db.find(ip_to_int('1.1.1.128'))[0], 'br')
+        eq_(self.db.find(ip_to_int('2.2.3.4'))[0], 'fr')
+
+    def test_not_found(self):
+        eq_(self.db.find(ip_to_int('0.0.0.1')), None)
+        eq_(self.db.find(ip_to_int('1.0.1.0')), None)
+        eq_(self.db.find(ip_to_int('9.9.9.9')), None)
+
+    def test_ip_to_int(self):
+        eq_(ip_to_int('1.0.0.1'), 16777217)
+        eq_(ip_to_int('::1'), None)
+        eq_(ip_to_int(None), None)
+
+    def test_backend_cache(self):
+        backend = LocalBackend(self.db)
+        eq_(backend.lookup('2.2.3.4'), 'fr')
+        # The whole /24 is in France.
+        eq_(backend.cache.get(('net', ip_to_int('2.2.3.0'))), 'fr')
+        eq_(backend.lookup('2.2.3.5'), 'fr')
+        # This /24 is split between two countries.
+        eq_(backend.lookup('1.1.1.1'), 'us')
+        eq_(backend.lookup('1.1.1.200'), 'br')
+        eq_(backend.cache.get(('net', ip_to_int('1.1.1.0'))), None)
+        eq_(backend.lookup('9.9.9.9'), '')
+
+    def test_backend_cache_split_network(self):
+        backend = LocalBackend(self.db)
+        # The first address of a /24 split between two countries.
+        eq_(backend.lookup('1.1.1.0'), 'us')
+        eq_(backend.cache.get(('net', ip_to_int('1.1.1.0'))), None)
+        eq_(backend.cache.get(('ip', ip_to_int('1.1.1.0'))), 'us')
+        eq_(backend.lookup('1.1.1.200'), 'br')
+        eq_(backend.lookup('1.1.1.0'), 'us')
+
+    def test_backend_lru(self):
+        backend = LocalBackend(self.db, cache_size=2)
+        backend.lookup('1.0.0.1')
+        backend.lookup('2.2.0.1')
+        backend.lookup('1.0.0.1')
+        backend.lookup('2.2.1.1')
+        eq_(backend.cache.data.keys(),
+            [('net', ip_to_int('1.0.0.0')), ('net', ip_to_int('2.2.1.0'))])
+
+    @mock.patch('requests.post')
+    def test_geoip_local(self, mock_post):
+        self.create_switch(name='geoip-geodude', active=True)
+        mock_post.return_value = mock.Mock(status_code=200, json=lambda: {
+            'country_code': 'DE'})
+        geoip = GeoIP(generate_settings(url='localhost',
+                                        db=self.db_file.name))
+        eq_(geoip.lookup('2.2.3.4'), 'fr')
+        assert not mock_post.called
+        # Geodude is asked about what isn't in the local database.
+        eq_(geoip.lookup('9.9.9.9'), 'de')
+        eq_(mock_post.call_count, 1)
+
+    def test_geoip_local_only(self):
+        geoip = GeoIP(generate_settings(db=self.db_file.name))
+        eq_(geoip.lookup('9.9.9.9'), 'worldwide')
+        eq_(geoip.lookup('1.0.0.1'), 'au')
+
+    def test_missing_db(self):
+        geoip = GeoIP(generate_settings(db='/does/not/exist.csv'))
+        eq_(geoip.local, None)
+        eq_(geoip.lookup('1.0.0.1'), 'worldwide')
+
+    def test_loaded_once(self):
+        eq_(get_db(self.db_file.name) is get_db(self.db_file.name), True)
@@ -4,6 +4,9 @@ items.
 
 Check the function docs, they expect specific preconditions.
 """
+import collections
+import heapq
+import operator
 
 # Placeholders for the fast functions implemented in C.
 
@@ -20,3 +23,54 @@ try:
     from _recommend import symmetric_diff_count, similarity
 except ImportError:
     pass
+
+from minhash import MinHashIndex  # NOQA
+
+
+class Similarities(object):
+    """
+    Finds the items most similar to an item without comparing every pair.
+
+    `sets` is a dict of {item: [collection ids]}. An inverted index from
+    collection to items gives the overlap of every pair sharing a collection
+    (the sparse product of the item x collection matrix with its transpose)
+    and symmetric_diff_count(xs, ys) == len(xs) + len(ys) - 2 * overlap.
+    Pairs that share nothing score 1 / (1 + len(xs) + len(ys)), so only the
+    smallest items can make the top list among those.
+    """
+
+    def __init__(self, sets):
+        self.sizes = {}
+        self.index = collections.defaultdict(list)
+        self.sets = {}
+        for item, xs in sets.iteritems():
+            xs = set(xs)
+            self.sets[item] = xs
+            self.sizes[item] = len(xs)
+            for x in xs:
+                self.index[x].append(item)
+        self._smallest = []
+
+    def smallest(self, n):
+        if len(self._smallest) < n:
+            self._smallest = heapq.nsmallest(n, self.sizes,
+                                             key=self.sizes.__getitem__)
+        return self._smallest[:n]
+
+    def top(self, item, n):
+        """
+        Returns the n most similar items to `item` as [(other, score)],
+        best first, with the same scores as `similarity`. `item` scores
+        1.0 against itself so it is part of the result.
+        """
+        overlap = collections.defaultdict(int)
+        for x in self.sets[item]:
+            for other in self.index[x]:
+                overlap[other] += 1
+        for other in self.smallest(n):
+            overlap.setdefault(other, 0)
+
+        size, sizes = self.sizes[item], self.sizes
+        scores = ((other, 1. / (1. + size + sizes[other] - 2 * common))
+                  for other, common in overlap.iteritems())
+        return heapq.nlargest(n, scores, key=operator.itemgetter(1))
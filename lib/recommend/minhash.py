@@ -0,0 +1,310 @@
+"""
+Approximate top-k similar items with MinHash and locality-sensitive hashing.
+
+Items are sets of ints, like the collections of an add-on. The signature of
+a set is the minimum of each of `num_perm` hash functions over its members:
+two signatures agree on a hash with a probability equal to the Jaccard
+similarity of their sets. Signatures are cut into `bands` of `rows` hashes
+and every band is a bucket key, so the candidates of an item are the items
+sharing at least one of its buckets. A pair with a Jaccard similarity `j`
+is a candidate with a probability of `1 - (1 - j ** rows) ** bands`.
+
+Candidates are scored like `recommend.similarity`, 1 / (1 + symmetric
+difference), with the intersection estimated from the agreeing hashes and
+the exact sizes of the sets. As in `Similarities`, the smallest items are
+always candidates since they can beat larger ones without sharing anything.
+
+A saved index is a single file, memory-mapped by `load` and read in place:
+
+    header       magic, num_perm, bands, seed, count, checkpoint
+    ids          count int64, sorted
+    sizes        count uint32
+    signatures   count * num_perm uint32
+    buckets      for each band, count uint64 keys, sorted, and count uint32
+                 positions of their items
+
+Items added to a loaded index are kept in memory on top of the file until
+it's saved again.
+"""
+import bisect
+import collections
+import heapq
+import mmap
+import operator
+import os
+import random
+import struct
+
+MAGIC = 'MHX1'
+HEADER = struct.Struct('<4sIIIQq')
+# A Mersenne prime, hashes are (a * x + b) % PRIME.
+PRIME = (1 << 31) - 1
+MASK = (1 << 64) - 1
+
+
+class Column(object):
+    """`count` values of the struct format `fmt` at `offset` in `buf`."""
+
+    def __init__(self, buf, offset, fmt, count):
+        self.buf, self.offset, self.count = buf, offset, count
+        self.struct = struct.Struct('<' + fmt)
+        self.end = offset + count * self.struct.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        return self.struct.unpack_from(
+            self.buf, self.offset + idx * self.struct.size)[0]
+
+
+class MappedIndex(object):
+    """The items of a saved index, read from the file as they're needed."""
+
+    def __init__(self, buf, num_perm, bands, count):
+        self.buf = buf
+        self.ids = Column(buf, HEADER.size, 'q', count)
+        self.sizes = Column(buf, self.ids.end, 'I', count)
+        self.signature = struct.Struct('<%dI' % num_perm)
+        offset = self.sizes.end + count * self.signature.size
+        self.buckets = []
+        for band in xrange(bands):
+            keys = Column(buf, offset, 'Q', count)
+            positions = Column(buf, keys.end, 'I', count)
+            self.buckets.append((keys, positions))
+            offset = positions.end
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, item):
+        idx = bisect.bisect_left(self.ids, item)
+        if idx < len(self.ids) and self.ids[idx] == item:
+            return idx
+
+    def get(self, idx):
+        """Returns the `(signature, size)` of the item at `idx`."""
+        offset = self.sizes.end + idx * self.signature.size
+        return (self.signature.unpack_from(self.buf, offset),
+                self.sizes[idx])
+
+    def bucket(self, band, key):
+        """Yields the positions of the items in the bucket `key` of `band`."""
+        keys, positions = self.buckets[band]
+        idx = bisect.bisect_left(keys, key)
+        while idx < len(keys) and keys[idx] == key:
+            yield positions[idx]
+            idx += 1
+
+
+class MinHashIndex(object):
+    """
+    `num_perm` hashes per signature, in `bands` bands; `seed` picks the
+    hash functions. `checkpoint` is saved with the index for the caller to
+    know which changes it has seen.
+    """
+
+    def __init__(self, num_perm=64, bands=32, seed=0, checkpoint=0):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands.')
+        self.num_perm, self.bands, self.seed = num_perm, bands, seed
+        self.rows = num_perm // bands
+        self.checkpoint = checkpoint
+        rand = random.Random(seed)
+        self.hashes = [(rand.randint(1, PRIME - 1), rand.randint(0, PRIME - 1))
+                       for _ in xrange(num_perm)]
+        self.mapped = None
+        self.sets = {}
+        self.buckets = [collections.defaultdict(set) for _ in xrange(bands)]
+        self.removed = set()
+        # {min_size: [(size, item)]}, see `smallest`.
+        self._smallest = {}
+
+    @classmethod
+    def build(cls, sets, **kw):
+        """An index of `sets`, a dict of {item: [ints]}."""
+        index = cls(**kw)
+        for item, xs in sets.iteritems():
+            index.add(item, xs)
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """Memory-maps the index saved at `path`."""
+        with open(path, 'rb') as fp:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_perm, bands, seed, count, checkpoint = (
+            HEADER.unpack_from(buf, 0))
+        if magic != MAGIC:
+            raise ValueError('%s is not a MinHash index.' % path)
+        index = cls(num_perm, bands, seed, checkpoint)
+        index.mapped = MappedIndex(buf, num_perm, bands, count)
+        return index
+
+    def signature(self, xs):
+        return tuple(min((a * x + b) % PRIME for x in xs)
+                     for a, b in self.hashes)
+
+    def key(self, sig, band):
+        """The bucket key of `sig` in `band`."""
+        key = 0
+        for value in sig[band * self.rows:(band + 1) * self.rows]:
+            key = ((key * 1000003) ^ value) & MASK
+        return key
+
+    def keys(self, sig):
+        return (self.key(sig, band) for band in xrange(self.bands))
+
+    def get(self, item):
+        """Returns the `(signature, size)` of `item`, or None."""
+        if item in self.sets:
+            return self.sets[item]
+        if self.mapped is not None and item not in self.removed:
+            idx = self.mapped.position(item)
+            if idx is not None:
+                return self.mapped.get(idx)
+
+    def __contains__(self, item):
+        return self.get(item) is not None
+
+    def items(self):
+        """Yields every `(item, (signature, size))`, sorted by item."""
+        mapped = []
+        if self.mapped is not None:
+            ids = self.mapped.ids
+            mapped = ((ids[idx], self.mapped.get(idx))
+                      for idx in xrange(len(ids))
+                      if ids[idx] not in self.sets
+                      and ids[idx] not in self.removed)
+        return heapq.merge(mapped, sorted(self.sets.items()))
+
+    def add(self, item, xs):
+        """
+        Adds the members `xs` to the set of `item`, or creates it. The size
+        of the set grows by `len(xs)`, so they mustn't be in it already.
+        """
+        xs = set(xs)
+        if not xs:
+            return
+        sig, size = self.signature(xs), len(xs)
+        current = self.get(item)
+        if current is not None:
+            sig = tuple(map(min, current[0], sig))
+            size += current[1]
+        self.sets[item] = sig, size
+        self.removed.discard(item)
+        for band, key in enumerate(self.keys(sig)):
+            self.buckets[band][key].add(item)
+        for min_size, smallest in self._smallest.items():
+            if current is not None and item in self._items(smallest):
+                # It grew, something else may be smaller now.
+                del self._smallest[min_size]
+            elif smallest and current is None and size >= min_size:
+                bisect.insort(smallest, (size, item))
+                smallest.pop()
+
+    def remove(self, item):
+        self.sets.pop(item, None)
+        self.removed.add(item)
+        for min_size, smallest in self._smallest.items():
+            if item in self._items(smallest):
+                del self._smallest[min_size]
+
+    def _items(self, smallest):
+        return [item for size, item in smallest]
+
+    def smallest(self, n, min_size=1):
+        """The n items with the smallest sets of `min_size` or more."""
+        smallest = self._smallest.get(min_size, [])
+        if len(smallest) < n:
+            smallest = self._smallest[min_size] = heapq.nsmallest(
+                n, ((size, item) for item, (sig, size) in self.items()
+                    if size >= min_size))
+        return self._items(smallest)[:n]
+
+    def candidates(self, sig):
+        """
+        Returns {item: (signature, size)} of the items sharing a bucket with
+        `sig`. Buckets still point to replaced or removed items, so what's
+        found is checked against the changes.
+        """
+        rv = {}
+        for band, key in enumerate(self.keys(sig)):
+            for item in self.buckets[band].get(key, ()):
+                if item in self.sets:
+                    rv[item] = self.sets[item]
+            if self.mapped is None:
+                continue
+            for idx in self.mapped.bucket(band, key):
+                item = self.mapped.ids[idx]
+                if item in rv or item in self.removed:
+                    continue
+                elif item in self.sets:
+                    rv[item] = self.sets[item]
+                else:
+                    rv[item] = self.mapped.get(idx)
+        return rv
+
+    def score(self, sig, size, other_sig, other_size):
+        same = sum(1 for x, y in zip(sig, other_sig) if x == y)
+        jaccard = same / float(self.num_perm)
+        common = jaccard * (size + other_size) / (1 + jaccard)
+        return 1. / (1. + size + other_size - 2 * common)
+
+    def top(self, item, n, min_size=1):
+        """
+        Returns about the n most similar items to `item` as [(other, score)],
+        best first, among the items with sets of `min_size` or more. `item`
+        scores 1.0 against itself so it is part of the result, like with
+        `Similarities.top`.
+        """
+        current = self.get(item)
+        if current is None:
+            raise KeyError(item)
+        return self._top(current[0], current[1], n, min_size)
+
+    def query(self, xs, n, min_size=1):
+        """Returns about the n most similar items to the set `xs`."""
+        xs = set(xs)
+        if not xs:
+            return []
+        return self._top(self.signature(xs), len(xs), n, min_size)
+
+    def _top(self, sig, size, n, min_size=1):
+        candidates = self.candidates(sig)
+        for other in self.smallest(n, min_size):
+            if other not in candidates:
+                candidates[other] = self.get(other)
+        scores = ((other, self.score(sig, size, *current))
+                  for other, current in candidates.iteritems()
+                  if current[1] >= min_size)
+        return heapq.nlargest(n, scores, key=operator.itemgetter(1))
+
+    def save(self, path):
+        """Writes the index to `path`, replacing it atomically."""
+        ids, sizes, sigs = [], [], []
+        for item, (sig, size) in self.items():
+            ids.append(item)
+            sizes.append(size)
+            sigs.append(sig)
+        count = len(ids)
+
+        tmp = '%s.tmp' % path
+        with open(tmp, 'wb') as fp:
+            fp.write(HEADER.pack(MAGIC, self.num_perm, self.bands, self.seed,
+                                 count, self.checkpoint))
+            fp.write(struct.pack('<%dq' % count, *ids))
+            fp.write(struct.pack('<%dI' % count, *sizes))
+            signature = struct.Struct('<%dI' % self.num_perm)
+            for sig in sigs:
+                fp.write(signature.pack(*sig))
+            for band in xrange(self.bands):
+                bucket = sorted((self.key(sig, band), idx)
+                                for idx, sig in enumerate(sigs))
+                fp.write(struct.pack('<%dQ' % count,
+                                     *[key for key, idx in bucket]))
+                fp.write(struct.pack('<%dI' % count,
+                                     *[idx for key, idx in bucket]))
+        os.rename(tmp, path)
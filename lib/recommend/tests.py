@@ -1,4 +1,8 @@
 from array import array
+import os
+import random
+import tempfile
+
 from nose.tools import eq_
 
 import recommend
@@ -31,3 +35,97 @@ def test_symmetric_diff_count():
 # The algorithm is in flux so this is minimal coverage.
 def test_similarity():
     eq_(1/2., recommend.similarity([1], [1, 2]))
+
+
+def test_similarities_top():
+    random.seed(42)
+    sets = dict((i, random.sample(xrange(40), random.randint(1, 8)))
+                for i in xrange(200))
+    sims = recommend.Similarities(sets)
+    for item, xs in sets.items():
+        expected = sorted((recommend.similarity(xs, ys)
+                           for ys in sets.values()), reverse=True)[:11]
+        eq_([score for other, score in sims.top(item, 11)], expected)
+
+
+def test_similarities_no_overlap():
+    sims = recommend.Similarities({1: [1, 2], 2: [3], 3: [4, 5, 6]})
+    eq_(sims.top(1, 3), [(1, 1.), (2, 1 / 4.), (3, 1 / 6.)])
+
+
+def test_minhash_identical():
+    index = recommend.MinHashIndex.build({1: [1, 2, 3], 2: [1, 2, 3],
+                                          3: [7, 8, 9]})
+    eq_(sorted(index.top(1, 2)), [(1, 1.), (2, 1.)])
+
+
+def test_minhash_query():
+    index = recommend.MinHashIndex.build({1: [1, 2, 3], 2: [4, 5, 6]})
+    eq_(index.query([4, 5, 6], 1), [(2, 1.)])
+    eq_(index.query([], 1), [])
+
+
+def test_minhash_add():
+    index = recommend.MinHashIndex.build({1: [1, 2]})
+    index.add(1, [3, 4])
+    eq_(index.get(1), (index.signature([1, 2, 3, 4]), 4))
+    index.add(2, [1, 2, 3, 4])
+    eq_(index.top(2, 2)[0][1], 1.)
+
+
+def test_minhash_min_size():
+    index = recommend.MinHashIndex.build({1: [1, 2, 3], 2: [1, 2], 3: [9],
+                                          4: [4, 5, 6]})
+    eq_([item for item, score in index.top(1, 3, min_size=3)], [1, 4])
+    eq_(index.smallest(2, min_size=2), [2, 1])
+    index.add(5, [7, 8])
+    eq_(index.smallest(2, min_size=2), [2, 5])
+
+
+def test_minhash_save():
+    random.seed(42)
+    sets = dict((i, random.sample(xrange(40), random.randint(1, 8)))
+                for i in xrange(200))
+    index = recommend.MinHashIndex.build(sets, checkpoint=5)
+    path = tempfile.mktemp()
+    try:
+        index.save(path)
+        loaded = recommend.MinHashIndex.load(path)
+        eq_(loaded.checkpoint, 5)
+        for item in sets:
+            eq_(loaded.get(item), index.get(item))
+            eq_([score for other, score in loaded.top(item, 11)],
+                [score for other, score in index.top(item, 11)])
+
+        # Changes are kept on top of the file until it's saved again.
+        loaded.add(200, [1, 2])
+        loaded.add(0, [41])
+        loaded.remove(1)
+        eq_(loaded.get(200)[1], 2)
+        eq_(loaded.get(0)[1], len(sets[0]) + 1)
+        assert 1 not in loaded
+        loaded.save(path)
+        saved = recommend.MinHashIndex.load(path)
+        eq_([item for item, value in saved.items()],
+            [0] + range(2, 201))
+        eq_(saved.get(0), loaded.get(0))
+    finally:
+        os.remove(path)
+
+
+def test_minhash_recall():
+    # Items are mostly in the collections of one of 25 groups.
+    random.seed(42)
+    sets = {}
+    for i in xrange(500):
+        group = xrange(i % 25 * 20, i % 25 * 20 + 20)
+        sets[i] = (random.sample(group, random.randint(8, 15)) +
+                   random.sample(xrange(500), 2))
+    exact = recommend.Similarities(sets)
+    index = recommend.MinHashIndex.build(sets)
+    hits = 0
+    for item in sets:
+        expected = set(other for other, score in exact.top(item, 11))
+        hits += len(expected & set(other for other, score
+                                   in index.top(item, 11)))
+    assert hits / (11. * len(sets)) > .8
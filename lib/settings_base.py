@@ -103,6 +103,11 @@ SERVICES_DATABASE = {
     'HOST': '',
 }
 
+# Seconds the update service keeps the files an add-on can offer as updates
+# in process memory. Zamboni invalidates them when files or versions change,
+# set to 0 to resolve every update ping with SQL.
+SERVICES_UPDATE_CACHE_TIMEOUT = 300
+
 DATABASE_ROUTERS = ('multidb.PinningMasterSlaveRouter',)
 
 # For use django-mysql-pool backend.
@@ -269,6 +274,10 @@ MIRROR_STAGE_PATH = NETAPP_STORAGE + '/public-staging'
 # Where dumped apps will be written too.
 DUMPED_APPS_PATH = NETAPP_STORAGE + '/dumped-apps'
 
+# The MinHash index of the add-ons in synced collections, written by the
+# `recs` and `update_recs_index` crons and read by every server.
+RECS_INDEX_PATH = NETAPP_STORAGE + '/recs.idx'
+
 # paths that don't require an app prefix
 SUPPORTED_NONAPPS = ('about', 'admin', 'apps', 'blocklist', 'credits',
                      'developer_agreement', 'developer_faq', 'developers',
@@ -975,6 +984,9 @@ PERSONAS_IMAGE_URL_SSL = ('https://getpersonas.cdn.mozilla.net/static/'
 PERSONAS_UPDATE_URL = 'https://www.getpersonas.com/update_check/%d'
 VAMO_URL = 'https://versioncheck.addons.mozilla.org'
 NEW_PERSONAS_UPDATE_URL = VAMO_URL + '/%(locale)s/themes/update-check/%(id)d'
+# Seconds the theme update service caches the rendered JSON of a theme. It is
+# invalidated when the theme is saved.
+THEME_UPDATE_CACHE_TIMEOUT = 60 * 60 * 24
 
 
 # Outgoing URL bouncer
@@ -1108,10 +1120,6 @@ CELERY_ROUTES = {
 # Otherwise your task will use the default settings.
 CELERY_TIME_LIMITS = {
     'lib.video.tasks.resize_video': {'soft': 360, 'hard': 600},
-    'lib.es.management.commands.reindex_mkt.run_indexing': {
-        'soft': 60 * 10,  # 10 mins to reindex.
-        'hard': 60 * 20,  # 20 mins hard limit.
-    },
 }
 
 # When testing, we always want tasks to raise exceptions. Good for sanity.
@@ -1345,6 +1353,9 @@ BLOCKLIST_COOKIE = 'BLOCKLIST_v1'
 FILE_VIEWER_SIZE_LIMIT = 1048576
 # The maximum file size that you can have inside a zip file.
 FILE_UNZIP_SIZE_LIMIT = 104857600
+# The disk space the files extracted for the file viewer can use, the least
+# recently used ones are removed past it.
+FILE_VIEWER_DISK_BUDGET = 10 * 1024 * 1024 * 1024
 
 # How long to delay tasks relying on file system to cope with NFS lag.
 NFS_LAG_DELAY = 3
@@ -1380,6 +1391,16 @@ ES_INDEXES = {'default': 'addons',
 ES_TIMEOUT = 30
 ES_DEFAULT_NUM_REPLICAS = 2
 ES_DEFAULT_NUM_SHARDS = 5
+# Bulk requests sent by lib.es.pipeline are flushed at whichever of these
+# limits comes first.
+ES_BULK_MAX_DOCS = 500
+ES_BULK_MAX_BYTES = 5 * 1024 * 1024
+# Processes extracting documents in lib.es.pipeline, None for one per CPU.
+ES_REINDEX_PROCESSES = None
+# The indexing outbox (lib.es.outbox) is consumed every ES_OUTBOX_WINDOW
+# seconds, ES_OUTBOX_BATCH rows per doc type at a time.
+ES_OUTBOX_WINDOW = 5
+ES_OUTBOX_BATCH = 5000
 
 # Default AMO user id to use for tasks.
 TASK_USER_ID = 4757633
@@ -1424,6 +1445,9 @@ WEBAPPS_RECEIPT_KEY = ''
 WEBAPPS_RECEIPT_EXPIRY_SECONDS = 60 * 60 * 24 * 182
 # Send a new receipt back when it expires.
 WEBAPPS_RECEIPT_EXPIRED_SEND = False
+# Seconds the receipt verifier caches a verdict on a receipt. It is
+# invalidated when a purchase, refund or chargeback is written, 0 disables it.
+RECEIPT_VERIFY_CACHE_TIMEOUT = 60 * 5
 
 # How long a watermarked addon should be re-used for, after this
 # time it will be regenerated.
@@ -1569,6 +1593,14 @@ JINGO_MINIFY_USE_STATIC = False
 # Monolith settings.
 MONOLITH_SERVER = None
 MONOLITH_MAX_DATE_RANGE = 365
+# Stat records are kept in memory and written in batches once there are
+# MONOLITH_BUFFER_SIZE of them or the oldest is MONOLITH_BUFFER_TIMEOUT
+# seconds old. If the database can't be written to, at most
+# MONOLITH_BUFFER_MAX records are kept. A size of 1 writes every record as
+# it comes.
+MONOLITH_BUFFER_SIZE = 100
+MONOLITH_BUFFER_TIMEOUT = 10
+MONOLITH_BUFFER_MAX = 10000
 
 # These are useful services, like error generation, getting settings and the
 # like. They should *not* be on in production.
@@ -0,0 +1,5 @@
+ALTER TABLE `zadmin_reindexing`
+    ADD COLUMN `total` int(11) unsigned NOT NULL DEFAULT 0,
+    ADD COLUMN `indexed` int(11) unsigned NOT NULL DEFAULT 0,
+    ADD COLUMN `rate` double NOT NULL DEFAULT 0,
+    ADD COLUMN `eta` datetime DEFAULT NULL;
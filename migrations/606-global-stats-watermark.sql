@@ -0,0 +1,5 @@
+CREATE TABLE `global_stats_watermark` (
+    `name` varchar(255) NOT NULL PRIMARY KEY,
+    `date` date NOT NULL,
+    `total` bigint NOT NULL
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci;
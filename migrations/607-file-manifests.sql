@@ -0,0 +1,7 @@
+CREATE TABLE `file_manifests` (
+    `id` int(11) unsigned NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    `created` datetime NOT NULL,
+    `modified` datetime NOT NULL,
+    `hash` varchar(255) NOT NULL UNIQUE,
+    `entries` longtext NOT NULL
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci;
@@ -0,0 +1,18 @@
+CREATE TABLE `reviewer_score_rollups` (
+    `id` int(11) unsigned AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `user_id` int(11) unsigned NOT NULL,
+    `date` date NOT NULL,
+    `note_key` smallint NOT NULL DEFAULT 0,
+    `score` int(11) NOT NULL DEFAULT 0,
+    UNIQUE (`user_id`, `date`, `note_key`)
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+ALTER TABLE `reviewer_score_rollups`
+    ADD CONSTRAINT `reviewer_score_rollups_user_id_fk`
+    FOREIGN KEY (`user_id`) REFERENCES `users` (`id`)
+    ON DELETE CASCADE;
+
+INSERT INTO `reviewer_score_rollups` (`user_id`, `date`, `note_key`, `score`)
+    SELECT `user_id`, DATE(`created`), `note_key`, SUM(`score`)
+    FROM `reviewer_scores`
+    GROUP BY `user_id`, DATE(`created`), `note_key`;
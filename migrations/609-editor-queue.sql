@@ -0,0 +1,26 @@
+CREATE TABLE `editor_queue` (
+    `id` int(11) unsigned AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `addon_id` int(11) unsigned NOT NULL,
+    `queue` varchar(20) NOT NULL,
+    `version_id` int(11) unsigned NOT NULL,
+    `addon_name` varchar(255),
+    `binary` bool NOT NULL DEFAULT 0,
+    `binary_components` bool NOT NULL DEFAULT 0,
+    `is_jetpack` bool NOT NULL DEFAULT 0,
+    `is_restartless` bool NOT NULL DEFAULT 0,
+    `file_platform_ids` varchar(255),
+    `application_ids` varchar(255),
+    `waiting_since` datetime,
+    UNIQUE (`queue`, `addon_id`)
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+ALTER TABLE `editor_queue`
+    ADD CONSTRAINT `editor_queue_addon_id_fk`
+    FOREIGN KEY (`addon_id`) REFERENCES `addons` (`id`)
+    ON DELETE CASCADE;
+ALTER TABLE `editor_queue`
+    ADD CONSTRAINT `editor_queue_version_id_fk`
+    FOREIGN KEY (`version_id`) REFERENCES `versions` (`id`)
+    ON DELETE CASCADE;
+
+CREATE INDEX `editor_queue_waiting_idx` ON `editor_queue` (`queue`, `waiting_since`);
@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+from editors.models import EditorQueue
+
+
+def run():
+    EditorQueue.refresh()
@@ -0,0 +1,8 @@
+CREATE TABLE `es_outbox` (
+    `id` int(11) unsigned AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `doc_type` varchar(32) NOT NULL,
+    `object_id` int(11) unsigned NOT NULL,
+    `created` datetime NOT NULL
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+CREATE INDEX `es_outbox_doc_type_id_idx` ON `es_outbox` (`doc_type`, `id`);
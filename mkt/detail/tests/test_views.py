@@ -880,6 +880,11 @@ class TestPackagedManifest(DetailBase):
         hash_.update(self.app.get_latest_file().hash)
         return hash_.hexdigest()
 
+    def _mocked_entry(self, manifest=None):
+        return {'content': manifest or self._mocked_json(),
+                'etag': self.get_digest_from_manifest(manifest),
+                'modified': 1370000000}
+
     def _mocked_json(self):
         data = {
             u'name': u'Packaged App √',
@@ -911,16 +916,16 @@ class TestPackagedManifest(DetailBase):
         res = self.client.get(self.url)
         eq_(res.status_code, 404)
 
-    @mock.patch('mkt.webapps.models.Webapp.get_cached_manifest')
+    @mock.patch('mkt.webapps.models.Webapp.get_stored_manifest')
     def test_app_public(self, _mock):
-        _mock.return_value = self._mocked_json()
+        _mock.return_value = self._mocked_entry()
         res = self.client.get(self.url)
         eq_(res.content, self._mocked_json())
         eq_(res['Content-Type'],
             'application/x-web-app-manifest+json; charset=utf-8')
         eq_(res['ETag'], '"%s"' % self.get_digest_from_manifest())
 
-    @mock.patch('mkt.webapps.models.Webapp.get_cached_manifest')
+    @mock.patch('mkt.webapps.models.Webapp._build_manifest')
     def test_etag_updates(self, _mock):
         _mock.return_value = self._mocked_json()
 
@@ -951,9 +956,34 @@ class TestPackagedManifest(DetailBase):
 
         self.assertNotEqual(first_etag, second_etag)
 
-    @mock.patch('mkt.webapps.models.Webapp.get_cached_manifest')
+    @mock.patch('mkt.webapps.models.Webapp.get_stored_manifest')
+    def test_etag_updates_approved(self, _mock):
+        _mock.return_value = self._mocked_entry()
+        res = self.client.get(self.url)
+        first_etag = res['ETag']
+
+        # The app has been approved again.
+        _mock.return_value = self._mocked_entry(json.dumps({'name': 'New'}))
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=first_etag)
+        eq_(res.status_code, 200)
+        eq_(res.content, json.dumps({'name': 'New'}))
+        self.assertNotEqual(first_etag, res['ETag'])
+
+    @mock.patch('mkt.webapps.models.Webapp.get_stored_manifest')
+    def test_last_modified(self, _mock):
+        _mock.return_value = self._mocked_entry()
+        res = self.client.get(self.url)
+        eq_(res['Last-Modified'], 'Fri, 31 May 2013 11:33:20 GMT')
+        res = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE='Fri, 31 May 2013 11:33:20 GMT')
+        eq_(res.status_code, 304)
+        res = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE='Fri, 31 May 2013 11:33:19 GMT')
+        eq_(res.status_code, 200)
+
+    @mock.patch('mkt.webapps.models.Webapp.get_stored_manifest')
     def test_conditional_get(self, _mock):
-        _mock.return_value = self._mocked_json()
+        _mock.return_value = self._mocked_entry()
         etag = self.get_digest_from_manifest()
         res = self.client.get(self.url, HTTP_IF_NONE_MATCH='%s' % etag)
         eq_(res.content, '')
@@ -964,31 +994,31 @@ class TestPackagedManifest(DetailBase):
         res = self.client.get(self.url)
         eq_(res.status_code, 404)
 
-    @mock.patch('mkt.webapps.models.Webapp.get_cached_manifest')
+    @mock.patch('mkt.webapps.models.Webapp.get_stored_manifest')
     def test_app_pending_reviewer(self, _mock):
         self.login_as_reviewer()
         self.app.update(status=amo.STATUS_PENDING)
-        _mock.return_value = self._mocked_json()
+        _mock.return_value = self._mocked_entry()
         res = self.client.get(self.url)
         eq_(res.content, self._mocked_json())
         eq_(res['Content-Type'],
             'application/x-web-app-manifest+json; charset=utf-8')
         eq_(res['ETag'], '"%s"' % self.get_digest_from_manifest())
 
-    @mock.patch('mkt.webapps.models.Webapp.get_cached_manifest')
+    @mock.patch('mkt.webapps.models.Webapp.get_stored_manifest')
     def test_app_pending_author(self, _mock):
         self.login_as_author()
         self.app.update(status=amo.STATUS_PENDING)
-        _mock.return_value = self._mocked_json()
+        _mock.return_value = self._mocked_entry()
         res = self.client.get(self.url)
         eq_(res.content, self._mocked_json())
         eq_(res['Content-Type'],
             'application/x-web-app-manifest+json; charset=utf-8')
         eq_(res['ETag'], '"%s"' % self.get_digest_from_manifest())
 
-    @mock.patch('mkt.webapps.models.Webapp.get_cached_manifest')
+    @mock.patch('mkt.webapps.models.Webapp.get_stored_manifest')
     def test_logged_out(self, _mock):
-        _mock.return_value = self._mocked_json()
+        _mock.return_value = self._mocked_entry()
         self.client.logout()
         res = self.client.get(self.url)
         eq_(res.status_code, 200)
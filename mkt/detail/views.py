@@ -1,8 +1,8 @@
-import hashlib
+import datetime
 
 from django import http
 from django.shortcuts import get_object_or_404, redirect
-from django.views.decorators.http import etag
+from django.views.decorators.http import condition
 
 import commonware.log
 import jingo
@@ -61,7 +61,8 @@ def detail(request, addon, add_review=False):
 def manifest(request, uuid):
     """Returns the "mini" manifest for packaged apps.
 
-    If not a packaged app, returns a 404.
+    If not a packaged app, returns a 404. The manifest and its ETag are
+    stored when the app is approved, unchanged manifests get a 304.
 
     """
     addon = get_object_or_404(Webapp, guid=uuid, is_packaged=True)
@@ -70,28 +71,18 @@ def manifest(request, uuid):
     is_dev = addon.has_author(request.amo_user)
     is_avail = addon.status in [amo.STATUS_PUBLIC, amo.STATUS_BLOCKED]
 
-    package_etag = hashlib.sha256()
-
     if (not addon.is_packaged or addon.disabled_by_user or
         not (is_avail or is_reviewer or is_dev)):
         raise http.Http404
 
-    else:
-        manifest_content = addon.get_cached_manifest()
-        package_etag.update(manifest_content)
-
-        if addon.is_packaged:
-            # Update the hash with the content of the package itself.
-            package_file = addon.get_latest_file()
-            if package_file:
-                package_etag.update(package_file.hash)
-
-    manifest_etag = package_etag.hexdigest()
+    stored = addon.get_stored_manifest()
+    modified = datetime.datetime.utcfromtimestamp(stored['modified'])
 
-    @etag(lambda r, a: manifest_etag)
+    @condition(etag_func=lambda r, a: stored['etag'],
+               last_modified_func=lambda r, a: modified)
     def _inner_view(request, addon):
         response = http.HttpResponse(
-            manifest_content,
+            stored['content'],
             content_type='application/x-web-app-manifest+json; charset=utf-8')
         return response
 
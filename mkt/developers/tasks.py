@@ -21,7 +21,7 @@ from appvalidator import validate_app, validate_packaged_app
 from celery_tasktree import task_with_callbacks
 from celeryutils import task
 from django_statsd.clients import statsd
-from PIL import Image
+from PIL import Image, ImageChops
 from tower import ugettext as _
 
 import amo
@@ -192,8 +192,9 @@ def resize_imageasset(src, full_dst, size, **kw):
 def get_hue(image):
     """Return the most common hue of the image."""
     hues = [0 for x in range(256)]
-    # Iterate each pixel. Count each hue value in `hues`.
-    for pixel in image.getdata():
+    # Count the hue of each distinct colour once, for all of its pixels.
+    width, height = image.size
+    for count, pixel in image.convert('RGBA').getcolors(width * height):
         # Ignore greyscale pixels.
         if pixel[0] == pixel[1] and pixel[1] == pixel[2]:
             continue
@@ -202,30 +203,54 @@ def get_hue(image):
             continue
         h, l, s = colorsys.rgb_to_hls(*[x / 255.0 for x in pixel[:3]])
         # Get a tally of the hue for that image.
-        hues[int(h * 255)] += 1
+        hues[int(h * 255)] += count
 
     return hues.index(max(hues))
 
 
+# The decoded backdrop of the image assets by size, kept as the lowest and the
+# highest channel of each pixel, which is all that a change of hue needs.
+_backdrops = {}
+
+
+def _get_backdrop(size=None):
+    if size not in _backdrops:
+        with storage.open(os.path.join(settings.MEDIA_ROOT,
+                                       'img/hub/assetback.png')) as assetback:
+            im = Image.open(assetback)
+            if size:
+                im = im.resize(size)
+            r, g, b = im.convert('RGB').split()
+        _backdrops[size] = (ImageChops.darker(ImageChops.darker(r, g), b),
+                            ImageChops.lighter(ImageChops.lighter(r, g), b),
+                            im.mode)
+    return _backdrops[size]
+
+
+def _hue_weight(hue):
+    """
+    In colorsys.hls_to_rgb, a channel is the lowest channel of the colour plus
+    this much of the difference with the highest one, for the hue of the
+    channel (the hue of the colour, less a third for green and two for blue).
+    """
+    hue = hue % 1.0
+    if hue < 1 / 6.0:
+        return hue * 6
+    if hue < 0.5:
+        return 1
+    if hue < 2 / 3.0:
+        return (2 / 3.0 - hue) * 6
+    return 0
+
+
 def _generate_image_asset_backdrop(hue, size=None):
-    with storage.open(os.path.join(settings.MEDIA_ROOT,
-                                   'img/hub/assetback.png')) as assetback:
-        im = Image.open(assetback)
-        if size:
-            im = im.resize(size)
-        im_width = im.size[0]
-
-        # Change the hue of the background by iterating each pixel.
-        for i, px in enumerate(im.getdata()):
-            # Get the HLS value for the pixel
-            h, l, s = colorsys.rgb_to_hls(*[x / 255.0 for x in px[:3]])
-            # Convert back to RGB
-            px = tuple([int(x * 255) for x in
-                        colorsys.hls_to_rgb(hue, l, s)])
-            # Put the RGB value back in the pixel
-            im.putpixel((i % im_width, i / im_width), px)
-
-    return im
+    # Changing the hue of a pixel keeps its lightness and saturation, and so
+    # its lowest and highest channels: each channel is a blend of these two,
+    # with a weight that only depends on the hue.
+    lowest, highest, mode = _get_backdrop(size)
+    channels = [Image.blend(lowest, highest, _hue_weight(hue + offset))
+                for offset in (1 / 3.0, 0, -1 / 3.0)]
+    return Image.merge('RGB', channels).convert(mode)
 
 
 @task_with_callbacks
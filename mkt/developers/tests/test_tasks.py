@@ -1,4 +1,5 @@
 import codecs
+import colorsys
 from contextlib import contextmanager
 from cStringIO import StringIO
 import json
@@ -261,6 +262,20 @@ class TestGenerateImageAssets(amo.tests.TestCase):
             im.load()
         eq_(tasks.get_hue(im), 42)
 
+    def test_backdrop(self):
+        size, hue = (40, 20), 0.3
+        with storage.open(os.path.join(settings.MEDIA_ROOT,
+                                       'img/hub/assetback.png')) as fp:
+            source = Image.open(fp)
+            source = source.resize(size)
+        backdrop = tasks._generate_image_asset_backdrop(hue, size)
+        eq_(backdrop.size, size)
+        for px, new in zip(source.getdata(), backdrop.getdata()):
+            h, l, s = colorsys.rgb_to_hls(*[x / 255.0 for x in px[:3]])
+            expected = [x * 255 for x in colorsys.hls_to_rgb(hue, l, s)]
+            for channel, value in zip(expected, new[:3]):
+                assert abs(channel - value) <= 1, (px, new, expected)
+
 
 class TestFetchManifest(amo.tests.TestCase):
 
@@ -1,8 +1,20 @@
+import atexit
 import datetime
 import hashlib
 import json
+import logging
+import time
+from collections import deque
+from threading import Lock
 
+from django.conf import settings
+from django.core.signals import request_finished
 from django.db import models
+from django.dispatch import receiver
+
+from amo.utils import chunked
+
+log = logging.getLogger('z.monolith')
 
 
 class MonolithRecord(models.Model):
@@ -21,21 +33,113 @@ class MonolithRecord(models.Model):
         db_table = 'monolith_record'
 
 
+def get_user(request):
+    """Get the string identifying an user: session key, ip and user agent."""
+    ip = request.META.get('REMOTE_ADDR', '')
+    ua = request.META.get('User-Agent', '')
+    session_key = request.session.session_key or ''
+
+    return '-'.join(map(str, (ip, ua, session_key)))
+
+
 def get_user_hash(request):
     """Get a hash identifying an user.
 
     It's a hash of session key, ip and user agent
     """
-    ip = request.META.get('REMOTE_ADDR', '')
-    ua = request.META.get('User-Agent', '')
-    session_key = request.session.session_key or ''
+    return hashlib.sha1(get_user(request)).hexdigest()
+
+
+class RecordBuffer(object):
+    """Stat records waiting to be written to the database.
 
-    return hashlib.sha1('-'.join(map(str, (ip, ua, session_key)))).hexdigest()
+    Records are written with multi-row INSERTs when the request is over, once
+    there are `MONOLITH_BUFFER_SIZE` of them or the oldest has waited for
+    `MONOLITH_BUFFER_TIMEOUT` seconds, and when the process exits. The user
+    hashes are computed then too, out of the request.
+
+    Records that could not be written are kept for the next flush, up to
+    `MONOLITH_BUFFER_MAX` records.
+    """
+
+    def __init__(self):
+        self.records = deque()
+        self.lock = Lock()
+        self.oldest = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record):
+        with self.lock:
+            if not self.records:
+                self.oldest = time.time()
+            self.records.append(record)
+        # Normally the buffer is only flushed after the request.
+        if (settings.MONOLITH_BUFFER_SIZE <= 1 or
+            len(self.records) >= settings.MONOLITH_BUFFER_MAX):
+            self.flush()
+
+    def should_flush(self):
+        return bool(self.records) and (
+            len(self.records) >= settings.MONOLITH_BUFFER_SIZE or
+            time.time() - self.oldest >= settings.MONOLITH_BUFFER_TIMEOUT)
+
+    def flush(self):
+        """Writes the buffered records, returns how many were written."""
+        with self.lock:
+            records, self.records = list(self.records), deque()
+            oldest, self.oldest = self.oldest, None
+        if not records:
+            return 0
+
+        for record in records:
+            if record.user_hash is None:
+                record.user_hash = hashlib.sha1(record._user).hexdigest()
+        written = 0
+        try:
+            for chunk in chunked(records, 500):
+                MonolithRecord.objects.bulk_create(chunk)
+                written += len(chunk)
+        except Exception:
+            log.exception('Could not write %s monolith records'
+                          % (len(records) - written))
+            self.requeue(records[written:], oldest)
+        return written
+
+    def requeue(self, records, oldest):
+        with self.lock:
+            self.records.extendleft(reversed(records))
+            self.oldest = oldest
+            dropped = len(self.records) - settings.MONOLITH_BUFFER_MAX
+            for i in range(max(dropped, 0)):
+                self.records.popleft()
+        if dropped > 0:
+            log.error('Dropped %s monolith records, the buffer is full.'
+                      % dropped)
+
+
+buffer = RecordBuffer()
+
+
+@receiver(request_finished, dispatch_uid='monolith_flush_records')
+def flush_records(sender, **kw):
+    # This runs once the request and its transaction are over, so the
+    # records don't depend on the outcome of whichever request flushed them.
+    if buffer.should_flush():
+        buffer.flush()
+
+
+# Don't lose the records of a worker that shuts down.
+atexit.register(buffer.flush)
 
 
 def record_stat(key, request, **data):
     """Create a new record in the database with the given values.
 
+    The record is buffered and written along with others, see
+    `RecordBuffer`.
+
     :param key:
         The type of stats you're sending, e.g. "app.install".
 
@@ -55,7 +159,8 @@ def record_stat(key, request, **data):
     if not data:
         raise ValueError('You should at least define one value')
 
-    record = MonolithRecord(key=key, user_hash=get_user_hash(request),
-                            recorded=recorded, value=json.dumps(data))
-    record.save()
+    record = MonolithRecord(key=key, user_hash=None, recorded=recorded,
+                            value=json.dumps(data))
+    record._user = get_user(request)
+    buffer.add(record)
     return record
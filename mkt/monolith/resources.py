@@ -1,7 +1,13 @@
 import logging
 import json
+import urllib
+from datetime import datetime
 
 from django.db import transaction
+from django.db.models import Q
+
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
 
 from mkt.api.authentication import OAuthAuthentication
 from mkt.api.authorization import PermissionAuthorization
@@ -12,6 +18,57 @@ from .models import MonolithRecord
 logger = logging.getLogger('z.monolith')
 
 
+class KeysetPaginator(Paginator):
+    """
+    Pages through the records in `(recorded, id)` order when `after` is
+    given, with `after=` for the first page and `after=<recorded>,<id>` of
+    the last record seen for the next ones. Unlike offsets, every page is
+    as cheap as the first and no records are skipped or repeated when
+    records are added or deleted in between.
+
+    Without `after`, this is the usual offset pagination.
+    """
+
+    def page(self):
+        after = self.request_data.get('after')
+        if after is None:
+            return super(KeysetPaginator, self).page()
+
+        limit = self.get_limit()
+        objects = self.objects.order_by('recorded', 'id')
+        if after:
+            recorded, pk = self.parse_after(after)
+            objects = objects.filter(Q(recorded__gt=recorded) |
+                                     Q(recorded=recorded, id__gt=pk))
+        objects = list(objects[:limit]) if limit else list(objects)
+
+        next_uri = None
+        if limit and len(objects) == limit:
+            last = objects[-1]
+            next_uri = self.keyset_uri(limit, '%s,%s' % (
+                last.recorded.isoformat(), last.pk))
+        return {'objects': objects,
+                'meta': {'limit': limit, 'next': next_uri, 'previous': None,
+                         'after': after}}
+
+    def parse_after(self, after):
+        try:
+            recorded, pk = after.rsplit(',', 1)
+            fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in recorded else (
+                '%Y-%m-%dT%H:%M:%S')
+            return datetime.strptime(recorded, fmt), int(pk)
+        except ValueError:
+            raise BadRequest('Invalid value for after: %s' % after)
+
+    def keyset_uri(self, limit, after):
+        if self.resource_uri is None:
+            return None
+        params = dict((k, v) for k, v in self.request_data.items()
+                      if k not in ('after', 'limit', 'offset'))
+        params.update(limit=limit, after=after)
+        return '%s?%s' % (self.resource_uri, urllib.urlencode(params))
+
+
 class MonolithData(MarketplaceModelResource):
 
     class Meta:
@@ -23,6 +80,7 @@ class MonolithData(MarketplaceModelResource):
                      'id': ['lte', 'gte']}
         authorization = PermissionAuthorization('Monolith', 'API')
         authentication = OAuthAuthentication()
+        paginator_class = KeysetPaginator
 
     @transaction.commit_on_success
     def obj_delete_list(self, request=None, **kwargs):
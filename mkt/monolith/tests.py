@@ -2,16 +2,20 @@ from collections import namedtuple
 import datetime
 import json
 import uuid
+from urlparse import parse_qsl, urlparse
 
+import mock
 from nose.tools import eq_
 
+from django.conf import settings
+from django.core.signals import request_finished
 from django.test import client
 
 from amo.tests import TestCase
 from mkt.api.tests.test_oauth import BaseOAuth
 from mkt.site.fixtures import fixture
 
-from .models import record_stat, MonolithRecord
+from .models import buffer, record_stat, MonolithRecord
 
 
 class RequestFactory(client.RequestFactory):
@@ -63,6 +67,59 @@ class TestModels(TestCase):
             record_stat('app.install', self.request)
 
 
+@mock.patch.object(settings, 'MONOLITH_BUFFER_SIZE', 3)
+class TestRecordBuffer(TestCase):
+
+    def setUp(self):
+        super(TestRecordBuffer, self).setUp()
+        self.request = RequestFactory(remote_addr='127.0.0.1')
+
+    def tearDown(self):
+        buffer.records.clear()
+        super(TestRecordBuffer, self).tearDown()
+
+    def test_buffered(self):
+        record_stat('app.install', self.request, value=1)
+        record_stat('app.install', self.request, value=2)
+        eq_(MonolithRecord.objects.count(), 0)
+        eq_(buffer.flush(), 2)
+        records = MonolithRecord.objects.order_by('id')
+        eq_([json.loads(r.value)['value'] for r in records], [1, 2])
+        eq_(records[0].user_hash, records[1].user_hash)
+        eq_(len(records[0].user_hash), 40)
+
+    def test_flush_after_request_on_size(self):
+        record_stat('app.install', self.request, value=1)
+        request_finished.send(sender=self.__class__)
+        eq_(MonolithRecord.objects.count(), 0)
+        record_stat('app.install', self.request, value=2)
+        record_stat('app.install', self.request, value=3)
+        eq_(MonolithRecord.objects.count(), 0)
+        request_finished.send(sender=self.__class__)
+        eq_(MonolithRecord.objects.count(), 3)
+
+    @mock.patch('mkt.monolith.models.time.time')
+    def test_flush_after_request_on_time(self, time):
+        time.return_value = 100
+        record_stat('app.install', self.request, value=1)
+        time.return_value = 100 + settings.MONOLITH_BUFFER_TIMEOUT
+        request_finished.send(sender=self.__class__)
+        eq_(MonolithRecord.objects.count(), 1)
+
+    @mock.patch.object(settings, 'MONOLITH_BUFFER_MAX', 3)
+    @mock.patch('mkt.monolith.models.MonolithRecord.objects.bulk_create')
+    def test_failed_flush(self, bulk_create):
+        bulk_create.side_effect = Exception
+        record_stat('app.install', self.request, value=1)
+        record_stat('app.install', self.request, value=2)
+        eq_(buffer.flush(), 0)
+        eq_(len(buffer), 2)
+        # The buffer is full, the oldest record goes.
+        record_stat('app.install', self.request, value=3)
+        record_stat('app.install', self.request, value=4)
+        eq_([json.loads(r.value)['value'] for r in buffer.records], [2, 3, 4])
+
+
 class TestMonolithResource(BaseOAuth):
     fixtures = fixture('user_2519')
 
@@ -113,6 +170,33 @@ class TestMonolithResource(BaseOAuth):
         data = json.loads(res.content)
         eq_(len(data['objects']), 2)
 
+    def next(self, data):
+        return dict(parse_qsl(urlparse(data['meta']['next']).query))
+
+    def test_keyset_pagination(self):
+        dates = (self.last_week, self.yesterday, self.yesterday, self.now)
+        for id_, date in enumerate(dates):
+            record_stat('app.install', self.request, __recorded=date,
+                        value=id_)
+
+        res = self.client.get(self.list_url, data={'after': '', 'limit': 2})
+        eq_(res.status_code, 200)
+        data = json.loads(res.content)
+        eq_([o['value']['value'] for o in data['objects']], [0, 1])
+
+        res = self.client.get(self.list_url, data=self.next(data))
+        data = json.loads(res.content)
+        eq_([o['value']['value'] for o in data['objects']], [2, 3])
+
+        res = self.client.get(self.list_url, data=self.next(data))
+        data = json.loads(res.content)
+        eq_(data['objects'], [])
+        eq_(data['meta']['next'], None)
+
+    def test_keyset_pagination_invalid(self):
+        res = self.client.get(self.list_url, data={'after': 'yesterday'})
+        eq_(res.status_code, 400)
+
     def test_deletion_by_filtering(self):
         # we should be able to delete a set of items using the API
         for id_, date in enumerate((self.last_week, self.yesterday, self.now)):
@@ -250,6 +250,40 @@ class TestVerify(amo.tests.TestCase):
             res = self.get(self.user_data)
             eq_(res['status'], 'refunded')
 
+    @mock.patch.object(utils.settings, 'RECEIPT_VERIFY_CACHE_TIMEOUT', 300)
+    def test_verdict_cached(self):
+        self.make_install()
+        eq_(self.get(self.user_data)['status'], 'ok')
+        with mock.patch.object(verify, 'decode_receipt') as decode:
+            eq_(self.get_decode('')['status'], 'ok')
+            assert not decode.called
+
+    @mock.patch.object(utils.settings, 'RECEIPT_VERIFY_CACHE_TIMEOUT', 300)
+    def test_verdict_invalidated_on_refund(self):
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        self.make_install()
+        purchase = self.make_purchase()
+        eq_(self.get(self.user_data)['status'], 'ok')
+        purchase.update(type=amo.CONTRIB_REFUND)
+        eq_(self.get(self.user_data)['status'], 'refunded')
+
+    @mock.patch.object(utils.settings, 'RECEIPT_VERIFY_CACHE_TIMEOUT', 300)
+    def test_verdict_invalidated_on_chargeback_contribution(self):
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        self.make_install()
+        self.make_purchase()
+        eq_(self.get(self.user_data)['status'], 'ok')
+        self.make_contribution(type=amo.CONTRIB_CHARGEBACK)
+        eq_(self.get(self.user_data)['status'], 'refunded')
+
+    @mock.patch.object(utils.settings, 'RECEIPT_VERIFY_CACHE_TIMEOUT', 300)
+    def test_expired_verdict_not_cached(self):
+        self.make_install()
+        user_data = self.user_data.copy()
+        user_data['exp'] = calendar.timegm(time.gmtime()) - 1000
+        eq_(self.get(user_data)['status'], 'expired')
+        eq_(self.get(user_data)['status'], 'expired')
+
     def test_other_premiums(self):
         for k in (amo.ADDON_FREE, amo.ADDON_PREMIUM_INAPP,
                   amo.ADDON_FREE_INAPP, amo.ADDON_OTHER_INAPP):
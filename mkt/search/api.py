@@ -92,6 +92,9 @@ class SearchResource(CORSResource, MarketplaceResource):
                         new_idx=True)
         qs = _filter_search(request, qs, form_data, region=region,
                             profile=profile)
+        # Reviewers looking for apps by status want them as they are now.
+        if not form_data.get('q') and 'status' not in base_filters:
+            qs = qs.cached('search-api')
         paginator = self._meta.paginator_class(request.GET, qs,
             resource_uri=self.get_resource_list_uri(),
             limit=self._meta.limit)
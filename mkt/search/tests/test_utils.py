@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.test.utils import override_settings
+
+import mock
+from nose.tools import eq_
+
+import amo.tests
+from mkt.search.utils import bump_search_generation, cached_search
+
+
+@override_settings(SEARCH_CACHE_TIMEOUT=60)
+class TestCachedSearch(amo.tests.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.search = mock.Mock()
+        self.search.return_value = {'hits': {'hits': [], 'total': 0}}
+
+    def get(self, key='k'):
+        return cached_search('test', key, self.search)
+
+    def test_hit(self):
+        eq_(self.get(), self.search.return_value)
+        eq_(self.get(), self.search.return_value)
+        eq_(self.search.call_count, 1)
+
+    def test_keys(self):
+        self.get('a')
+        self.get('b')
+        eq_(self.search.call_count, 2)
+
+    @override_settings(SEARCH_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.get()
+        self.get()
+        eq_(self.search.call_count, 2)
+
+    def test_stale_refreshed_once(self):
+        old = self.get()
+        bump_search_generation()
+        self.search.return_value = {'hits': {'hits': [{'_id': 1}],
+                                             'total': 1}}
+        # Another request is refreshing it, the stale result is served.
+        cache.add('search:test:k:lock', 1)
+        eq_(self.get(), old)
+        eq_(self.search.call_count, 1)
+
+        cache.delete('search:test:k:lock')
+        eq_(self.get(), self.search.return_value)
+        eq_(self.get(), self.search.return_value)
+        eq_(self.search.call_count, 2)
+        assert cache.get('search:test:k:lock') is None
+
+    @mock.patch('mkt.search.utils.statsd')
+    def test_stats(self, statsd):
+        self.get()
+        self.get()
+        bump_search_generation()
+        cache.add('search:test:k:lock', 1)
+        self.get()
+        eq_([c[0][0] for c in statsd.incr.call_args_list],
+            ['search.cache.test.miss', 'search.cache.test.hit',
+             'search.cache.test.stale'])
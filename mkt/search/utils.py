@@ -1,11 +1,104 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
 from elasticutils.contrib.django import S as eu_S
 from statsd import statsd
 
+from amo.search import TempS as amo_TempS
+from amo.utils import cache_ns_key
+
+# Held by the request refreshing a stale result, for that long at most.
+REFRESH_LOCK_TIMEOUT = 30
+
+
+def search_generation(increment=False):
+    """
+    The generation of the search indexes. Cached results of an older
+    generation are stale: they are still served, but refreshed once.
+    """
+    return cache_ns_key('search-results', increment=increment)
+
+
+def bump_search_generation():
+    search_generation(increment=True)
+
+
+def cached_search(endpoint, key, search):
+    """
+    Returns the raw results of `search()`, cached under `key`.
+
+    Hits and misses are counted in statsd per `endpoint`: a stale result is
+    served while a single request runs the search again.
+    """
+    timeout = settings.SEARCH_CACHE_TIMEOUT
+    if not timeout:
+        return search()
+
+    generation = search_generation()
+    key = 'search:%s:%s' % (endpoint, key)
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['generation'] == generation:
+            statsd.incr('search.cache.%s.hit' % endpoint)
+            return entry['hits']
+        if not cache.add(key + ':lock', 1, REFRESH_LOCK_TIMEOUT):
+            statsd.incr('search.cache.%s.stale' % endpoint)
+            return entry['hits']
+
+    statsd.incr('search.cache.%s.miss' % endpoint)
+    try:
+        hits = search()
+        cache.set(key, {'generation': generation, 'hits': hits,
+                        'stored': time.time()}, timeout)
+    finally:
+        if entry is not None:
+            cache.delete(key + ':lock')
+    return hits
 
-class S(eu_S):
+
+class CachedSearchMixin(object):
+    """
+    Caches the raw results (hits and facets) of searches marked with
+    `cached()`, keyed by the query sent to elasticsearch.
+    """
+    _cache_endpoint = None
+
+    def cached(self, endpoint):
+        new = self._clone()
+        new._cache_endpoint = endpoint
+        return new
+
+    def _clone(self, next_step=None):
+        new = super(CachedSearchMixin, self)._clone(next_step)
+        new._cache_endpoint = self._cache_endpoint
+        return new
+
+    def raw(self):
+        if not self._cache_endpoint:
+            return super(CachedSearchMixin, self).raw()
+        query = json.dumps([self.get_indexes(), self.get_doctypes(),
+                            self._build_query()], sort_keys=True)
+        return cached_search(self._cache_endpoint,
+                             hashlib.md5(query).hexdigest(),
+                             super(CachedSearchMixin, self).raw)
+
+
+class TimedS(eu_S):
 
     def raw(self):
         with statsd.timer('search.raw'):
-            hits = super(S, self).raw()
+            hits = super(TimedS, self).raw()
             statsd.timing('search.took', hits['took'])
             return hits
+
+
+class S(CachedSearchMixin, TimedS):
+    pass
+
+
+class TempS(CachedSearchMixin, amo_TempS):
+    pass
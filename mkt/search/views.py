@@ -220,6 +220,9 @@ def _app_search(request, category=None, browse=None):
                     tablet=request.TABLET)
 
     qs = _filter_search(request, qs, dict(query), region=region)
+    if not query.get('q'):
+        # Listings only vary by region, device, category, sort and page.
+        qs = qs.cached('search-views')
 
     # If we're mobile, leave no witnesses. (i.e.: hide "Applied Filters:
     # Mobile")
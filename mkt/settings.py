@@ -168,6 +168,10 @@ PRODUCT_ICON_EXPIRY = 1
 # Directory path to where product images for in-app payments are stored.
 INAPP_IMAGE_PATH = NETAPP_STORAGE + '/inapp-image'
 
+# Where the mini manifests of packaged apps are stored, along with their
+# ETag.
+MINI_MANIFESTS_PATH = NETAPP_STORAGE + '/mini-manifests'
+
 # Base URL root to serve in-app product images from.
 INAPP_IMAGE_URL = INAPP_IMAGE_PATH
 
@@ -283,6 +287,16 @@ MINIFY_MOZMARKET = True
 GEOIP_URL = ''
 GEOIP_DEFAULT_VAL = 'worldwide'
 GEOIP_DEFAULT_TIMEOUT = .2
+# A local IP range to country CSV (MaxMind's GeoIPCountryWhois.csv format),
+# looked up before the GeoIP server. Leave empty to only use the server.
+GEOIP_DB_PATH = ''
+# The number of /24 networks whose country is kept in memory.
+GEOIP_CACHE_SIZE = 10000
+
+# How long the results of search listings are cached, in seconds. The cache
+# is versioned by the indexing of apps, results cached before are refreshed
+# by the next request while the others are still served them. 0 disables it.
+SEARCH_CACHE_TIMEOUT = 60 * 5
 
 # A smaller range of languages for the Marketplace.
 AMO_LANGUAGES = ('de', 'en-US', 'es', 'pl', 'pt-BR')
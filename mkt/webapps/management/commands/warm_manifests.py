@@ -0,0 +1,46 @@
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from celery.task.sets import TaskSet
+
+from amo.utils import chunked
+from mkt.webapps.models import Webapp
+from mkt.webapps.tasks import warm_manifests
+
+
+HELP = """\
+Start tasks to build and store the mini manifests of packaged apps, with
+their ETag, so that they are served from the cache or the disk.
+
+To specify which webapps to warm:
+
+    `--webapps=1234,5678,...9012`
+
+If omitted, all packaged apps will be warmed.
+"""
+
+
+log = logging.getLogger('z.addons')
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--webapps',
+                    help='Webapp ids to process. Use commas to separate '
+                         'multiple ids.'),
+    )
+
+    help = HELP
+
+    def handle(self, *args, **kw):
+        qs = Webapp.objects.filter(is_packaged=True)
+        if kw['webapps']:
+            pks = [int(a.strip()) for a in kw['webapps'].split(',')]
+            qs = qs.filter(pk__in=pks)
+        ids = list(qs.values_list('id', flat=True))
+        log.info('Warming the mini manifests of %s apps.' % len(ids))
+        ts = [warm_manifests.subtask(args=[chunk])
+              for chunk in chunked(ids, 100)]
+        TaskSet(ts).apply_async()
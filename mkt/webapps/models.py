@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime
+import hashlib
 import json
 import os
 import time
@@ -15,6 +16,7 @@ from django.core.urlresolvers import NoReverseMatch
 from django.db import models
 from django.db.models import signals as dbsignals
 from django.dispatch import receiver
+from django.utils.encoding import smart_unicode
 from django.utils.http import urlquote
 
 import commonware.log
@@ -26,14 +28,13 @@ import amo
 import amo.models
 from access.acl import action_allowed, check_reviewer
 from addons import query
-from addons.models import (Addon, AddonDeviceType, attach_categories,
-                           attach_devices, attach_prices, attach_translations,
-                           Category,
+from addons.models import (Addon, AddonDeviceType, AddonUpsell, AddonUser,
+                           attach_categories, attach_devices, attach_prices,
+                           attach_translations, Category, Preview,
                            update_search_index as amo_update_search_index)
 from addons.signals import version_changed
 from amo.decorators import skip_cache
 from amo.helpers import absolutify
-from amo.search import TempS
 from amo.storage_utils import copy_stored_file
 from amo.urlresolvers import reverse
 from amo.utils import JSONEncoder, memoize, memoize_key, smart_path
@@ -41,14 +42,14 @@ from constants.applications import DEVICE_TYPES
 from files.models import File, nfd_str, Platform
 from files.utils import parse_addon, WebAppParser
 from lib.crypto import packaged
+from lib.es import outbox
 from market.models import AddonPremium
-from stats.models import ClientData
 from translations.fields import save_signal
 from versions.models import Version
 
 import mkt
 from mkt.constants import APP_FEATURES, APP_IMAGE_SIZES, apps, FEATURES_DICT
-from mkt.search.utils import S
+from mkt.search.utils import bump_search_generation, S, TempS
 from mkt.webapps.utils import get_locale_properties, get_supported_locales
 from mkt.zadmin.models import FeaturedApp
 
@@ -669,27 +670,80 @@ class Webapp(Addon):
     def in_rereview_queue(self):
         return self.rereviewqueue_set.exists()
 
-    def get_cached_manifest(self, force=False):
+    @property
+    def stored_manifest_path(self):
+        return os.path.join(settings.MINI_MANIFESTS_PATH,
+                            str(self.pk % 100), '%s.json' % self.pk)
+
+    @property
+    def stored_manifest_key(self):
+        return 'webapp:{0}:manifest'.format(self.pk)
+
+    def delete_stored_manifest(self):
+        cache.delete(self.stored_manifest_key)
+        if storage.exists(self.stored_manifest_path):
+            storage.delete(self.stored_manifest_path)
+
+    def get_stored_manifest(self, force=False):
         """
-        Creates the "mini" manifest for packaged apps and caches it.
+        Returns the "mini" manifest of packaged apps, as served to devices:
+        a dict of the serialized `content`, its `etag` and the timestamp it
+        was last `modified` at.
 
-        Call this with `force=True` whenever we need to update the cached
-        version of this manifest, e.g., when a new version of the packaged app
-        is approved.
+        The manifest is built once, when a version of the app is approved or
+        signed, and kept both in cache and on disk until the hash of its
+        package changes. Call this with
+        `force=True` to build it again, `modified` only changes along with
+        the ETag.
 
-        If the addon is not a packaged app, this will not cache anything.
+        If the addon is not a packaged app, this returns None.
 
         """
         if not self.is_packaged:
             return
 
-        key = 'webapp:{0}:manifest'.format(self.pk)
+        key = self.stored_manifest_key
+        path = self.stored_manifest_path
 
         if not force:
-            data = cache.get(key)
-            if data:
-                return data
+            entry = cache.get(key)
+            if entry:
+                return entry
+            entry = self._read_stored_manifest(path)
+            if entry:
+                cache.set(key, entry, 0)
+                return entry
+
+        content = self._build_manifest()
+        etag = hashlib.sha256(content)
+        package = self.get_latest_file()
+        if package:
+            # Changes to the package itself change the ETag too.
+            etag.update(package.hash)
+        entry = {'content': content, 'etag': etag.hexdigest(),
+                 'modified': int(time.time())}
+
+        old = self._read_stored_manifest(path)
+        if old and old['etag'] == entry['etag']:
+            entry['modified'] = old['modified']
+        else:
+            with storage.open(path, 'w') as fd:
+                json.dump(entry, fd)
+
+        cache.set(key, entry, 0)
+        return entry
 
+    def _read_stored_manifest(self, path):
+        if not storage.exists(path):
+            return
+        try:
+            with storage.open(path) as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            log.error(u'[Webapp:%s] Invalid stored manifest %s'
+                      % (self, path), exc_info=True)
+
+    def _build_manifest(self):
         version = self.current_version
         if not version:
             data = {}
@@ -711,11 +765,19 @@ class Webapp(Addon):
                 if key in manifest:
                     data[key] = manifest[key]
 
-        data = json.dumps(data, cls=JSONEncoder)
+        return json.dumps(data, cls=JSONEncoder)
 
-        cache.set(key, data, 0)
+    def get_cached_manifest(self, force=False):
+        """
+        Returns the "mini" manifest for packaged apps, see
+        `get_stored_manifest`.
 
-        return data
+        If the addon is not a packaged app, this returns None.
+
+        """
+        entry = self.get_stored_manifest(force=force)
+        if entry:
+            return entry['content']
 
     def sign_if_packaged(self, version_pk, reviewer=False):
         if not self.is_packaged:
@@ -1028,24 +1090,119 @@ class WebappIndexer(MappingType, Indexable):
         """Extracts the ElasticSearch index document for this instance."""
         if obj is None:
             obj = cls.get_model().uncached.get(pk=pk)
+        return cls.extract_documents([obj.id], objs=[obj])[0]
 
-        version = obj.current_version
-        try:
-            file_ = version and version.files.latest()
-        except ObjectDoesNotExist:
-            file_ = None
+    @classmethod
+    def extract_documents(cls, ids, objs=None):
+        """
+        Extracts the ElasticSearch index documents of the apps in `ids`.
+
+        What the documents need from other tables is fetched for all the apps
+        at once, so that the number of queries doesn't grow with the number
+        of apps. `objs` are the apps when they're already loaded, through
+        `Webapp.indexing_transformer`.
+        """
+        if objs is None:
+            objs = Webapp.indexing_transformer(
+                Webapp.uncached.filter(id__in=ids))
+        objs = list(objs)
+        if not objs:
+            return []
+        related = cls._get_related(objs)
+        return [cls._extract(obj, related) for obj in objs]
+
+    @classmethod
+    def _get_related(cls, objs):
+        """
+        Returns the related objects of `objs`, as dicts keyed by app id (or
+        version id for files and features).
+        """
+        ids = [obj.id for obj in objs]
+
+        def grouped(qs, key=lambda x: x[0], value=lambda x: x[1]):
+            groups = {}
+            for row in qs:
+                groups.setdefault(key(row), []).append(value(row))
+            return groups
+
+        # The current versions, which `current_version` would get one by one.
+        version_ids = [obj._current_version_id for obj in objs
+                       if obj._current_version_id]
+        versions = dict((v.id, v) for v in Version.objects.no_cache()
+                        .filter(id__in=version_ids))
+        features = dict((f.version_id, f) for f in AppFeatures.objects
+                        .no_cache().filter(version__in=versions.keys()))
+
+        installs = dict(Installed.objects.filter(addon__in=ids)
+                        .values_list('addon').annotate(models.Count('id')))
+        regions = grouped(
+            Installed.objects.filter(addon__in=ids,
+                                     client_data__region__isnull=False)
+            .values_list('addon', 'client_data__region')
+            .annotate(models.Count('id')),
+            value=lambda x: x[1:])
+
+        upsells = dict(AddonUpsell.objects.no_cache().filter(free__in=ids)
+                       .values_list('free', 'premium'))
+        premiums = dict((a.id, a) for a in Addon.uncached
+                        .filter(id__in=upsells.values())
+                        .exclude(status=amo.STATUS_DELETED))
+
+        return {
+            'authors': grouped(
+                AddonUser.objects.no_cache().filter(addon__in=ids)
+                .order_by('position')
+                .values_list('addon', 'user', 'role', 'listed',
+                             'user__display_name', 'user__username'),
+                value=lambda x: x[1:]),
+            'content_ratings': grouped(
+                ContentRating.objects.no_cache().filter(addon__in=ids),
+                key=attrgetter('addon_id'), value=lambda x: x),
+            'features': features,
+            'installs': installs,
+            'premiums': dict(
+                (p.addon_id, p.price) for p in AddonPremium.objects
+                .no_cache().filter(addon__in=ids).select_related('price')),
+            'previews': grouped(
+                Preview.uncached.filter(addon__in=ids),
+                key=attrgetter('addon_id'), value=lambda x: x),
+            'region_exclusions': grouped(
+                AddonExcludedRegion.objects.no_cache().filter(addon__in=ids)
+                .values_list('addon', 'region')),
+            'regions': regions,
+            'upsells': dict((free, premiums[premium])
+                            for free, premium in upsells.items()
+                            if premium in premiums),
+            'versions': versions,
+        }
 
-        features = (version.features.to_dict()
-                    if version else AppFeatures().to_dict())
+    @classmethod
+    def _extract(cls, obj, related):
+        """Builds the document of `obj` from the `_get_related` dicts."""
+        if obj._current_version_id in related['versions']:
+            version = related['versions'][obj._current_version_id]
+            # Saves the query of get_manifest_url() for packaged apps.
+            setattr(obj, Addon._meta.get_field('_current_version')
+                    .get_cache_name(), version)
+        else:
+            version = obj.current_version
+        file_ = None
+        if version and version.all_files:
+            file_ = max(version.all_files, key=attrgetter('created', 'id'))
+
+        if version and version.id in related['features']:
+            features = related['features'][version.id].to_dict()
+        else:
+            features = AppFeatures().to_dict()
 
         translations = obj.translations
-        installed_ids = list(Installed.objects.filter(addon=obj)
-                             .values_list('id', flat=True))
+        installed = related['installs'].get(obj.id, 0)
         content_ratings = dict(
             (cr.get_body().name, {
                 'name': cr.get_rating().name,
                 'description': unicode(cr.get_rating().description)})
-            for cr in obj.content_ratings.all())
+            for cr in related['content_ratings'].get(obj.id, []))
+        authors = related['authors'].get(obj.id, [])
 
         attrs = ('app_slug', 'average_daily_users', 'bayesian_rating',
                  'created', 'id', 'is_disabled', 'last_updated',
@@ -1055,7 +1212,9 @@ class WebappIndexer(MappingType, Indexable):
 
         d['app_type'] = (amo.ADDON_WEBAPP_PACKAGED if obj.is_packaged else
                          amo.ADDON_WEBAPP_HOSTED)
-        d['authors'] = [a.name for a in obj.listed_authors]
+        d['authors'] = [smart_unicode(display_name or username)
+                        for user, role, listed, display_name, username
+                        in authors if listed]
         d['category'] = getattr(obj, 'category_ids', [])
         d['content_ratings'] = content_ratings if content_ratings else None
         if version:
@@ -1085,19 +1244,19 @@ class WebappIndexer(MappingType, Indexable):
         d['name'] = list(set(string for _, string
                              in translations[obj.name_id]))
         d['name_sort'] = unicode(obj.name).lower()
-        d['owners'] = [au.user.id for au in
-                       obj.addonuser_set.filter(role=amo.AUTHOR_ROLE_OWNER)]
-        d['popularity'] = d['_boost'] = len(installed_ids)
+        d['owners'] = [user for user, role, listed, display_name, username
+                       in authors if role == amo.AUTHOR_ROLE_OWNER]
+        d['popularity'] = d['_boost'] = installed
         d['previews'] = [{'filetype': p.filetype,
                           'caption': unicode(p.caption),
                           'image_url': p.image_url,
                           'thumbnail_url': p.thumbnail_url}
-                         for p in obj.previews.all()]
-        try:
-            p = obj.addonpremium.price
+                         for p in related['previews'].get(obj.id, [])]
+        p = related['premiums'].get(obj.id)
+        if p:
             d['price_tier'] = p.name
             d['carrier_billing_only'] = p.carrier_billing_only()
-        except AddonPremium.DoesNotExist:
+        else:
             d['price_tier'] = None
             d['carrier_billing_only'] = False
 
@@ -1105,8 +1264,7 @@ class WebappIndexer(MappingType, Indexable):
             'average': obj.average_rating,
             'count': obj.total_reviews,
         }
-        d['region_exclusions'] = list(
-            obj.addonexcludedregion.values_list('region', flat=True))
+        d['region_exclusions'] = related['region_exclusions'].get(obj.id, [])
         # TODO: Remove when bug 862603 lands.
         d['summary'] = list(set(s for _, s in translations[obj.summary_id]))
         d['support_email'] = (unicode(obj.support_email)
@@ -1119,8 +1277,8 @@ class WebappIndexer(MappingType, Indexable):
         else:
             d['supported_locales'] = []
 
-        if obj.upsell:
-            upsell_obj = obj.upsell.premium
+        upsell_obj = related['upsells'].get(obj.id)
+        if upsell_obj:
             d['upsell'] = {
                 'id': upsell_obj.id,
                 'app_slug': upsell_obj.app_slug,
@@ -1131,16 +1289,14 @@ class WebappIndexer(MappingType, Indexable):
 
         # Calculate regional popularity for "mature regions"
         # (installs + reviews/installs from that region).
-        installs = dict(ClientData.objects.filter(installed__in=installed_ids)
-                        .annotate(region_counts=models.Count('region'))
-                        .values_list('region', 'region_counts').distinct())
+        installs = dict(related['regions'].get(obj.id, []))
         for region in mkt.regions.ALL_REGION_IDS:
             cnt = installs.get(region, 0)
             if cnt:
                 # Magic number (like all other scores up in this piece).
                 d['popularity_%s' % region] = d['popularity'] + cnt * 10
             else:
-                d['popularity_%s' % region] = len(installed_ids)
+                d['popularity_%s' % region] = installed
             d['_boost'] += cnt * 10
 
         # Bump the boost if the add-on is public.
@@ -1180,14 +1336,20 @@ Webapp._meta.translated_fields = Addon._meta.translated_fields
           dispatch_uid='webapp.search.index')
 def update_search_index(sender, instance, **kw):
     if waffle.switch_is_active('search-api-es'):
-        from . import tasks
         if not kw.get('raw'):
-            tasks.index_webapps.delay([instance.id])
+            outbox.enqueue(WebappIndexer.get_mapping_type_name(), instance.id)
 
     # Also continue to index to old index if we enable/disable the switch.
     amo_update_search_index(sender, instance, **kw)
 
 
+# The search results cached before the documents changed are stale once
+# they're indexed.
+outbox.register(WebappIndexer.get_mapping_type_name(),
+                WebappIndexer.extract_documents, WebappIndexer.get_index,
+                done=bump_search_generation)
+
+
 models.signals.pre_save.connect(save_signal, sender=Webapp,
                                 dispatch_uid='webapp_translations')
 
@@ -1199,6 +1361,21 @@ def update_cached_manifests(sender, **kw):
         update_cached_manifests.delay(sender.id)
 
 
+@File.on_change
+def update_manifest_hash(old_attr={}, new_attr={}, instance=None, sender=None,
+                         **kw):
+    """The ETag of the mini manifest covers the package, drop it."""
+    if not old_attr.get('id') or old_attr.get('hash') == new_attr.get('hash'):
+        return
+    try:
+        webapp = Webapp.objects.get(pk=instance.version.addon_id,
+                                    is_packaged=True)
+    except ObjectDoesNotExist:
+        return
+    # It's built again, with the new hash, when it's next asked for.
+    webapp.delete_stored_manifest()
+
+
 @Webapp.on_change
 def watch_status(old_attr={}, new_attr={}, instance=None, sender=None, **kw):
     """Set nomination date when app is pending review."""
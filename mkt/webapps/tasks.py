@@ -27,6 +27,7 @@ from users.utils import get_task_user
 
 from mkt.constants.regions import WORLDWIDE
 from mkt.developers.tasks import _fetch_manifest, run_validator, validator
+from mkt.search.utils import bump_search_generation
 from mkt.webapps.models import Webapp, WebappIndexer
 from mkt.webapps.utils import get_locale_properties
 
@@ -225,6 +226,18 @@ def update_cached_manifests(id, **kw):
     _log(webapp, u'Updated cached mini manifest')
 
 
+@task
+def warm_manifests(ids, **kw):
+    """Builds and stores the mini manifests of the given packaged apps."""
+    task_log.info('[%s@%s] Warming mini manifests.'
+                  % (len(ids), warm_manifests.rate_limit))
+    for webapp in Webapp.objects.filter(pk__in=ids, is_packaged=True):
+        try:
+            webapp.get_stored_manifest(force=True)
+        except Exception:
+            _log(webapp, u'Failed to store mini manifest', exc_info=True)
+
+
 @task
 @write
 def add_uuids(ids, **kw):
@@ -262,11 +275,11 @@ def index_webapps(ids, **kw):
     indices = get_indices(index)
 
     es = WebappIndexer.get_es(urls=settings.ES_URLS)
-    qs = Webapp.indexing_transformer(Webapp.uncached.filter(id__in=ids))
-    for obj in qs:
-        doc = WebappIndexer.extract_document(obj.id, obj)
+    for doc in WebappIndexer.extract_documents(ids):
         for idx in indices:
-            WebappIndexer.index(doc, id_=obj.id, es=es, index=idx)
+            WebappIndexer.index(doc, id_=doc['id'], es=es, index=idx)
+    # The search results cached before the documents changed are stale now.
+    bump_search_generation()
 
 
 @task(acks_late=True)
@@ -288,6 +301,7 @@ def unindex_webapps(ids, **kw):
                 # Ignore if it's not there.
                 task_log.info(
                     u'[Webapp:%s] Unindexing app but not found in index' % id_)
+    bump_search_generation()
 
 
 @task
@@ -10,7 +10,9 @@ from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.core import mail
+from django.core.cache import cache
 from django.core.files.storage import default_storage as storage
+from django.db import connection, reset_queries
 from django.db.models.signals import post_delete, post_save
 from django.utils.translation import ugettext_lazy as _
 
@@ -32,6 +34,7 @@ from files.models import File
 from files.utils import WebAppParser
 from lib.crypto import packaged
 from lib.crypto.tests import mock_sign
+from stats.models import ClientData
 from users.models import UserProfile
 from versions.models import update_status, Version
 
@@ -716,6 +719,50 @@ class TestPackagedManifest(BasePackagedAppTest):
         eq_(data['icons'], manifest['icons'])
         eq_(data['locales'], manifest['locales'])
 
+    def post_packaged(self):
+        webapp = self.post_addon(
+            data={'packaged': True, 'free_platforms': 'free-firefoxos'})
+        self.file = webapp.current_version.all_files[0]
+        self.setup_files()
+        return webapp
+
+    def test_stored_manifest(self):
+        webapp = self.post_packaged()
+        entry = webapp.get_stored_manifest()
+        eq_(entry['content'], webapp.get_cached_manifest())
+        assert storage.exists(webapp.stored_manifest_path)
+
+        # Read from the disk when it's not in cache.
+        cache.clear()
+        with self.assertNumQueries(0):
+            eq_(webapp.get_stored_manifest(), entry)
+
+    def test_stored_manifest_modified(self):
+        webapp = self.post_packaged()
+        with mock.patch('mkt.webapps.models.time') as time_:
+            time_.time.return_value = 1370000000
+            etag = webapp.get_stored_manifest(force=True)['etag']
+
+            # Unchanged, it keeps its ETag and date.
+            time_.time.return_value += 60
+            entry = webapp.get_stored_manifest(force=True)
+            eq_(entry['etag'], etag)
+            eq_(entry['modified'], 1370000000)
+
+            self.file.update(hash='sha256:changed')
+            webapp = Webapp.objects.get(pk=webapp.pk)
+            entry = webapp.get_stored_manifest(force=True)
+            assert entry['etag'] != etag
+            eq_(entry['modified'], 1370000060)
+
+    def test_stored_manifest_hash_changed(self):
+        webapp = self.post_packaged()
+        etag = webapp.get_stored_manifest()['etag']
+        self.file.update(hash='sha256:changed')
+        assert not storage.exists(webapp.stored_manifest_path)
+        webapp = Webapp.objects.get(pk=webapp.pk)
+        assert webapp.get_stored_manifest()['etag'] != etag
+
     @mock.patch.object(packaged, 'sign', mock_sign)
     def test_package_path(self):
         webapp = self.post_addon(
@@ -1439,3 +1486,39 @@ class TestWebappIndexer(amo.tests.TestCase):
         self.app.current_version.update(supported_locales=locales)
         obj, doc = self._get_doc()
         self.assertSetEqual(doc['supported_locales'], set(locales.split(',')))
+
+    def test_extract_popularity(self):
+        user = UserProfile.objects.create(username='installer')
+        br = ClientData.objects.create(region=mkt.regions.BR.id)
+        Installed.objects.create(addon=self.app, user=user, client_data=br)
+        Installed.objects.create(addon=self.app, user=user)
+        obj, doc = self._get_doc()
+        eq_(doc['popularity'], 2)
+        eq_(doc['popularity_%s' % mkt.regions.BR.id], 12)
+        eq_(doc['popularity_%s' % mkt.regions.US.id], 2)
+
+    def test_extract_documents(self):
+        other = app_factory()
+        AddonExcludedRegion.objects.create(addon=other,
+                                           region=mkt.regions.BR.id)
+        docs = WebappIndexer.extract_documents([self.app.id, other.id])
+        docs = dict((d['id'], d) for d in docs)
+        eq_(docs[self.app.id], self._get_doc()[1])
+        eq_(docs[other.id]['region_exclusions'], [mkt.regions.BR.id])
+        eq_(docs[self.app.id]['region_exclusions'], [])
+        eq_(docs[other.id]['current_version']['version'],
+            other.current_version.version)
+
+    def count_queries(self, ids):
+        with self.settings(DEBUG=True):
+            reset_queries()
+            WebappIndexer.extract_documents(ids)
+            return len(connection.queries)
+
+    def test_extract_documents_queries(self):
+        one = self.count_queries([self.app.id])
+        apps = [app_factory() for i in range(3)]
+        for app in apps:
+            Installed.objects.create(addon=app, user=UserProfile.objects
+                                     .create(username='u%s' % app.id))
+        eq_(self.count_queries([self.app.id] + [a.id for a in apps]), one)
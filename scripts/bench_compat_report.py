@@ -0,0 +1,81 @@
+"""
+Measures building the docs of the compat report on a synthetic dataset,
+without touching the database or elasticsearch: reports are bucketed by
+scanning amo.COMPAT and by bisection, then the docs are built.
+
+    python scripts/bench_compat_report.py [add-ons] [reports per add-on]
+"""
+import os
+import random
+import site
+import sys
+from collections import defaultdict
+from datetime import datetime
+from time import time
+
+root = os.path.join(os.path.dirname(__file__), '..')
+for path in ['.', 'lib', 'vendor/lib/python', 'apps']:
+    site.addsitedir(os.path.abspath(os.path.join(root, path)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings_local')
+
+import amo  # NOQA
+from compat.cron import build_docs, compat_buckets  # NOQA
+from versions.compare import version_int as vint  # NOQA
+
+
+def timed(name, fn, *args):
+    start = time()
+    result = fn(*args)
+    print '%-10s %8.2fs' % (name, time() - start)
+    return result
+
+
+def scan(app, rows):
+    versions = [c for c in amo.COMPAT if c['app'] == app.id]
+    counts = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for guid, ver, works_properly, cnt in rows:
+        major = [v['main'] for v in versions
+                 if vint(v['previous']) < ver <= vint(v['main'])]
+        if major:
+            counts[guid][vint(major[0])][0 if works_properly else 1] += cnt
+    return counts
+
+
+def bisection(app, rows):
+    bucket = compat_buckets(app)
+    counts = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for guid, ver, works_properly, cnt in rows:
+        main = bucket(ver)
+        if main is not None:
+            counts[guid][main][0 if works_properly else 1] += cnt
+    return counts
+
+
+def main(addons=50000, per_addon=5):
+    random.seed(0)
+    mains = sorted(set(vint(c['main']) for c in amo.COMPAT))
+    data, updates, reports = {}, {}, {}
+    for pk in xrange(1, addons + 1):
+        data[pk] = dict(
+            id=pk, slug='addon-%s' % pk, guid='guid-%s' % pk,
+            self_hosted=False, binary=False, name=u'Add-on %s' % pk,
+            created=datetime.now(), current_version='1.0',
+            current_version_id=pk,
+            support=dict((app.id, (mains[0], random.choice(mains), '99.0'))
+                         for app in amo.APP_USAGE))
+    for app in amo.APP_USAGE:
+        updates[app] = dict((pk, random.randint(1, 100000)) for pk in data)
+        rows = [('guid-%s' % pk, random.choice(mains) - 1,
+                 random.random() > .5, random.randint(1, 10))
+                for pk in data for _ in xrange(per_addon)]
+        print '%s, %s reports' % (app.pretty, len(rows))
+        timed('scan', scan, app, rows)
+        reports[app] = timed('bisection', bisection, app, rows)
+
+    docs = timed('docs', build_docs, updates, data, reports)
+    print '%s docs' % len(docs)
+
+
+if __name__ == '__main__':
+    args = map(int, sys.argv[1:3])
+    main(*args)
@@ -0,0 +1,51 @@
+"""
+Measures lookups per second of the local GeoIP backend in lib/geoip.
+
+    python scripts/bench_geoip.py GeoIPCountryWhois.csv [lookups]
+
+Addresses are drawn from a pool of 50000 random /24 networks, so that the
+LRU sees the kind of repeats real traffic has.
+"""
+import os
+import random
+import site
+import sys
+from time import time
+
+root = os.path.join(os.path.dirname(__file__), '..')
+for path in ['.', 'lib', 'vendor/lib/python', 'apps']:
+    site.addsitedir(os.path.abspath(os.path.join(root, path)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings_local')
+
+from lib.geoip import LocalBackend, LocalDB, ip_to_int  # NOQA
+
+
+def bench(name, func, addresses):
+    start = time()
+    for address in addresses:
+        func(address)
+    took = time() - start
+    print '%-14s %9d lookups/s' % (name, len(addresses) / took)
+
+
+def main(path, lookups=200000):
+    start = time()
+    db = LocalDB.from_csv(path)
+    print 'Loaded %s ranges in %.2fs' % (len(db), time() - start)
+
+    networks = ['%s.%s.%s' % (random.randint(1, 223), random.randint(0, 255),
+                              random.randint(0, 255)) for i in range(50000)]
+    addresses = ['%s.%s' % (random.choice(networks), random.randint(0, 255))
+                 for i in range(lookups)]
+
+    bench('bisect', lambda a: db.find(ip_to_int(a)), addresses)
+    backend = LocalBackend(db)
+    bench('lru (cold)', backend.lookup, addresses)
+    bench('lru (warm)', backend.lookup, addresses)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
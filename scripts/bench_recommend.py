@@ -0,0 +1,87 @@
+"""
+Measures the MinHash index of lib/recommend against the exact similarities
+on a synthetic dataset of add-ons in collections: build and save time, size
+of the file, time per query and recall of the top add-ons.
+
+    python scripts/bench_recommend.py [add-ons] [collections] [bands]
+
+Popular add-ons are in many more collections than the others, like on AMO.
+"""
+import bisect
+import os
+import random
+import sys
+import tempfile
+from time import time
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.abspath(os.path.join(root, 'lib')))
+
+import recommend  # NOQA
+
+TOP = 11
+QUERIES = 500
+
+
+def timed(name, fn, *args):
+    start = time()
+    result = fn(*args)
+    print '%-10s %8.2fs' % (name, time() - start)
+    return result
+
+
+def dataset(addons, collections):
+    random.seed(0)
+    # Zipf-like popularity, each collection has 5 to 30 add-ons.
+    weights = [1. / (rank + 1) for rank in xrange(addons)]
+    total = sum(weights)
+    cumulative, acc = [], 0
+    for w in weights:
+        acc += w / total
+        cumulative.append(acc)
+    sets = {}
+    for collection in xrange(1, collections + 1):
+        for _ in xrange(random.randint(5, 30)):
+            addon = min(bisect.bisect_right(cumulative, random.random()),
+                        addons - 1)
+            sets.setdefault(addon, set()).add(collection)
+    return dict((addon, sorted(xs)) for addon, xs in sets.items())
+
+
+def main(addons=20000, collections=100000, bands=32):
+    sets = timed('dataset', dataset, addons, collections)
+    print '%s add-ons, %s memberships' % (
+        len(sets), sum(len(xs) for xs in sets.values()))
+
+    exact = timed('exact', recommend.Similarities, sets)
+    build = lambda: recommend.MinHashIndex.build(sets, bands=bands)
+    index = timed('minhash', build)
+    path = tempfile.mktemp()
+    try:
+        timed('save', index.save, path)
+        print '%-10s %8.2fM' % ('size', os.path.getsize(path) / 1024. ** 2)
+        index = recommend.MinHashIndex.load(path)
+
+        queries = random.sample(sorted(sets), min(QUERIES, len(sets)))
+        start = time()
+        expected = [exact.top(addon, TOP) for addon in queries]
+        took = (time() - start) * 1000 / len(queries)
+        print '%-10s %8.2fms' % ('exact', took)
+        start = time()
+        found = [index.top(addon, TOP) for addon in queries]
+        took = (time() - start) * 1000 / len(queries)
+        print '%-10s %8.2fms' % ('query', took)
+
+        hits = total = 0
+        for exp, got in zip(expected, found):
+            exp = set(addon for addon, score in exp)
+            hits += len(exp & set(addon for addon, score in got))
+            total += len(exp)
+        print '%-10s %8.2f' % ('recall', hits / float(total))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    args = map(int, sys.argv[1:4])
+    main(*args)
@@ -0,0 +1,57 @@
+"""
+Replays recorded update pings against services/update.py, once resolved with
+SQL and once through the in-process update cache.
+
+    python scripts/bench_update.py queries.txt [repeat]
+
+`queries.txt` has one query string per line, as found in the access logs for
+/update/VersionCheck.php (the leading `?` is optional).
+"""
+import os
+import site
+import sys
+from time import time
+from urlparse import parse_qsl
+
+# Same paths as services/wsgi/versioncheck.py.
+root = os.path.join(os.path.dirname(__file__), '..')
+for path in ['services', '.', '..', 'lib', 'vendor/lib/python', 'apps']:
+    site.addsitedir(os.path.abspath(os.path.join(root, path)))
+
+import update  # NOQA
+
+
+def replay(queries, timeout):
+    update.update_cache.clear()
+    update.update_cache.timeout = timeout
+    results = []
+    start = time()
+    for query in queries:
+        data = dict(parse_qsl(query))
+        up = update.Update(data, data.pop('compatMode', 'strict'))
+        results.append(up.get_rdf())
+    return time() - start, results
+
+
+def main(filename, repeat=1):
+    with open(filename) as fp:
+        queries = [l.strip().lstrip('?') for l in fp if l.strip()]
+    queries = queries * repeat
+
+    sql, sql_results = replay(queries, 0)
+    cached, cached_results = replay(queries, 300)
+
+    # The RDF carries no timestamps so both paths have to agree.
+    mismatches = sum(1 for a, b in zip(sql_results, cached_results) if a != b)
+
+    for name, took in (('sql', sql), ('cache', cached)):
+        print '%-6s %6d pings in %7.2fs, %8.1f pings/s' % (
+            name, len(queries), took, len(queries) / took)
+    print 'speedup: %.1fx, mismatches: %s' % (sql / cached, mismatches)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1)
@@ -0,0 +1,63 @@
+"""
+Times receipt verification in services/verify.py cold (no cached verdicts)
+and warm (every receipt verified once before).
+
+    python scripts/bench_verify.py receipts.txt [repeat]
+
+`receipts.txt` has one `<verify path> <receipt>` pair per line, for example
+`/verify/337141 eyJhbGciOiAiUlM1MTIi...`.
+"""
+import os
+import site
+import sys
+from time import time
+
+# Same paths as services/wsgi/receiptverify.py.
+root = os.path.join(os.path.dirname(__file__), '..')
+for path in ['services', '.', '..', 'lib', 'vendor/lib/python', 'apps']:
+    site.addsitedir(os.path.abspath(os.path.join(root, path)))
+
+import verify  # NOQA
+from django.core.cache import cache  # NOQA
+
+
+def run(receipts):
+    took = []
+    for path, receipt in receipts:
+        start = time()
+        verify.Verify(receipt, {'PATH_INFO': path}).check_full()
+        took.append(time() - start)
+    return took
+
+
+def report(name, took):
+    took = sorted(took)
+    print '%-5s %6d receipts, mean %7.2fms, p50 %7.2fms, p99 %7.2fms' % (
+        name, len(took), sum(took) * 1000 / len(took),
+        took[len(took) / 2] * 1000, took[int(len(took) * .99)] * 1000)
+
+
+def main(filename, repeat=1):
+    with open(filename) as fp:
+        receipts = [l.split(None, 1) for l in fp if l.strip()]
+    receipts = [(path, receipt.strip()) for path, receipt in receipts]
+
+    keys = [verify.Verify(receipt, {'PATH_INFO': path}).verdict_key()
+            for path, receipt in receipts]
+    cold = []
+    for i in range(repeat):
+        cache.delete_many(keys)
+        cold.extend(run(receipts))
+    warm = []
+    for i in range(repeat):
+        warm.extend(run(receipts))
+
+    report('cold', cold)
+    report('warm', warm)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1)
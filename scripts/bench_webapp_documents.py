@@ -0,0 +1,62 @@
+"""
+Measures the extraction of the search documents of apps, one app at a time
+and in chunks with WebappIndexer.extract_documents.
+
+    python scripts/bench_webapp_documents.py [apps] [chunk size]
+
+Queries are counted with DEBUG on, so run it against a copy of the database
+with settings_local.
+"""
+import os
+import site
+import sys
+from time import time
+
+root = os.path.join(os.path.dirname(__file__), '..')
+for path in ['.', 'lib', 'vendor/lib/python', 'apps']:
+    site.addsitedir(os.path.abspath(os.path.join(root, path)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings_local')
+
+from django.conf import settings  # NOQA
+from django.db import connection, reset_queries  # NOQA
+
+from amo.utils import chunked  # NOQA
+from mkt.webapps.models import WebappIndexer  # NOQA
+
+
+def bench(name, extract, ids):
+    reset_queries()
+    start = time()
+    docs = extract(ids)
+    took = time() - start
+    print '%-10s %6d docs %7d queries %8.1f docs/s %6.1f queries/doc' % (
+        name, len(docs), len(connection.queries), len(docs) / took,
+        len(connection.queries) / float(len(docs) or 1))
+
+
+def one_by_one(ids):
+    docs = []
+    for id_ in ids:
+        docs.extend(WebappIndexer.extract_documents([id_]))
+    return docs
+
+
+def by_chunk(size):
+    def extract(ids):
+        docs = []
+        for chunk in chunked(ids, size):
+            docs.extend(WebappIndexer.extract_documents(chunk))
+        return docs
+    return extract
+
+
+def main(apps=1000, size=100):
+    settings.DEBUG = True
+    ids = list(WebappIndexer.get_indexable()[:apps])
+    bench('one by one', one_by_one, ids)
+    bench('chunked', by_chunk(size), ids)
+
+
+if __name__ == '__main__':
+    args = map(int, sys.argv[1:3])
+    main(*args)
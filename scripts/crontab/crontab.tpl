@@ -5,15 +5,18 @@ HOME=/tmp
 # Every minute!
 * * * * * %(z_cron)s fast_current_version
 * * * * * %(z_cron)s migrate_collection_users
+* * * * * %(z_cron)s index_outbox
 
 # Every 30 minutes.
 */30 * * * * %(z_cron)s tag_jetpacks
 */30 * * * * %(z_cron)s update_addons_current_version
 */30 * * * * %(z_cron)s cleanup_watermarked_file
+*/30 * * * * %(z_cron)s reconcile_editor_queue
 
 #once per hour
 5 * * * * %(z_cron)s update_collections_subscribers
 10 * * * * %(z_cron)s update_blog_posts
+15 * * * * %(z_cron)s update_recs_index
 20 * * * * %(z_cron)s addon_last_updated
 25 * * * * %(z_cron)s update_collections_votes
 45 * * * * %(z_cron)s update_addon_appsupport
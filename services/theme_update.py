@@ -9,7 +9,7 @@ from wsgiref.handlers import format_date_time
 from django.core.management import setup_environ
 
 from constants import base
-from utils import log_configure, log_exception, mypool
+from utils import cache_ns, log_configure, log_exception, mypool
 
 from services.utils import settings
 setup_environ(settings)
@@ -19,6 +19,12 @@ log_configure()
 
 # This has to be imported after the settings (utils).
 from django_statsd.clients import statsd
+from django.core.cache import cache
+
+
+# {(icon path, modified): base64 icon}, shared by every request.
+_icons = {}
+ICONS_MAX = 5000
 
 
 class ThemeUpdate(object):
@@ -27,7 +33,9 @@ class ThemeUpdate(object):
         self.conn, self.cursor = None, None
         self.from_gp = qs == 'src=gp'
         self.data = {
-            'locale': locale,
+            # Only known locales, it's part of the cache key.
+            'locale': settings.LANGUAGE_URL_MAP.get(
+                (locale or '').lower(), 'en-US'),
             'id': id_,
             # If we came from getpersonas.com, then look up by `persona_id`.
             # Otherwise, look up `addon_id`.
@@ -41,15 +49,23 @@ class ThemeUpdate(object):
 
     def base64_icon(self, addon_id):
         path = self.image_path('icon.jpg')
+        # A new icon always comes with a new `modified`.
+        key = (path, self.data['row']['modified'])
+        if key in _icons:
+            return _icons[key]
         try:
             with open(path, 'r') as f:
-                return base64.b64encode(f.read())
+                icon = base64.b64encode(f.read())
         except IOError, e:
             if len(e.args) == 1:
                 log_exception('I/O error: {0}'.format(e[0]))
             else:
                 log_exception('I/O error({0}): {1}'.format(e[0], e[1]))
-            return ''
+            icon = ''
+        if len(_icons) >= ICONS_MAX:
+            _icons.clear()
+        _icons[key] = icon
+        return icon
 
     def get_headers(self, length):
         return [('Cache-Control', 'public, max-age=3600'),
@@ -80,13 +96,19 @@ class ThemeUpdate(object):
             t_desc.localized_string AS description,
             p.display_username, p.header,
             p.footer, p.accentcolor, p.textcolor,
-            UNIX_TIMESTAMP(a.modified) AS modified
+            UNIX_TIMESTAMP(a.modified) AS modified,
+            t_name_en.localized_string AS name_en,
+            t_desc_en.localized_string AS description_en
         FROM addons AS a
         LEFT JOIN personas AS p ON p.addon_id=a.id
         LEFT JOIN translations AS t_name
             ON t_name.id=a.name AND t_name.locale=%(locale)s
         LEFT JOIN translations AS t_desc
             ON t_desc.id=a.summary AND t_desc.locale=%(locale)s
+        LEFT JOIN translations AS t_name_en
+            ON t_name_en.id=a.name AND t_name_en.locale='en-US'
+        LEFT JOIN translations AS t_desc_en
+            ON t_desc_en.id=a.summary AND t_desc_en.locale='en-US'
         WHERE p.{primary_key}=%(id)s AND
             a.addontype_id=%(atype)s AND a.status=4 AND a.inactive=0
         """.format(primary_key=self.data['primary_key'])
@@ -94,30 +116,50 @@ class ThemeUpdate(object):
         self.cursor.execute(sql, self.data)
         row = self.cursor.fetchone()
 
-        row_to_dict = lambda row: dict(zip((
-            'persona_id', 'addon_id', 'slug', 'name', 'description',
-            'username', 'header', 'footer', 'accentcolor', 'textcolor',
-            'modified'),
-            list(row)))
-
         if row:
-            self.data['row'] = row_to_dict(row)
+            row = dict(zip((
+                'persona_id', 'addon_id', 'slug', 'name', 'description',
+                'username', 'header', 'footer', 'accentcolor', 'textcolor',
+                'modified', 'name_en', 'description_en'),
+                list(row)))
 
             # Fall back to `en-US` if the name was null for our locale.
-            # TODO: Write smarter SQL and don't rerun the whole query.
-            if not self.data['row']['name']:
+            if not row['name']:
                 self.data['locale'] = 'en-US'
-                self.cursor.execute(sql, self.data)
-                row = self.cursor.fetchone()
-                if row:
-                    self.data['row'] = row_to_dict(row)
+                row['name'] = row['name_en']
+                row['description'] = row['description_en']
 
+            self.data['row'] = row
             return True
 
         return False
 
-    # TODO: Cache on row['modified']
+    def cache_key(self):
+        """
+        The key of the rendered JSON. The namespace is bumped by zamboni
+        when the theme or its add-on is saved, which is also when its
+        `modified` moves (see `Persona.invalidate_theme_update`).
+        """
+        namespace = 'theme-update:%s:%s' % (self.data['primary_key'],
+                                            self.data['id'])
+        return 'theme-update:%s:%s:%s:%s' % (
+            self.data['primary_key'], self.data['id'], self.data['locale'],
+            cache_ns(namespace))
+
     def get_json(self):
+        key = self.cache_key()
+        output = cache.get(key)
+        if output is not None:
+            statsd.incr('services.theme_update.cache.hit')
+            return output or None
+
+        statsd.incr('services.theme_update.cache.miss')
+        output = self.render_json()
+        # Not found is cached too, as an empty string.
+        cache.set(key, output or '', settings.THEME_UPDATE_CACHE_TIMEOUT)
+        return output
+
+    def render_json(self):
         if not self.get_update():
             # Persona not found.
             return
@@ -1,3 +1,4 @@
+from bisect import bisect_right
 from email.Utils import formatdate
 from email.mime.text import MIMEText
 import smtplib
@@ -17,13 +18,14 @@ import settings_local as settings
 setup_environ(settings)
 # This has to be imported after the settings so statsd knows where to log to.
 from django_statsd.clients import statsd
+from django.core.cache import cache
 
 try:
     from compare import version_int
 except ImportError:
     from apps.versions.compare import version_int
 
-from constants import applications, base
+from constants import applications, base, platforms
 from utils import (get_mirror, log_configure, APP_GUIDS, PLATFORMS,
                    STATUSES_PUBLIC)
 
@@ -88,6 +90,188 @@ def getconn():
 mypool = pool.QueuePool(getconn, max_overflow=10, pool_size=5, recycle=300)
 
 
+# The columns that make up an update row, in the order they are selected.
+ROW_FIELDS = ['guid', 'type', 'disabled_by_user', 'appguid', 'min', 'max',
+              'file_id', 'file_status', 'hash', 'filename', 'version_id',
+              'datestatuschanged', 'strict_compat', 'releasenotes',
+              'version', 'premium_type']
+
+
+def _gte(a, b):
+    # Comparisons against NULL are never true in SQL, keep it that way.
+    return a is not None and b is not None and a >= b
+
+
+class UpdateCandidates(object):
+    """
+    Every file an add-on could offer as an update for one application,
+    sorted by the minimum application version_int so that a bisect drops
+    anything that needs a newer application.
+    """
+
+    def __init__(self, rows, incompatible, generation, expires):
+        rows.sort(key=lambda r: r['min_int'])
+        self.mins = [r['min_int'] for r in rows]
+        self.rows = rows
+        self.incompatible = incompatible
+        self.generation = generation
+        self.expires = expires
+
+    def blocked(self, app_id, vint):
+        """Version ids excluded by compat overrides, mirroring the SQL."""
+        blocked = set()
+        for (version_id, app, min_v, max_v,
+             min_int, max_int) in self.incompatible:
+            if ((app == app_id and min_v == '0' and _gte(max_int, vint)) or
+                (_gte(vint, min_int) and max_v == '*') or
+                (_gte(vint, min_int) and _gte(max_int, vint))):
+                blocked.add(version_id)
+        return blocked
+
+
+class UpdateCache(object):
+    """
+    In-process cache of update candidates keyed on (addon, app).
+
+    zamboni bumps the `ns:update:<addon_id>` namespace (see
+    `Addon.invalidate_update_cache`) whenever files, versions or compat
+    overrides change, entries with a stale generation are reloaded. Entries
+    also expire after `SERVICES_UPDATE_CACHE_TIMEOUT` seconds, a timeout of
+    0 disables the cache and every ping goes to the database.
+    """
+    max_entries = 100000
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.entries = {}
+
+    @property
+    def enabled(self):
+        return self.timeout > 0
+
+    def clear(self):
+        self.entries.clear()
+
+    def generation(self, addon_id):
+        return cache.get('ns:update:%s' % addon_id)
+
+    def get(self, cursor, addon_id, app_id):
+        generation = self.generation(addon_id)
+        candidates = self.entries.get((addon_id, app_id))
+        if (candidates is not None and
+            candidates.generation == generation and
+            candidates.expires > time()):
+            statsd.incr('services.update.cache.hit')
+            return candidates
+
+        statsd.incr('services.update.cache.miss')
+        candidates = self.load(cursor, addon_id, app_id, generation)
+        if len(self.entries) >= self.max_entries:
+            self.entries.clear()
+        self.entries[(addon_id, app_id)] = candidates
+        return candidates
+
+    def load(self, cursor, addon_id, app_id, generation):
+        sql = """
+            SELECT
+                addons.guid, addons.addontype_id, addons.inactive,
+                applications.guid, appmin.version, appmax.version, files.id,
+                files.status, files.hash, files.filename, versions.id,
+                files.datestatuschanged, files.strict_compatibility,
+                versions.releasenotes, versions.version, addons.premium_type,
+                files.platform_id, files.binary_components,
+                appmin.version_int, appmax.version_int
+            FROM versions
+            INNER JOIN addons
+                ON addons.id = versions.addon_id AND addons.id = %(id)s
+            INNER JOIN applications_versions
+                ON applications_versions.version_id = versions.id
+            INNER JOIN applications
+                ON applications_versions.application_id = applications.id
+                AND applications.id = %(app_id)s
+            INNER JOIN appversions appmin
+                ON appmin.id = applications_versions.min
+            INNER JOIN appversions appmax
+                ON appmax.id = applications_versions.max
+            INNER JOIN files
+                ON files.version_id = versions.id;"""
+        params = {'id': addon_id, 'app_id': app_id}
+        cursor.execute(sql, params)
+        fields = ROW_FIELDS + ['platform_id', 'binary_components',
+                               'min_int', 'max_int']
+        rows = [dict(zip(fields, r)) for r in cursor.fetchall()]
+
+        sql = """
+            SELECT incompatible_versions.version_id,
+                incompatible_versions.app_id,
+                incompatible_versions.min_app_version,
+                incompatible_versions.max_app_version,
+                incompatible_versions.min_app_version_int,
+                incompatible_versions.max_app_version_int
+            FROM incompatible_versions
+            INNER JOIN versions
+                ON versions.id = incompatible_versions.version_id
+            WHERE versions.addon_id = %(id)s;"""
+        cursor.execute(sql, params)
+        incompatible = list(cursor.fetchall())
+
+        return UpdateCandidates(rows, incompatible, generation,
+                                time() + self.timeout)
+
+    def resolve(self, cursor, data, flags, compat_mode):
+        """
+        Returns the update row `Update.get_update_sql` would have found,
+        or None.
+        """
+        candidates = self.get(cursor, data['id'], data['app_id'])
+        vint = int(data['version_int'])
+        platform_ids = (platforms.PLATFORM_ALL.id,
+                        data.get('appOS') or platforms.PLATFORM_ALL.id)
+        statuses = STATUSES_PUBLIC.values()
+        d2c_max = applications.D2C_MAX_VERSIONS.get(data['app_id'])
+        d2c_max = version_int(d2c_max) if d2c_max else None
+        blocked = (candidates.blocked(data['app_id'], vint)
+                   if compat_mode == 'normal' else ())
+
+        best = None
+        for row in candidates.rows[:bisect_right(candidates.mins, vint)]:
+            if row['platform_id'] not in platform_ids:
+                continue
+
+            if flags['use_version']:
+                if not (row['file_status'] > data['status'] and
+                        row['version'] == data['version']):
+                    continue
+            elif flags['multiple_status']:
+                if row['file_status'] not in statuses:
+                    continue
+            elif row['file_status'] != data['status']:
+                continue
+
+            if compat_mode == 'ignore':
+                pass
+            elif compat_mode == 'normal':
+                if ((row['strict_compat'] or row['binary_components']) and
+                    not _gte(row['max_int'], vint)):
+                    continue
+                if d2c_max and not _gte(row['max_int'], d2c_max):
+                    continue
+                if row['version_id'] in blocked:
+                    continue
+            elif not _gte(row['max_int'], vint):
+                continue
+
+            if best is None or row['version_id'] > best['version_id']:
+                best = row
+
+        if best is not None:
+            return dict((k, best[k]) for k in ROW_FIELDS)
+
+
+update_cache = UpdateCache(
+    getattr(settings, 'SERVICES_UPDATE_CACHE_TIMEOUT', 0))
+
+
 class Update(object):
 
     def __init__(self, data, compat_mode='strict'):
@@ -181,6 +365,35 @@ class Update(object):
         self.get_beta()
         data = self.data
 
+        if update_cache.enabled:
+            try:
+                row = update_cache.resolve(self.cursor, data, self.flags,
+                                           self.compat_mode)
+            except Exception:
+                # The cache is an optimisation, the database is the truth.
+                log_exception(data)
+                row = self.get_update_sql()
+        else:
+            row = self.get_update_sql()
+
+        if row:
+            row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
+            if row['premium_type'] in base.ADDON_PREMIUMS:
+                qs = urlencode(dict((k, data.get(k, ''))
+                               for k in base.WATERMARK_KEYS))
+                row['url'] = (u'%s/downloads/watermarked/%s?%s' %
+                              (settings.SITE_URL, row['file_id'], qs))
+            else:
+                row['url'] = get_mirror(self.data['addon_status'],
+                                        self.data['id'], row)
+            data['row'] = row
+            return True
+
+        return False
+
+    def get_update_sql(self):
+        data = self.data
+
         sql = ["""
             SELECT
                 addons.guid as guid, addons.addontype_id as type,
@@ -262,27 +475,8 @@ class Update(object):
 
         self.cursor.execute(''.join(sql), data)
         result = self.cursor.fetchone()
-
         if result:
-            row = dict(zip([
-                'guid', 'type', 'disabled_by_user', 'appguid', 'min', 'max',
-                'file_id', 'file_status', 'hash', 'filename', 'version_id',
-                'datestatuschanged', 'strict_compat', 'releasenotes',
-                'version', 'premium_type'],
-                list(result)))
-            row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
-            if row['premium_type'] in base.ADDON_PREMIUMS:
-                qs = urlencode(dict((k, data.get(k, ''))
-                               for k in base.WATERMARK_KEYS))
-                row['url'] = (u'%s/downloads/watermarked/%s?%s' %
-                              (settings.SITE_URL, row['file_id'], qs))
-            else:
-                row['url'] = get_mirror(self.data['addon_status'],
-                                        self.data['id'], row)
-            data['row'] = row
-            return True
-
-        return False
+            return dict(zip(ROW_FIELDS, list(result)))
 
     def get_bad_rdf(self):
         return bad_rdf
@@ -1,5 +1,6 @@
 import calendar
 from datetime import datetime
+import hashlib
 import json
 from time import gmtime, time
 from urlparse import parse_qsl, urlparse
@@ -7,7 +8,7 @@ from wsgiref.handlers import format_date_time
 
 from django.core.management import setup_environ
 
-from utils import (log_configure, log_exception, log_info, mypool,
+from utils import (cache_ns, log_configure, log_exception, log_info, mypool,
                    ADDON_PREMIUM, CONTRIB_CHARGEBACK,
                    CONTRIB_PURCHASE, CONTRIB_REFUND)
 
@@ -26,6 +27,7 @@ from lib.cef_loggers import receipt_cef
 import receipts  # used for patching in the tests
 from receipts import certs
 from django_statsd.clients import statsd
+from django.core.cache import cache
 
 status_codes = {
     200: '200 OK',
@@ -56,6 +58,7 @@ class Verify:
         self.addon_id = None
         self.user_id = None
         self.premium = None
+        self.purchase_type = None
         # This is so the unit tests can override the connection.
         self.conn, self.cursor = None, None
 
@@ -68,7 +71,14 @@ class Verify:
         """
         This is the default that verify will use, this will
         do the entire stack of checks.
+
+        Verdicts are cached on the receipt so that apps re-verifying the
+        same receipt skip the decode and the database.
         """
+        cached = self.get_verdict()
+        if cached:
+            return getattr(self, cached)()
+
         receipt_domain = urlparse(settings.WEBAPPS_RECEIPT_URL).netloc
         try:
             self.decoded = self.decode()
@@ -76,20 +86,68 @@ class Verify:
             self.check_db()
             self.check_url(receipt_domain)
         except InvalidReceipt:
+            self.set_verdict('invalid')
             return self.invalid()
 
         if self.premium != ADDON_PREMIUM:
             log_info('Valid receipt, not premium')
-            return self.ok_or_expired()
+            return self.ok_or_expired(cache_verdict=True)
 
         try:
             self.check_purchase()
         except InvalidReceipt:
+            self.set_verdict('invalid')
             return self.invalid()
         except RefundedReceipt:
+            self.set_verdict('refund')
             return self.refund()
 
-        return self.ok_or_expired()
+        return self.ok_or_expired(cache_verdict=True)
+
+    def verdict_key(self):
+        return 'receipt-verify:%s' % hashlib.sha1(
+            '%s:%s' % (self.environ.get('PATH_INFO', ''),
+                       self.receipt)).hexdigest()
+
+    def verdict_namespace(self):
+        """
+        The namespace zamboni bumps when a purchase, refund or chargeback
+        is written for the user and app of this receipt.
+        """
+        return cache_ns('receipt-verify:%s:%s' % (self.addon_id,
+                                                  self.user_id))
+
+    def get_verdict(self):
+        """
+        Returns the cached verdict of this receipt: `ok`, `invalid` or
+        `refund`, None if it has to be checked again.
+        """
+        if not settings.RECEIPT_VERIFY_CACHE_TIMEOUT:
+            return
+        cached = cache.get(self.verdict_key())
+        if not cached:
+            statsd.incr('services.verify.cache.miss')
+            return
+
+        verdict, expire, self.addon_id, self.user_id, namespace = cached
+        if self.user_id and namespace != self.verdict_namespace():
+            statsd.incr('services.verify.cache.invalidated')
+            return
+        # Expired receipts get a new receipt, that needs the full check.
+        if expire and calendar.timegm(gmtime()) + 10 > expire:
+            return
+
+        statsd.incr('services.verify.cache.hit')
+        log_info('Receipt verdict from cache: %s' % verdict)
+        return verdict
+
+    def set_verdict(self, verdict, expire=None):
+        if not settings.RECEIPT_VERIFY_CACHE_TIMEOUT:
+            return
+        namespace = self.verdict_namespace() if self.user_id else None
+        cache.set(self.verdict_key(),
+                  (verdict, expire, self.addon_id, self.user_id, namespace),
+                  settings.RECEIPT_VERIFY_CACHE_TIMEOUT)
 
     def check_without_purchase(self):
         """
@@ -200,9 +258,15 @@ class Verify:
             log_info('Invalid store data')
             raise InvalidReceipt
 
-        sql = """SELECT id, user_id, premium_type FROM users_install
-                 WHERE addon_id = %(addon_id)s
-                 AND uuid = %(uuid)s LIMIT 1;"""
+        # The purchase comes along so check_purchase needs no other query.
+        sql = """SELECT users_install.id, users_install.user_id,
+                     users_install.premium_type, addon_purchase.type
+                 FROM users_install
+                 LEFT JOIN addon_purchase
+                     ON addon_purchase.addon_id = users_install.addon_id
+                     AND addon_purchase.user_id = users_install.user_id
+                 WHERE users_install.addon_id = %(addon_id)s
+                 AND users_install.uuid = %(uuid)s LIMIT 1;"""
         self.cursor.execute(sql, {'addon_id': self.addon_id,
                                   'uuid': uuid})
         result = self.cursor.fetchone()
@@ -211,27 +275,23 @@ class Verify:
             log_info('No entry in users_install for uuid: %s' % uuid)
             raise InvalidReceipt
 
-        pk, self.user_id, self.premium = result
+        pk, self.user_id, self.premium, self.purchase_type = result
 
     def check_purchase(self):
         """
         Verifies that the app has been purchased.
+
+        Requires that check_db is run first.
         """
-        sql = """SELECT id, type FROM addon_purchase
-                 WHERE addon_id = %(addon_id)s
-                 AND user_id = %(user_id)s LIMIT 1;"""
-        self.cursor.execute(sql, {'addon_id': self.addon_id,
-                                  'user_id': self.user_id})
-        result = self.cursor.fetchone()
-        if not result:
+        if self.purchase_type is None:
             log_info('Invalid receipt, no purchase')
             raise InvalidReceipt
 
-        if result[-1] in [CONTRIB_REFUND, CONTRIB_CHARGEBACK]:
+        if self.purchase_type in [CONTRIB_REFUND, CONTRIB_CHARGEBACK]:
             log_info('Valid receipt, but refunded')
             raise RefundedReceipt
 
-        elif result[-1] == CONTRIB_PURCHASE:
+        elif self.purchase_type == CONTRIB_PURCHASE:
             log_info('Valid receipt')
             return
 
@@ -242,7 +302,7 @@ class Verify:
     def invalid(self):
         return json.dumps({'status': 'invalid'})
 
-    def ok_or_expired(self):
+    def ok_or_expired(self, cache_verdict=False):
         # This receipt is ok now let's check it's expiry.
         # If it's expired, we'll have to return a new receipt
         try:
@@ -258,6 +318,8 @@ class Verify:
                         datetime.utcfromtimestamp(now)))
             return self.expired()
 
+        if cache_verdict:
+            self.set_verdict('ok', expire)
         return self.ok()
 
     def ok(self):
@@ -42,6 +42,7 @@ COLLECTIONS_ICON_PATH = _polite_tmpdir()
 PACKAGER_PATH = _polite_tmpdir()
 REVIEWER_ATTACHMENTS_PATH = _polite_tmpdir()
 DUMPED_APPS_PATH = _polite_tmpdir()
+MINI_MANIFESTS_PATH = _polite_tmpdir()
 
 # We won't actually send an email.
 SEND_REAL_EMAIL = True
@@ -49,6 +50,13 @@ SEND_REAL_EMAIL = True
 # Turn off search engine indexing.
 USE_ELASTIC = False
 
+# Resolve update pings with SQL unless a test turns the cache on.
+SERVICES_UPDATE_CACHE_TIMEOUT = 0
+# Same for the receipt verdicts.
+RECEIPT_VERIFY_CACHE_TIMEOUT = 0
+# And for search results.
+SEARCH_CACHE_TIMEOUT = 0
+
 # Ensure all validation code runs in tests:
 VALIDATE_ADDONS = True
 
@@ -129,3 +137,5 @@ SQL_RESET_SEQUENCES = False
 GEOIP_URL = ''
 GEOIP_DEFAULT_VAL = 'worldwide'
 GEOIP_DEFAULT_TIMEOUT = .2
+GEOIP_DB_PATH = ''
+MONOLITH_BUFFER_SIZE = 1